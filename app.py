@@ -4,19 +4,18 @@ LANT Web Application
 Modern web interface for the Learning Assistant
 """
 
-from flask import Flask, render_template, request, jsonify, send_file, send_from_directory
+from flask import Flask, Request, render_template, request, jsonify, send_file, send_from_directory
 from flask_cors import CORS
 import os
 import json
 import threading
-import tempfile
 import psutil
 import platform
 from datetime import datetime
 from werkzeug.utils import secure_filename
 
 # Import our existing backend
-from lant import SilentDirectoryAssistant, CommandHandler
+from lant import SilentDirectoryAssistant, CommandHandler, StagedFile, ARCHIVE_AFTER_DAYS
 
 # Initialize Flask app
 app = Flask(__name__, static_folder='build', static_url_path='/')
@@ -31,6 +30,18 @@ app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max file size
 # Global application state
 assistant = SilentDirectoryAssistant()
 command_handler = CommandHandler(assistant)
+# Pick up lectures and sessions changed by the CLI or sync tools while the server runs
+assistant.start_watcher()
+
+
+class StagingRequest(Request):
+    """Spools uploaded files straight into the blob store's staging area, hashing them as they arrive"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return assistant.blobs.staging_file()
+
+
+app.request_class = StagingRequest
 
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {
@@ -61,9 +72,20 @@ def serve_static(path):
 
 @app.route('/api/status')
 def get_status():
-    """Get application status"""
+    """Get application status, optionally for one ?lecture= and only the listed ?fields="""
     try:
-        status = assistant.get_status()
+        lecture_name = request.args.get('lecture')
+        fields = request.args.get('fields')
+        if fields:
+            fields = {field.strip() for field in fields.split(',') if field.strip()}
+
+        status = assistant.get_status(lecture_name=lecture_name, fields=fields or None)
+        if lecture_name and 'lectures' in status and lecture_name not in status['lectures']:
+            return jsonify({
+                'success': False,
+                'error': 'Lecture not found'
+            }), 404
+
         return jsonify({
             'success': True,
             'data': status
@@ -144,23 +166,14 @@ def get_lecture_info(lecture_name):
 def delete_lecture(lecture_name):
     """Delete a lecture"""
     try:
-        import shutil
-        import os
-
-        lecture_path = os.path.join(assistant.base_dir, 'lectures', lecture_name)
-        if not os.path.exists(lecture_path):
+        if not assistant.repository.lecture_exists(lecture_name):
             return jsonify({
                 'success': False,
                 'error': 'Lecture not found'
             }), 404
 
-        # Remove the lecture directory and all its contents
-        shutil.rmtree(lecture_path)
-
-        # Clear current selection if this was the active lecture
-        if assistant.current_lecture == lecture_name:
-            assistant.current_lecture = None
-            assistant.current_session = None
+        # Remove the lecture and all its contents (also clears the current selection)
+        assistant.delete_lecture(lecture_name)
 
         return jsonify({
             'success': True,
@@ -176,8 +189,6 @@ def delete_lecture(lecture_name):
 def delete_session(lecture_name, session_name):
     """Delete a session"""
     try:
-        import os
-
         # Load the lecture first
         if not assistant.load_lecture(lecture_name):
             return jsonify({
@@ -185,19 +196,14 @@ def delete_session(lecture_name, session_name):
                 'error': 'Lecture not found'
             }), 404
 
-        session_path = os.path.join(assistant.base_dir, 'lectures', lecture_name, 'sessions', f'{session_name}.json')
-        if not os.path.exists(session_path):
+        if not assistant.session_exists(session_name, lecture_name):
             return jsonify({
                 'success': False,
                 'error': 'Session not found'
             }), 404
 
-        # Remove the session file
-        os.remove(session_path)
-
-        # Clear current selection if this was the active session
-        if assistant.current_session == session_name:
-            assistant.current_session = None
+        # Remove the session (also clears the current selection)
+        assistant.delete_session(session_name, lecture_name)
 
         return jsonify({
             'success': True,
@@ -213,9 +219,6 @@ def delete_session(lecture_name, session_name):
 def rename_lecture(lecture_name):
     """Rename a lecture"""
     try:
-        import os
-        import shutil
-
         data = request.get_json()
         new_name = data.get('new_name', '').strip()
 
@@ -231,27 +234,20 @@ def rename_lecture(lecture_name):
                 'error': 'New name must be different from current name'
             }), 400
 
-        old_path = os.path.join(assistant.base_dir, 'lectures', lecture_name)
-        new_path = os.path.join(assistant.base_dir, 'lectures', new_name)
-
-        if not os.path.exists(old_path):
+        if not assistant.repository.lecture_exists(lecture_name):
             return jsonify({
                 'success': False,
                 'error': 'Lecture not found'
             }), 404
 
-        if os.path.exists(new_path):
+        if assistant.repository.lecture_exists(new_name):
             return jsonify({
                 'success': False,
                 'error': 'Lecture with this name already exists'
             }), 400
 
-        # Rename the lecture directory
-        shutil.move(old_path, new_path)
-
-        # Update current selection if this was the active lecture
-        if assistant.current_lecture == lecture_name:
-            assistant.current_lecture = new_name
+        # Rename the lecture (also updates the current selection)
+        assistant.rename_lecture(lecture_name, new_name)
 
         return jsonify({
             'success': True,
@@ -267,8 +263,6 @@ def rename_lecture(lecture_name):
 def rename_session(lecture_name, session_name):
     """Rename a session"""
     try:
-        import os
-
         data = request.get_json()
         new_name = data.get('new_name', '').strip()
 
@@ -291,27 +285,20 @@ def rename_session(lecture_name, session_name):
                 'error': 'Lecture not found'
             }), 404
 
-        old_path = os.path.join(assistant.base_dir, 'lectures', lecture_name, 'sessions', f'{session_name}.json')
-        new_path = os.path.join(assistant.base_dir, 'lectures', lecture_name, 'sessions', f'{new_name}.json')
-
-        if not os.path.exists(old_path):
+        if not assistant.session_exists(session_name, lecture_name):
             return jsonify({
                 'success': False,
                 'error': 'Session not found'
             }), 404
 
-        if os.path.exists(new_path):
+        if assistant.session_exists(new_name, lecture_name):
             return jsonify({
                 'success': False,
                 'error': 'Session with this name already exists'
             }), 400
 
-        # Rename the session file
-        os.rename(old_path, new_path)
-
-        # Update current selection if this was the active session
-        if assistant.current_session == session_name:
-            assistant.current_session = new_name
+        # Rename the session (also updates the current selection)
+        assistant.rename_session(session_name, new_name, lecture_name)
 
         return jsonify({
             'success': True,
@@ -388,12 +375,18 @@ def load_session(lecture_name, session_name):
                 'error': 'Session not found'
             }), 404
 
-        # Get session history
-        messages = assistant.get_session_history()
+        # Get session history, optionally only the newest page of it
+        page = assistant.get_message_page(
+            limit=request.args.get('limit', type=int),
+            before=request.args.get('before', type=int)
+        )
         session_data = {
             'name': session_name,
             'lecture': lecture_name,
-            'messages': messages,
+            'messages': page['messages'],
+            'total_messages': page['total'],
+            'next_cursor': page['next_cursor'],
+            'has_more': page['has_more'],
             'model': assistant.model,
             'model_params': assistant.model_params
         }
@@ -446,7 +439,7 @@ def send_message(lecture_name, session_name):
 
 @app.route('/api/sessions/<lecture_name>/<session_name>/messages', methods=['GET'])
 def get_messages(lecture_name, session_name):
-    """Get all messages for a session"""
+    """Get messages for a session, newest page first with ?limit=&before=<cursor>"""
     try:
         # Load the session
         if not assistant.load_lecture(lecture_name) or not assistant.load_session(session_name):
@@ -456,12 +449,18 @@ def get_messages(lecture_name, session_name):
             }), 404
 
         # Get conversation history
-        messages = assistant.get_conversation_history()
+        page = assistant.get_message_page(
+            limit=request.args.get('limit', type=int),
+            before=request.args.get('before', type=int)
+        )
 
         return jsonify({
             'success': True,
             'data': {
-                'messages': messages
+                'messages': page['messages'],
+                'total_messages': page['total'],
+                'next_cursor': page['next_cursor'],
+                'has_more': page['has_more']
             }
         })
     except Exception as e:
@@ -496,56 +495,137 @@ def clear_messages(lecture_name, session_name):
             'error': str(e)
         }), 500
 
-@app.route('/api/lectures/<lecture_name>/documents', methods=['POST'])
-def upload_document(lecture_name):
-    """Upload a document to a lecture"""
+@app.route('/api/sessions/<lecture_name>/<session_name>/fork', methods=['POST'])
+def fork_session(lecture_name, session_name):
+    """Branch a session into a new one that shares its first messages"""
     try:
-        # Load lecture first
-        if not assistant.load_lecture(lecture_name):
+        data = request.get_json(silent=True) or {}
+        new_name = (data.get('name') or '').strip()
+        at_index = data.get('at_index')
+
+        if not new_name:
             return jsonify({
                 'success': False,
-                'error': 'Lecture not found'
-            }), 404
+                'error': 'Fork name cannot be empty'
+            }), 400
 
-        if 'file' not in request.files:
+        if at_index is not None and (not isinstance(at_index, int) or at_index < 0):
             return jsonify({
                 'success': False,
-                'error': 'No file provided'
+                'error': 'at_index must be a non-negative integer'
             }), 400
 
-        file = request.files['file']
-        if file.filename == '':
+        # Load the session
+        if not assistant.load_lecture(lecture_name) or not assistant.load_session(session_name):
+            return jsonify({
+                'success': False,
+                'error': 'Session not found'
+            }), 404
+
+        if assistant.session_exists(new_name, lecture_name):
             return jsonify({
                 'success': False,
-                'error': 'No file selected'
+                'error': 'Session with this name already exists'
             }), 400
 
-        if not allowed_file(file.filename):
+        result = assistant.fork_session(new_name, at_index)
+
+        return jsonify({
+            'success': True,
+            'message': result,
+            'data': {
+                'session': new_name,
+                'parent': session_name,
+                'message_count': assistant.count_session_messages(lecture_name, new_name)
+            }
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/sessions/<lecture_name>/<session_name>/compact', methods=['POST'])
+def compact_session(lecture_name, session_name):
+    """Summarize a session's older messages into its compressed history"""
+    try:
+        data = request.get_json(silent=True) or {}
+        keep = data.get('keep')
+        if keep is not None and (not isinstance(keep, int) or keep < 0):
             return jsonify({
                 'success': False,
-                'error': 'File type not allowed'
+                'error': 'keep must be a non-negative integer'
             }), 400
 
-        # Save file temporarily
-        filename = secure_filename(file.filename)
-        temp_path = os.path.join(tempfile.gettempdir(), filename)
-        file.save(temp_path)
+        # Load the session
+        if not assistant.load_lecture(lecture_name) or not assistant.load_session(session_name):
+            return jsonify({
+                'success': False,
+                'error': 'Session not found'
+            }), 404
 
-        try:
-            # Add document to lecture or session
-            if assistant.current_session:
-                result = assistant.add_document_to_session(temp_path)
-            else:
-                result = assistant.add_document_to_lecture(temp_path)
+        result = assistant.compact_session(keep)
+        if result.startswith("Error generating summary"):
+            return jsonify({
+                'success': False,
+                'error': result
+            }), 500
 
+        return jsonify({
+            'success': True,
+            'data': {
+                'message': result,
+                'message_count': assistant.count_session_messages(lecture_name, session_name)
+            }
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/lectures/<lecture_name>/documents', methods=['POST'])
+def upload_document(lecture_name):
+    """Upload a document to a lecture"""
+    try:
+        # Load lecture first
+        if not assistant.load_lecture(lecture_name):
+            return jsonify({
+                'success': False,
+                'error': 'Lecture not found'
+            }), 404
+
+        try:
+            if 'file' not in request.files:
+                return jsonify({
+                    'success': False,
+                    'error': 'No file provided'
+                }), 400
+
+            file = request.files['file']
+            if file.filename == '':
+                return jsonify({
+                    'success': False,
+                    'error': 'No file selected'
+                }), 400
+
+            if not allowed_file(file.filename):
+                return jsonify({
+                    'success': False,
+                    'error': 'File type not allowed'
+                }), 400
+
+            # The upload was spooled into the blob store while the request was parsed; this only renames it into place
+            result = assistant.add_uploaded_document(file.stream, secure_filename(file.filename))
             return jsonify({
                 'success': True,
                 'message': result
             })
         finally:
-            # Clean up temporary file
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+            # Delete staged uploads that were rejected or not used
+            for staged in request.files.values():
+                if isinstance(staged.stream, StagedFile):
+                    staged.stream.discard()
 
     except Exception as e:
         return jsonify({
@@ -553,6 +633,84 @@ def upload_document(lecture_name):
             'error': str(e)
         }), 500
 
+@app.route('/api/lectures/<lecture_name>/documents/status', methods=['GET'])
+def get_document_status(lecture_name):
+    """Get the background extraction status of a lecture's documents (or a session's, with ?session=)"""
+    try:
+        if not assistant.repository.lecture_exists(lecture_name):
+            return jsonify({
+                'success': False,
+                'error': 'Lecture not found'
+            }), 404
+
+        session_name = request.args.get('session')
+        if session_name and not assistant.repository.session_exists(lecture_name, session_name):
+            return jsonify({
+                'success': False,
+                'error': 'Session not found'
+            }), 404
+
+        return jsonify({
+            'success': True,
+            'data': assistant.document_status(lecture_name, session_name)
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/lectures/<lecture_name>/documents/<doc_name>/units', methods=['GET'])
+def get_document_units(lecture_name, doc_name):
+    """Get the text of a range of pages or slides of a document (?start=&end=, from 1, inclusive; ?session= for session documents)"""
+    try:
+        if not assistant.repository.lecture_exists(lecture_name):
+            return jsonify({
+                'success': False,
+                'error': 'Lecture not found'
+            }), 404
+
+        session_name = request.args.get('session')
+        if session_name and not assistant.repository.session_exists(lecture_name, session_name):
+            return jsonify({
+                'success': False,
+                'error': 'Session not found'
+            }), 404
+
+        start = request.args.get('start', 1, type=int)
+        end = request.args.get('end', None, type=int)
+        if start < 1 or (end is not None and end < start):
+            return jsonify({
+                'success': False,
+                'error': 'start must be at least 1 and end must not be before start'
+            }), 400
+
+        try:
+            chunks = assistant.get_document_units(lecture_name, doc_name, start, end, session_name)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        if chunks is None:
+            return jsonify({
+                'success': False,
+                'error': 'Document not found'
+            }), 404
+
+        return jsonify({
+            'success': True,
+            'data': {
+                'document': doc_name,
+                'units': [{'unit': chunk.unit, 'index': chunk.index, 'text': chunk.text} for chunk in chunks]
+            }
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @app.route('/api/lectures/<lecture_name>/sessions/merge', methods=['POST'])
 def merge_sessions(lecture_name):
     """Merge selected sessions in a lecture"""
@@ -574,24 +732,15 @@ def merge_sessions(lecture_name):
                 'error': 'Lecture not found'
             }), 404
 
-        # Create new merged session
-        assistant.create_session(new_session_name)
-
         # Merge content from selected sessions
         merged_content = []
         for session_name in sessions_to_merge:
-            if assistant.load_session(session_name):
-                # Get session messages
-                session_file = os.path.join(assistant.sessions_dir, f"{session_name}.json")
-                if os.path.exists(session_file):
-                    with open(session_file, 'r', encoding='utf-8') as f:
-                        session_data = json.load(f)
-                        messages = session_data.get('messages', [])
-                        merged_content.extend(messages)
+            if assistant.session_exists(session_name):
+                merged_content.extend(assistant.read_session_messages(lecture_name, session_name))
 
-        # Save merged content to new session
-        assistant.current_session['messages'] = merged_content
-        assistant.save_session()
+        # Create new merged session and save merged content to it
+        assistant.create_session(new_session_name)
+        assistant.append_session_messages(lecture_name, new_session_name, merged_content)
 
         return jsonify({
             'success': True,
@@ -873,13 +1022,13 @@ def get_documents_info():
                         total_size += size
 
         # Cache info
-        cache_info = {}
-        if hasattr(assistant, 'cache_dir') and os.path.exists(assistant.cache_dir):
-            cache_files = [f for f in os.listdir(assistant.cache_dir) if f.endswith('.cache')]
-            cache_info = {
-                'file_count': len(cache_files),
-                'total_size': sum(os.path.getsize(os.path.join(assistant.cache_dir, f)) for f in cache_files if os.path.exists(os.path.join(assistant.cache_dir, f)))
-            }
+        cache_stats = assistant.extraction_cache.stats()
+        cache_info = {
+            'file_count': cache_stats['entries'],
+            'total_size': cache_stats['bytes'],
+            'hits': cache_stats['hits'],
+            'misses': cache_stats['misses']
+        }
 
         return jsonify({
             'success': True,
@@ -912,6 +1061,52 @@ def clear_cache():
             'error': str(e)
         }), 500
 
+@app.route('/api/archive', methods=['POST'])
+def archive_inactive():
+    """Compress sessions and cached extractions that have not been touched for N days"""
+    try:
+        data = request.get_json(silent=True) or {}
+        days = data.get('days', ARCHIVE_AFTER_DAYS)
+        if not isinstance(days, (int, float)) or days < 0:
+            return jsonify({
+                'success': False,
+                'error': 'days must be a non-negative number'
+            }), 400
+
+        result = assistant.archive_inactive(days)
+        return jsonify({
+            'success': True,
+            'data': result
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/gc', methods=['POST'])
+def collect_garbage():
+    """Remove (or with dry_run, only report) storage nothing refers to any more"""
+    try:
+        data = request.get_json(silent=True) or {}
+        dry_run = data.get('dry_run', False)
+        if not isinstance(dry_run, bool):
+            return jsonify({
+                'success': False,
+                'error': 'dry_run must be a boolean'
+            }), 400
+
+        result = assistant.collect_garbage(dry_run)
+        return jsonify({
+            'success': True,
+            'data': result
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @app.route('/api/commands', methods=['POST'])
 def execute_command():
     """Execute a command from the lant.py system"""
@@ -937,10 +1132,9 @@ def execute_command():
                 'data': 'Command executed successfully'
             })
 
-        # If result is None (for commands that print directly), get status
+        # If result is None (for commands that print directly), report the current selection
         if result is None:
-            status = assistant.get_status()
-            result = f"Command executed. Current status: {status.get('current_lecture', 'None')} - {status.get('current_session', 'None')}"
+            result = f"Command executed. Current status: {assistant.current_lecture} - {assistant.current_session}"
 
         return jsonify({
             'success': True,
@@ -3,6 +3,10 @@ import os
 import json
 import glob
 import shutil
+import tempfile
+import atexit
+import copy
+import gzip
 import ollama
 from datetime import datetime
 import PyPDF2
@@ -10,20 +14,2923 @@ from pptx import Presentation
 from docx import Document
 import pytesseract
 from PIL import Image
-import markdown
 import re
 import hashlib
 import time
+import queue
 import psutil
+import sqlite3
+import struct
+import threading
+import ctypes
+import ctypes.util
+import select
+import io
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict, namedtuple
+from contextlib import ExitStack, contextmanager, nullcontext
+
+try:
+    import fcntl
+except ImportError:  # Windows: advisory file locks are skipped
+    fcntl = None
 
 # Configuration constants for scalability
 MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB max file size
 MEMORY_WARNING_THRESHOLD = 80  # Warn when memory usage > 80%
 MAX_CONTEXT_LENGTH = 12000  # Max characters for AI context
 CHUNK_SIZE = 10  # Pages/slides to process at once
+UNIT_TYPES = {'.pdf': "page", '.ppt': "slide", '.pptx': "slide"}  # Extracted and cached page by page or slide by slide, never as a whole
+TEXT_SECTION_CHARS = 4000  # Plain text files are streamed in sections of about this many characters
+PDF_WORKERS = os.cpu_count() or 1  # Worker processes extracting the page ranges of a large PDF
+PDF_PARALLEL_MIN_PAGES = 30  # Smaller PDFs are extracted serially; starting workers would cost more than it saves
+OCR_WORKERS = min(4, os.cpu_count() or 1)  # Worker processes shared by all OCR of images embedded in documents
+EXTRACTOR_VERSION = 2  # Part of every extraction cache key; bump it when extracted text changes so stale entries stop matching
+HASH_MEMO_SIZE = 1024  # (path, mtime, size) -> content hash entries kept so unchanged documents are not rehashed
+CACHE_MAX_BYTES = 512 * 1024 * 1024  # Extracted text kept in cache/ before the least recently used entries are evicted
+INGEST_WORKERS = 2  # Background threads extracting documents as they are added
+SESSION_FORMAT = "json"  # "json" rewrites the session file per message, "log" appends to a JSONL message log, "compact" writes minified JSON
+SESSION_FORMATS = ("json", "log", "compact")
+SESSION_SCHEMA_VERSION = 1  # Stored in compact session files
+ARCHIVE_AFTER_DAYS = 30  # Sessions and cached extractions untouched this long are gzip-compressed by "archive"
+STORAGE_BACKEND = "file"  # "file" keeps the JSON tree under lectures/, "sqlite" uses learning_assistant/lant.db
+SESSION_CACHE_SIZE = 32  # Parsed sessions kept in memory by the file backend
+WATCH_POLL_INTERVAL = 2  # Seconds between scans of lectures/ when inotify isn't available
+HEADER_CACHE_SIZE = 256  # Session headers (metadata without messages) kept in memory by LectureRepository
+SESSION_DURABILITY = "flush"  # "flush" writes after each operation, "fsync" also syncs to disk, "deferred" writes back on a timer/shutdown (single process only)
+SESSION_FLUSH_INTERVAL = 5  # Seconds before deferred session changes are written
+STORAGE_LAYOUT = "flat"  # "sharded" spreads lecture and session files over hashed subdirectories; applies to new trees, see "migrate-layout"
+STORAGE_LAYOUTS = ("flat", "sharded")
+MANIFEST_UPDATES_MAX_BYTES = 256 * 1024  # Message counters appended to a lecture's manifest.updates.jsonl before they are folded into manifest.json
+GC_GRACE_SECONDS = 3600  # Blobs and temp files younger than this are left alone by "gc" (they may belong to a write in progress)
+
+def file_sha256(file_path):
+    """Get the SHA-256 of a file, reading it in blocks"""
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def image_file_text(image_path):
+    """OCR an image file or file-like object; returns its text or an "Error ..." message"""
+    try:
+        # Grayscale images OCR more reliably
+        img = Image.open(image_path).convert('L')
+        return pytesseract.image_to_string(img)
+    except Exception as e:
+        return f"Error extracting text from image: {str(e)}"
+
+
+def image_bytes_text(data):
+    """OCR an encoded image held in memory (module-level so that it can run in a worker process)"""
+    return image_file_text(io.BytesIO(data))
+
+
+def extract_pdf_pages(pdf_path, start, end):
+    """Extract pages start..end-1 of a PDF; returns (page texts with their markers, [((page, image name), image bytes)]).
+
+    Blank pages give empty texts. Module-level so that it can run in a worker process.
+    """
+    with open(pdf_path, 'rb') as file:
+        return pdf_reader_pages(PyPDF2.PdfReader(file), start, end)
+
+
+def pdf_reader_pages(reader, start, end):
+    """Extract pages start..end-1 from an open PdfReader, as extract_pdf_pages does"""
+    pages = []
+    images = []
+    for i in range(start, end):
+        page = reader.pages[i]
+        page_text = page.extract_text()
+        if page_text.strip():  # Only add if there's actual text
+            pages.append(f"\n--- Page {i+1} ---\n{page_text}\n")
+        else:
+            pages.append("")
+
+        # Try to extract images from the page and run OCR
+        try:
+            if '/Resources' not in page or '/XObject' not in page['/Resources']:
+                continue
+            xObject = page['/Resources']['/XObject'].get_object()
+            for obj in xObject:
+                if xObject[obj]['/Subtype'] == '/Image':
+                    images.append(((i + 1, obj[1:]), xObject[obj]._data))
+        except Exception:
+            # Continue if PDF image extraction fails
+            continue
+    return pages, images
+
+
+class SessionNotFoundError(FileNotFoundError):
+    """Raised by storage backends when a lecture or session does not exist"""
+
+
+class StorageBackend:
+    """Base class for lecture/session storage.
+
+    Backends store lecture info, session metadata, messages, summaries and
+    document lists. Document files themselves are not stored by the backend:
+    they live once each in the content-addressed blobs/ store (see BlobStore),
+    and a lecture or session refers to them by name through its
+    "document_refs" map of document name to blob id. Documents added before
+    the blob store may still be plain copies under lectures/<lecture>/docs and
+    lectures/<lecture>/session_docs/<session>.
+    """
+
+    name = None
+
+    def __init__(self, base_dir):
+        self.base_dir = base_dir
+        self.lectures_dir = os.path.join(base_dir, "lectures")
+
+    def lecture_dir(self, lecture_name):
+        """Get the on-disk directory of a lecture"""
+        return os.path.join(self.lectures_dir, lecture_name)
+
+    def docs_dir(self, lecture_name):
+        """Get the directory holding lecture-level documents"""
+        return os.path.join(self.lecture_dir(lecture_name), "docs")
+
+    def session_docs_dir(self, lecture_name, session_name):
+        """Get the directory holding documents of a single session"""
+        return os.path.join(self.lecture_dir(lecture_name), "session_docs", session_name)
+
+    @contextmanager
+    def batch(self):
+        """Group several changes into one write where the backend supports it"""
+        yield
+
+    def flush(self):
+        """Write any changes the backend is still holding in memory"""
+
+    def invalidate(self, lecture_name=None, session_name=None):
+        """Drop cached sessions another process has changed (of one lecture or session, or all of them)"""
+
+    def lecture_lock(self, lecture_name):
+        """Lock a lecture's info against other processes for a read-modify-write"""
+        return nullcontext()
+
+    def session_lock(self, lecture_name, session_name):
+        """Lock a session against other processes for a read-modify-write"""
+        return nullcontext()
+
+    def append_message(self, lecture_name, session_name, message):
+        """Append a single message to a session"""
+        self.append_messages(lecture_name, session_name, [message])
+
+    def create_session(self, lecture_name, session_name, session_data):
+        """Create a new session"""
+        self.write_session(lecture_name, session_name, session_data)
+
+    def list_lectures(self):
+        raise NotImplementedError
+
+    def lecture_exists(self, lecture_name):
+        raise NotImplementedError
+
+    def create_lecture(self, lecture_name, lecture_info):
+        raise NotImplementedError
+
+    def read_lecture(self, lecture_name):
+        """Get lecture info, or None if the lecture does not exist"""
+        raise NotImplementedError
+
+    def write_lecture(self, lecture_name, lecture_info):
+        raise NotImplementedError
+
+    def delete_lecture(self, lecture_name):
+        raise NotImplementedError
+
+    def rename_lecture(self, lecture_name, new_name):
+        raise NotImplementedError
+
+    def list_sessions(self, lecture_name):
+        raise NotImplementedError
+
+    def session_exists(self, lecture_name, session_name):
+        raise NotImplementedError
+
+    def session_location(self, lecture_name, session_name):
+        """Describe where a session is stored (shown in status output)"""
+        raise NotImplementedError
+
+    def read_session(self, lecture_name, session_name, include_messages=True):
+        """Get session data, raising SessionNotFoundError if it does not exist"""
+        raise NotImplementedError
+
+    def peek_session(self, lecture_name, session_name):
+        """Get a session's data without its messages, leaving storage exactly as it is"""
+        return self.read_session(lecture_name, session_name, include_messages=False)
+
+    def write_session(self, lecture_name, session_name, session_data):
+        """Create or update a session.
+
+        Messages are replaced only when session_data has a "messages" key,
+        otherwise the stored messages are kept.
+        """
+        raise NotImplementedError
+
+    def append_messages(self, lecture_name, session_name, messages):
+        raise NotImplementedError
+
+    def read_messages(self, lecture_name, session_name, limit=None, offset=0):
+        raise NotImplementedError
+
+    def count_messages(self, lecture_name, session_name):
+        raise NotImplementedError
+
+    def get_session_stats(self, lecture_name, session_name):
+        """Get session metadata plus message_count and total_chars"""
+        raise NotImplementedError
+
+    def lecture_signature(self, lecture_name):
+        """Get a token that changes whenever a lecture or any of its sessions changes, or None if unknown"""
+        return None
+
+    def lecture_info_signature(self, lecture_name):
+        """Get a token that changes whenever a lecture's info changes, or None if unknown"""
+        return None
+
+    def session_header_signature(self, lecture_name, session_name):
+        """Get a token that changes whenever a session's metadata changes, or None if unknown"""
+        return None
+
+    def archive_inactive_sessions(self, cutoff):
+        """Compress sessions last written before the cutoff timestamp; returns (sessions, bytes saved)"""
+        return 0, 0
+
+    def list_session_stats(self, lecture_name):
+        """Get manifest entries (see session_manifest_entry) for every session of a lecture"""
+        stats = {}
+        for session_name in self.list_sessions(lecture_name):
+            try:
+                session_data = self.get_session_stats(lecture_name, session_name)
+                stats[session_name] = session_manifest_entry(
+                    session_name, session_data, session_data["message_count"], session_data["total_chars"]
+                )
+            except Exception as e:
+                stats[session_name] = {"name": session_name, "error": str(e)}
+        return stats
+
+    def compact_session(self, lecture_name, session_name, count, summary):
+        """Move the oldest `count` active messages into the session's history and record their summary.
+
+        Messages before history_count stay readable through read_messages() but
+        are no longer part of the active conversation; history_summary stands in
+        for them. This default keeps them where they are; the file backend moves
+        them into compressed segments.
+        """
+        session_data = self.read_session(lecture_name, session_name, include_messages=False)
+        session_data["history_count"] = session_data.get("history_count", 0) + count
+        session_data["history_summary"] = summary["summary"]
+        session_data.setdefault("summaries", []).append(summary)
+        self.write_session(lecture_name, session_name, session_data)
+
+    def delete_session(self, lecture_name, session_name):
+        raise NotImplementedError
+
+    def rename_session(self, lecture_name, session_name, new_name):
+        raise NotImplementedError
+
+
+def message_chars(messages):
+    """Count the content characters of a list of messages (dicts or Message objects)"""
+    return sum(len(message.content if isinstance(message, Message) else message.get('content', ''))
+               for message in messages)
+
+
+def intern_param_set(session_data, model, model_params):
+    """Get the id of a (model, model_params) pair in a session's param_sets table, adding it if it is new"""
+    param_sets = session_data.setdefault("param_sets", [])
+    param_set = {"model": model, "model_params": dict(model_params or {})}
+    if param_set in param_sets:
+        return param_sets.index(param_set)
+    param_sets.append(param_set)
+    return len(param_sets) - 1
+
+
+def intern_messages(session_data, messages):
+    """Get messages with their model and model_params replaced by a param_set id from session_data's table"""
+    interned = []
+    for message in messages:
+        if "model" in message or "model_params" in message:
+            message = dict(message)
+            message["param_set"] = intern_param_set(session_data, message.pop("model", None),
+                                                    message.pop("model_params", None))
+        interned.append(message)
+    return interned
+
+
+def expand_messages(session_data, messages):
+    """Get messages with their param_set id replaced by the model and model_params it stands for"""
+    param_sets = session_data.get("param_sets", [])
+    expanded = []
+    for message in messages:
+        param_set = message.get("param_set")
+        if param_set is not None and param_set < len(param_sets):
+            message = {k: v for k, v in message.items() if k != "param_set"}
+            message["model"] = param_sets[param_set]["model"]
+            message["model_params"] = dict(param_sets[param_set]["model_params"])
+        expanded.append(message)
+    return expanded
+
+
+def session_manifest_entry(session_name, session_data, message_count, total_chars, updated_at=None):
+    """Build the per-session stats kept in a lecture manifest"""
+    return {
+        "name": session_name,
+        "created_at": session_data.get("created_at"),
+        "updated_at": updated_at or session_data.get("created_at"),
+        "model": session_data.get("model"),
+        "message_count": message_count,
+        "total_chars": total_chars,
+        "estimated_tokens": total_chars // 4,
+        "documents": session_data.get("documents", []),
+        "summary_count": len(session_data.get("summaries", [])),
+        "lectures_referenced": session_data.get("lectures_referenced", []),
+        "parent": session_data.get("parent")
+    }
+
+
+def temp_path_for(path):
+    """Get a temp file name next to path that no other process or thread writes to"""
+    return f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+
+
+@contextmanager
+def file_lock(lock_path):
+    """Hold an exclusive advisory lock on lock_path, waiting for other processes to release it"""
+    if fcntl is None:
+        yield
+        return
+
+    while True:
+        f = open(lock_path, 'a')
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        # A lock file is only deleted by its holder; whoever was waiting on the deleted inode tries again
+        try:
+            if os.stat(lock_path).st_ino == os.fstat(f.fileno()).st_ino:
+                break
+        except FileNotFoundError:
+            pass
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        f.close()
+
+    try:
+        yield
+    finally:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        f.close()
+
+
+def path_size(path):
+    """Get the size of a file, or of everything below a directory"""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def write_json_atomic(path, data, indent=2, fsync=False, compact=False):
+    """Write JSON to a temp file and rename it over the target so readers never see a partial file"""
+    temp_path = temp_path_for(path)
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        if compact:
+            json.dump(data, f, separators=(',', ':'), ensure_ascii=False)
+        else:
+            json.dump(data, f, indent=indent)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+class Message:
+    """A stored message as held in memory by the session cache.
+
+    Slots keep cached sessions small; keys other than the usual ones are kept
+    in extra. to_dict() gives back the stored form.
+    """
+
+    __slots__ = ("role", "content", "timestamp", "param_set", "extra")
+    FIELDS = ("role", "content", "timestamp", "param_set")
+
+    def __init__(self, role, content, timestamp=None, param_set=None, extra=None):
+        self.role = role
+        self.content = content
+        self.timestamp = timestamp
+        self.param_set = param_set
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, message):
+        if isinstance(message, cls):
+            return message
+        extra = {k: v for k, v in message.items() if k not in cls.FIELDS}
+        return cls(message.get("role"), message.get("content", ""), message.get("timestamp"),
+                   message.get("param_set"), extra or None)
+
+    def to_dict(self):
+        message = {"role": self.role, "content": self.content}
+        if self.timestamp is not None:
+            message["timestamp"] = self.timestamp
+        if self.extra:
+            message.update(copy.deepcopy(self.extra))
+        if self.param_set is not None:
+            message["param_set"] = self.param_set
+        return message
+
+
+class CachedSession:
+    """A parsed session held in the session cache, plus what still has to be written"""
+
+    __slots__ = ("data", "total_chars", "header_dirty", "messages_dirty", "pending_messages", "signature")
+
+    def __init__(self, data, signature=None):
+        data["messages"] = [Message.from_dict(message) for message in data["messages"]]
+        self.data = data
+        self.total_chars = message_chars(data["messages"])
+        self.header_dirty = False
+        self.messages_dirty = False  # Message list replaced - rewrite all messages
+        self.pending_messages = []  # Messages still to be appended to a message log
+        self.signature = signature  # Stat of the files the data was read from or last written to
+
+    @property
+    def dirty(self):
+        return self.header_dirty or self.messages_dirty or bool(self.pending_messages)
+
+    @property
+    def message_count(self):
+        """Number of messages, including those compacted into history segments"""
+        return len(self.data["messages"]) + self.data.get("history_count", 0)
+
+    @property
+    def char_count(self):
+        """Content characters, including those compacted into history segments"""
+        return self.total_chars + sum(segment["chars"] for segment in self.data.get("history_segments", []))
+
+
+class FileStorageBackend(StorageBackend):
+    """Stores lectures and sessions as a tree of JSON files under lectures/.
+
+    With the sharded layout (recorded in lectures/.layout) lectures live in
+    lectures/<shard>/<lecture> and sessions in sessions/<shard>/, where the
+    shard is the first two hex digits of the name's md5, so no directory
+    grows with the total number of lectures or sessions.
+
+    Parsed sessions are kept in an LRU cache. Changes are written at the end
+    of each operation (or of a batch()), or with durability="deferred" by a
+    background timer, on eviction and at shutdown. Each lecture's
+    manifest.json holds per-session stats, so listings and status never parse
+    the sessions themselves. It is rewritten when a session's metadata
+    changes; messages appended to a log session only append their new
+    counters to manifest.updates.jsonl, which readers fold in.
+
+    Several processes can share the tree: every session operation holds an
+    fcntl lock on <session>.lock (kept until the end of a batch()), manifest
+    and lecture info updates hold <lecture>/.lock, and a cached session is
+    re-read when its files' stat no longer matches what was last seen.
+    """
+
+    name = "file"
+
+    # Message index: the log size it covers, then the end offset of each message
+    INDEX_ENTRY = struct.Struct(">Q")
+
+    def __init__(self, base_dir, session_format=SESSION_FORMAT, cache_size=SESSION_CACHE_SIZE,
+                 durability=SESSION_DURABILITY, flush_interval=SESSION_FLUSH_INTERVAL, layout=STORAGE_LAYOUT):
+        super().__init__(base_dir)
+        self.layout = self._read_layout(layout)
+        self.session_format = session_format  # Storage format for new sessions
+        self.cache_size = max(1, cache_size)
+        self.durability = durability
+        self.flush_interval = flush_interval
+        self.session_cache = OrderedDict()  # (lecture, session) -> CachedSession
+        self.manifests = {}  # lecture -> (manifest and updates signature, manifest)
+        self.lecture_versions = {}  # lecture -> count of writes made by this process
+        self._lock = threading.RLock()
+        self._held_locks = {}  # lock path -> [ExitStack releasing it, depth]
+        self._batch = threading.local()
+        self._flush_timer = None
+        atexit.register(self.flush)
+
+    def layout_path(self):
+        return os.path.join(self.lectures_dir, ".layout")
+
+    def _read_layout(self, default):
+        """Get the layout recorded for the lecture tree; a new tree is marked with the default"""
+        try:
+            with open(self.layout_path(), 'r') as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            pass
+
+        # Trees from before layouts were recorded are flat
+        if any(entry.is_dir() for entry in self._scandir(self.lectures_dir)):
+            return "flat"
+        self._write_layout(default)
+        return default
+
+    def _write_layout(self, layout):
+        os.makedirs(self.lectures_dir, exist_ok=True)
+        with open(self.layout_path(), 'w') as f:
+            f.write(layout + "\n")
+
+    @staticmethod
+    def shard(name):
+        """Get the shard subdirectory a lecture or session is stored under in the sharded layout"""
+        return hashlib.md5(name.encode('utf-8')).hexdigest()[:2]
+
+    @staticmethod
+    def _scandir(path):
+        """List a directory's entries (empty if it does not exist); is_dir() reuses the dirent type"""
+        try:
+            with os.scandir(path) as entries:
+                return [entry for entry in entries if not entry.name.startswith('.')]
+        except FileNotFoundError:
+            return []
+
+    def lecture_dir(self, lecture_name, layout=None):
+        if (layout or self.layout) == "sharded":
+            return os.path.join(self.lectures_dir, self.shard(lecture_name), lecture_name)
+        return os.path.join(self.lectures_dir, lecture_name)
+
+    def sessions_dir(self, lecture_name):
+        return os.path.join(self.lecture_dir(lecture_name), "sessions")
+
+    def lecture_info_path(self, lecture_name):
+        return os.path.join(self.lecture_dir(lecture_name), "lecture_info.json")
+
+    def session_path(self, lecture_name, session_name, layout=None):
+        if (layout or self.layout) == "sharded":
+            return os.path.join(self.sessions_dir(lecture_name), self.shard(session_name), f"{session_name}.json")
+        return os.path.join(self.sessions_dir(lecture_name), f"{session_name}.json")
+
+    def _scan_session_files(self, sessions_path, layout=None):
+        """Find the session files in a sessions directory, yielding (session name, path, archived)"""
+        directories = [sessions_path]
+        if (layout or self.layout) == "sharded":
+            directories = [entry.path for entry in self._scandir(sessions_path) if entry.is_dir()]
+
+        for directory in directories:
+            for entry in self._scandir(directory):
+                if entry.name.endswith('.json.gz'):
+                    yield entry.name[:-len('.json.gz')], entry.path, True
+                elif entry.name.endswith('.json'):
+                    yield entry.name[:-len('.json')], entry.path, False
+
+    def manifest_path(self, lecture_name):
+        return os.path.join(self.lecture_dir(lecture_name), "manifest.json")
+
+    def manifest_updates_path(self, lecture_name):
+        """Get the path of the log of session counters not yet folded into a lecture's manifest"""
+        return os.path.join(self.lecture_dir(lecture_name), "manifest.updates.jsonl")
+
+    def message_log_path(self, session_path):
+        """Get the path of the append-only message log that belongs to a session file"""
+        return os.path.splitext(session_path)[0] + ".messages.jsonl"
+
+    def message_index_path(self, session_path):
+        """Get the path of the byte-offset index of a session's message log"""
+        return os.path.splitext(session_path)[0] + ".messages.idx"
+
+    def history_segment_path(self, session_path, number):
+        """Get the path of a session's numbered, gzip-compressed history segment"""
+        return os.path.splitext(session_path)[0] + f".history-{number}.jsonl.gz"
+
+    def history_segment_paths(self, session_path):
+        """Get the history segments of a session that exist on disk, oldest first"""
+        paths = []
+        while os.path.exists(self.history_segment_path(session_path, len(paths) + 1)):
+            paths.append(self.history_segment_path(session_path, len(paths) + 1))
+        return paths
+
+    def session_archive_path(self, session_path):
+        """Get the path of the gzip archive an inactive session is compressed into"""
+        return f"{session_path}.gz"
+
+    def session_files(self, session_path):
+        """Get every file that belongs to a session (the archive last)"""
+        return [session_path, self.message_log_path(session_path), self.message_index_path(session_path),
+                self.session_archive_path(session_path)]
+
+    def session_lock_path(self, session_path):
+        """Get the path of the lock file that guards a session's files"""
+        return os.path.splitext(session_path)[0] + ".lock"
+
+    def remove_lock_file(self, lock_path):
+        """Delete a lock file the caller holds, so it does not outlive what it guards"""
+        try:
+            os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+
+    def session_signature(self, session_path):
+        """Stat a session file and its message log; any write by any process changes the result"""
+        signature = []
+        for path in (session_path, self.message_log_path(session_path)):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    @contextmanager
+    def _hold(self, lock_path):
+        """Hold a file lock; re-entrant, since flock conflicts between two descriptors of one process"""
+        with self._lock:
+            held = self._held_locks.get(lock_path)
+            if held is None:
+                stack = ExitStack()
+                stack.enter_context(file_lock(lock_path))
+                held = self._held_locks[lock_path] = [stack, 0]
+            held[1] += 1
+            try:
+                yield
+            finally:
+                held[1] -= 1
+                if held[1] == 0:
+                    del self._held_locks[lock_path]
+                    held[0].close()
+
+    def lecture_lock(self, lecture_name):
+        lecture_path = self.lecture_dir(lecture_name)
+        if not os.path.isdir(lecture_path):
+            return nullcontext()
+        return self._hold(os.path.join(lecture_path, ".lock"))
+
+    def session_lock(self, lecture_name, session_name):
+        session_path = self.session_path(lecture_name, session_name)
+        if not os.path.isdir(os.path.dirname(session_path)):
+            return nullcontext()
+
+        lock = self._hold(self.session_lock_path(session_path))
+        if getattr(self._batch, "depth", 0):
+            # Changes made in a batch are written at its end, so other processes wait until then
+            self._batch.locks.enter_context(lock)
+            return nullcontext()
+        return lock
+
+    @contextmanager
+    def batch(self):
+        """Group several changes so each touched session is written once at the end"""
+        self._batch.depth = getattr(self._batch, "depth", 0) + 1
+        if self._batch.depth == 1:
+            self._batch.locks = ExitStack()
+        try:
+            yield
+        finally:
+            self._batch.depth -= 1
+            if self._batch.depth == 0:
+                try:
+                    if self.durability != "deferred":
+                        self.flush()
+                finally:
+                    self._batch.locks.close()
+
+    def flush(self):
+        """Write all dirty sessions to disk"""
+        with self._lock:
+            for key, entry in list(self.session_cache.items()):
+                if entry.dirty:
+                    self._flush_entry(key, entry)
+
+    def _read_session_file(self, lecture_name, session_name):
+        """Parse a session file (for log sessions this is only the header), restoring an archived session first"""
+        session_path = self.session_path(lecture_name, session_name)
+        try:
+            with open(session_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            if not os.path.exists(self.session_archive_path(session_path)):
+                raise SessionNotFoundError(f"Session not found: {session_name}")
+
+        self.restore_session(lecture_name, session_name)
+        with open(session_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _load_session_data(self, session_path):
+        """Read a session with all of its messages straight from disk, without caching it"""
+        with open(session_path, 'r', encoding='utf-8') as f:
+            session_data = json.load(f)
+        if session_data.get("storage") == "log":
+            session_data["messages"] = self.read_message_log(session_path)
+        session_data.setdefault("messages", [])
+        return session_data
+
+    def archive_session(self, lecture_name, session_name):
+        """Compress a session into a single gzip file; returns the number of bytes saved"""
+        with self._lock, self.session_lock(lecture_name, session_name):
+            key = (lecture_name, session_name)
+            entry = self.session_cache.get(key)
+            if entry is not None and entry.dirty:
+                self._flush_entry(key, entry)
+            self._drop_cached(lecture_name, session_name)
+
+            session_path = self.session_path(lecture_name, session_name)
+            session_files = [path for path in self.session_files(session_path)[:-1] if os.path.exists(path)]
+            original_size = sum(os.path.getsize(path) for path in session_files)
+
+            session_data = self._load_session_data(session_path)
+            archive_path = self.session_archive_path(session_path)
+            temp_path = temp_path_for(archive_path)
+            with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+                json.dump(session_data, f, separators=(',', ':'), ensure_ascii=False)
+            os.replace(temp_path, archive_path)
+            for path in session_files:
+                os.remove(path)
+
+            with self.lecture_lock(lecture_name):
+                manifest = self.read_manifest(lecture_name)
+                if session_name in manifest["sessions"]:
+                    manifest["sessions"][session_name]["archived"] = True
+                    self.write_manifest(lecture_name, manifest)
+
+            return original_size - os.path.getsize(archive_path)
+
+    def restore_session(self, lecture_name, session_name):
+        """Decompress an archived session back into its normal files"""
+        with self._lock, self.session_lock(lecture_name, session_name):
+            key = (lecture_name, session_name)
+            archive_path = self.session_archive_path(self.session_path(lecture_name, session_name))
+            with gzip.open(archive_path, 'rt', encoding='utf-8') as f:
+                session_data = json.load(f)
+
+            # The session is written back in the format it was archived from
+            entry = CachedSession(session_data)
+            entry.header_dirty = entry.messages_dirty = True
+            self._cache_put(key, entry)
+            self._flush_entry(key, entry)
+            os.remove(archive_path)
+
+    def archive_inactive_sessions(self, cutoff):
+        archived = 0
+        saved = 0
+        with self._lock:
+            for lecture_name in self.list_lectures():
+                for session_name in self.list_sessions(lecture_name):
+                    # Sessions in the cache are in use
+                    if (lecture_name, session_name) in self.session_cache:
+                        continue
+
+                    session_path = self.session_path(lecture_name, session_name)
+                    if not os.path.exists(session_path):
+                        continue
+                    last_write = max(os.path.getmtime(path) for path in self.session_files(session_path)[:2]
+                                     if os.path.exists(path))
+                    if last_write >= cutoff:
+                        continue
+
+                    try:
+                        saved += self.archive_session(lecture_name, session_name)
+                        archived += 1
+                    except (json.JSONDecodeError, UnicodeDecodeError, PermissionError):
+                        continue
+        return archived, saved
+
+    def _fresh_cached(self, lecture_name, session_name):
+        """Get a cached session, dropping it if another process has written the session since"""
+        key = (lecture_name, session_name)
+        entry = self.session_cache.get(key)
+        if entry is not None and not entry.dirty:
+            if entry.signature != self.session_signature(self.session_path(lecture_name, session_name)):
+                del self.session_cache[key]
+                return None
+        return entry
+
+    def _cached_session(self, lecture_name, session_name, session_data=None):
+        """Get a session from the cache, parsing it from disk on a miss (callers hold the session lock)"""
+        key = (lecture_name, session_name)
+        entry = self._fresh_cached(lecture_name, session_name)
+        if entry is not None:
+            self.session_cache.move_to_end(key)
+            return entry
+
+        session_path = self.session_path(lecture_name, session_name)
+        if session_data is None:
+            session_data = self._read_session_file(lecture_name, session_name)
+        signature = self.session_signature(session_path)
+
+        if session_data.get("storage") == "log":
+            session_data["messages"] = self.read_message_log(session_path)
+        else:
+            session_data.setdefault("messages", [])
+
+        entry = CachedSession(session_data, signature)
+        self._cache_put(key, entry)
+        return entry
+
+    def _cache_put(self, key, entry):
+        self.session_cache[key] = entry
+        self.session_cache.move_to_end(key)
+
+        while len(self.session_cache) > self.cache_size:
+            old_key, old_entry = self.session_cache.popitem(last=False)
+            if old_entry.dirty:
+                self._flush_entry(old_key, old_entry)
+
+    def invalidate(self, lecture_name=None, session_name=None):
+        with self._lock:
+            for key in list(self.session_cache):
+                if lecture_name in (None, key[0]) and session_name in (None, key[1]):
+                    self._fresh_cached(*key)
+
+    def _drop_cached(self, lecture_name, session_name=None):
+        """Forget cached sessions (all sessions of a lecture when session_name is None)"""
+        for key in list(self.session_cache):
+            if key[0] == lecture_name and session_name in (None, key[1]):
+                del self.session_cache[key]
+
+    def _changed(self, key):
+        """Write a changed session now, or leave it dirty for a later flush"""
+        if self.durability == "deferred":
+            self._schedule_flush()
+        elif not getattr(self._batch, "depth", 0):
+            self._flush_entry(key, self.session_cache[key])
+
+    def _schedule_flush(self):
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.flush_interval, self._timer_flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def _timer_flush(self):
+        with self._lock:
+            self._flush_timer = None
+            self.flush()
+
+    def _flush_entry(self, key, entry):
+        """Write a cached session to disk; messages go first so the header never points past them"""
+        session_path = self.session_path(*key)
+        fsync = self.durability == "fsync"
+        session_data = entry.data
+
+        with self.session_lock(*key):
+            # Appending to a message log changes nothing in the manifest but the session's counters
+            appended_only = not entry.header_dirty and not entry.messages_dirty
+            if session_data.get("storage") == "log":
+                if entry.messages_dirty:
+                    self.write_message_log(session_path, [message.to_dict() for message in session_data["messages"]],
+                                           fsync=fsync)
+                elif entry.pending_messages:
+                    self.append_message_log(session_path, entry.pending_messages, fsync=fsync)
+                if entry.header_dirty:
+                    header = {k: v for k, v in session_data.items() if k != "messages"}
+                    write_json_atomic(session_path, header, fsync=fsync)
+            else:
+                write_json_atomic(session_path,
+                                  dict(session_data, messages=[message.to_dict() for message in session_data["messages"]]),
+                                  fsync=fsync, compact=session_data.get("storage") == "compact")
+
+            entry.header_dirty = False
+            entry.messages_dirty = False
+            entry.pending_messages = []
+            entry.signature = self.session_signature(session_path)
+            self._update_manifest(key, entry, appended_only and session_data.get("storage") == "log")
+
+    def _set_format(self, session_data, session_format):
+        """Mark session data with the storage format it should be written in"""
+        session_data.pop("storage", None)
+        session_data.pop("schema_version", None)
+        if session_format != "json":
+            session_data["storage"] = session_format
+        if session_format == "compact":
+            session_data["schema_version"] = SESSION_SCHEMA_VERSION
+
+    def _convert_entry(self, key, entry, session_format):
+        """Rewrite a cached session in another storage format"""
+        old_format = entry.data.get("storage", "json")
+        self._set_format(entry.data, session_format)
+        entry.header_dirty = entry.messages_dirty = True
+        entry.pending_messages = []
+        self._flush_entry(key, entry)
+
+        if old_format == "log" and session_format != "log":
+            session_path = self.session_path(*key)
+            for path in (self.message_log_path(session_path), self.message_index_path(session_path)):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def convert_session(self, lecture_name, session_name, session_format):
+        """Convert a session to another storage format; returns False if it already uses it"""
+        if session_format not in SESSION_FORMATS:
+            raise ValueError(f"Unknown session format: {session_format}")
+
+        with self._lock, self.session_lock(lecture_name, session_name):
+            key = (lecture_name, session_name)
+            entry = self._cached_session(lecture_name, session_name)
+            if entry.data.get("storage", "json") == session_format:
+                return False
+            self._convert_entry(key, entry, session_format)
+            return True
+
+    def manifest_signature(self, lecture_name):
+        """Stat manifest.json and manifest.updates.jsonl (None if there is no manifest)"""
+        signature = []
+        for path in (self.manifest_path(lecture_name), self.manifest_updates_path(lecture_name)):
+            try:
+                stat = os.stat(path)
+                # Every manifest write renames a new file into place, so the inode tells writes apart within one mtime tick
+                signature.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature) if signature[0] is not None else None
+
+    def read_manifest(self, lecture_name):
+        """Get a lecture's manifest with its pending counter updates folded in, building it from the session files if it is missing"""
+        signature = self.manifest_signature(lecture_name)
+        if signature is None:
+            return self.rebuild_manifest(lecture_name)
+
+        cached = self.manifests.get(lecture_name)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        try:
+            with open(self.manifest_path(lecture_name), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return self.rebuild_manifest(lecture_name)
+
+        if signature[1] is not None:
+            try:
+                with open(self.manifest_updates_path(lecture_name), 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            update = json.loads(line)
+                        except json.JSONDecodeError:
+                            # A torn last line from an interrupted append
+                            continue
+                        stats = manifest["sessions"].get(update.pop("name", None))
+                        if stats is not None:
+                            stats.update(update)
+            except FileNotFoundError:
+                pass
+
+        self.manifests[lecture_name] = (signature, manifest)
+        return manifest
+
+    def write_manifest(self, lecture_name, manifest):
+        """Write a lecture's manifest (callers hold the lecture lock across reading and writing it, so the
+        manifest they write already has the pending counter updates folded in)"""
+        write_json_atomic(self.manifest_path(lecture_name), manifest, fsync=self.durability == "fsync")
+        try:
+            os.remove(self.manifest_updates_path(lecture_name))
+        except FileNotFoundError:
+            pass
+        self.manifests[lecture_name] = (self.manifest_signature(lecture_name), manifest)
+        self._bump_version(lecture_name)
+
+    def _bump_version(self, lecture_name):
+        self.lecture_versions[lecture_name] = self.lecture_versions.get(lecture_name, 0) + 1
+
+    def lecture_signature(self, lecture_name):
+        """Stat lecture_info.json and manifest.json; together with our own write count this
+        catches changes made by this process and by others, without reading either file"""
+        with self._lock:
+            # Deferred changes aren't on disk yet, so a signature can't describe them
+            for (cached_lecture, _), entry in self.session_cache.items():
+                if cached_lecture == lecture_name and entry.dirty:
+                    return None
+
+            signature = [self.lecture_versions.get(lecture_name, 0)]
+            for path in (self.lecture_info_path(lecture_name), self.manifest_path(lecture_name),
+                         self.manifest_updates_path(lecture_name)):
+                try:
+                    stat = os.stat(path)
+                    signature.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+                except FileNotFoundError:
+                    signature.append(None)
+            return tuple(signature)
+
+    def lecture_info_signature(self, lecture_name):
+        try:
+            stat = os.stat(self.lecture_info_path(lecture_name))
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def session_header_signature(self, lecture_name, session_name):
+        with self._lock:
+            entry = self.session_cache.get((lecture_name, session_name))
+            if entry is not None and entry.dirty:
+                return None
+            signature = self.session_signature(self.session_path(lecture_name, session_name))
+            return signature if signature[0] is not None else None
+
+    def rebuild_manifest(self, lecture_name):
+        """Build a lecture's manifest by reading all of its sessions (lectures from before manifests existed)"""
+        manifest = {"sessions": {}}
+        if not os.path.isdir(self.sessions_dir(lecture_name)):
+            return manifest
+
+        for session_name, file_path, archived in self._scan_session_files(self.sessions_dir(lecture_name)):
+            entry = self.session_cache.get((lecture_name, session_name))
+            try:
+                if entry is None:
+                    if archived:
+                        with gzip.open(file_path, 'rt', encoding='utf-8') as f:
+                            session_data = json.load(f)
+                    else:
+                        session_data = self._load_session_data(file_path)
+                    entry = CachedSession(session_data)
+                updated_at = datetime.fromtimestamp(os.path.getmtime(file_path)).isoformat()
+                manifest["sessions"][session_name] = session_manifest_entry(
+                    session_name, entry.data, entry.message_count, entry.char_count, updated_at
+                )
+                if archived:
+                    manifest["sessions"][session_name]["archived"] = True
+            except (json.JSONDecodeError, UnicodeDecodeError, PermissionError, OSError) as e:
+                manifest["sessions"][session_name] = {"name": session_name, "error": str(e)}
+
+        with self.lecture_lock(lecture_name):
+            self.write_manifest(lecture_name, manifest)
+        return manifest
+
+    def _update_manifest(self, key, entry, counters_only=False):
+        """Refresh a session's manifest entry after it was written.
+
+        With counters_only (only messages were appended) the new counts are
+        appended to manifest.updates.jsonl instead of rewriting manifest.json,
+        until that log outgrows MANIFEST_UPDATES_MAX_BYTES.
+        """
+        lecture_name, session_name = key
+        stats = session_manifest_entry(
+            session_name, entry.data, entry.message_count, entry.char_count, datetime.now().isoformat()
+        )
+        with self.lecture_lock(lecture_name):
+            updates_path = self.manifest_updates_path(lecture_name)
+            # The session must already have a manifest entry for its counters to be folded into
+            cached = self.manifests.get(lecture_name)
+            if counters_only and cached is not None and session_name in cached[1]["sessions"]:
+                try:
+                    size = os.path.getsize(updates_path)
+                except FileNotFoundError:
+                    size = 0
+                if size < MANIFEST_UPDATES_MAX_BYTES:
+                    update = {k: stats[k] for k in ("name", "updated_at", "message_count", "total_chars", "estimated_tokens")}
+                    with open(updates_path, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(update, ensure_ascii=False) + "\n")
+                        if self.durability == "fsync":
+                            f.flush()
+                            os.fsync(f.fileno())
+                    self._bump_version(lecture_name)
+                    return
+
+            manifest = self.read_manifest(lecture_name)
+            manifest["sessions"][session_name] = stats
+            self.write_manifest(lecture_name, manifest)
+
+    def list_lectures(self):
+        directories = [entry for entry in self._scandir(self.lectures_dir) if entry.is_dir()]
+        if self.layout == "sharded":
+            directories = [entry for shard in directories for entry in self._scandir(shard.path) if entry.is_dir()]
+        return sorted(entry.name for entry in directories)
+
+    def lecture_exists(self, lecture_name):
+        return os.path.exists(self.lecture_dir(lecture_name))
+
+    def create_lecture(self, lecture_name, lecture_info):
+        lecture_path = self.lecture_dir(lecture_name)
+        os.makedirs(self.sessions_dir(lecture_name), exist_ok=True)
+        os.makedirs(os.path.join(lecture_path, "docs"), exist_ok=True)
+        self.write_lecture(lecture_name, lecture_info)
+
+    def read_lecture(self, lecture_name):
+        try:
+            with open(self.lecture_info_path(lecture_name), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def write_lecture(self, lecture_name, lecture_info):
+        with self.lecture_lock(lecture_name):
+            write_json_atomic(self.lecture_info_path(lecture_name), lecture_info, fsync=self.durability == "fsync")
+        self._bump_version(lecture_name)
+
+    def delete_lecture(self, lecture_name):
+        with self._lock, self.lecture_lock(lecture_name):
+            self._drop_cached(lecture_name)
+            self.manifests.pop(lecture_name, None)
+            self._bump_version(lecture_name)
+            shutil.rmtree(self.lecture_dir(lecture_name))
+
+    def rename_lecture(self, lecture_name, new_name):
+        with self._lock:
+            self.flush()
+        with self._lock, self.lecture_lock(lecture_name):
+            self._drop_cached(lecture_name)
+            self.manifests.pop(lecture_name, None)
+            self._bump_version(lecture_name)
+            self._bump_version(new_name)
+            os.makedirs(os.path.dirname(self.lecture_dir(new_name)), exist_ok=True)
+            shutil.move(self.lecture_dir(lecture_name), self.lecture_dir(new_name))
+
+    def migrate_layout(self, layout):
+        """Move every lecture and session into another directory layout; returns (lectures, sessions) moved"""
+        if layout not in STORAGE_LAYOUTS:
+            raise ValueError(f"Unknown storage layout: {layout}")
+
+        with self._lock:
+            self.flush()
+            self.session_cache.clear()
+            self.manifests.clear()
+
+            # Lectures pass through a staging directory, since a lecture and a shard may share a name
+            staging_dir = os.path.join(self.lectures_dir, ".migrating")
+            lectures = sessions = 0
+            for lecture_name in self.list_lectures():
+                staged_path = os.path.join(staging_dir, lecture_name)
+                os.makedirs(staging_dir, exist_ok=True)
+                shutil.move(self.lecture_dir(lecture_name), staged_path)
+
+                sessions_path = os.path.join(staged_path, "sessions")
+                for session_name, file_path, archived in list(self._scan_session_files(sessions_path)):
+                    old_path = file_path[:-len('.gz')] if archived else file_path
+                    new_path = os.path.join(sessions_path, f"{session_name}.json")
+                    if layout == "sharded":
+                        new_path = os.path.join(sessions_path, self.shard(session_name), f"{session_name}.json")
+                    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+
+                    for number, segment_path in enumerate(self.history_segment_paths(old_path), 1):
+                        os.rename(segment_path, self.history_segment_path(new_path, number))
+                    for old_file, new_file in zip(self.session_files(old_path), self.session_files(new_path)):
+                        if os.path.exists(old_file):
+                            os.rename(old_file, new_file)
+                    # Migration runs offline, so lock files are simply recreated where they are next needed
+                    self.remove_lock_file(self.session_lock_path(old_path))
+                    sessions += 1
+
+                for entry in self._scandir(sessions_path):
+                    if entry.is_dir() and not os.listdir(entry.path):
+                        os.rmdir(entry.path)
+                lectures += 1
+                self._bump_version(lecture_name)
+
+            for entry in self._scandir(self.lectures_dir):
+                if entry.is_dir() and not os.listdir(entry.path):
+                    os.rmdir(entry.path)
+
+            self.layout = layout
+            for entry in self._scandir(staging_dir):
+                os.makedirs(os.path.dirname(self.lecture_dir(entry.name)), exist_ok=True)
+                shutil.move(entry.path, self.lecture_dir(entry.name))
+            if os.path.isdir(staging_dir):
+                os.rmdir(staging_dir)
+            for lecture_name in self.list_lectures():
+                self._rewrite_stored_paths(lecture_name)
+            self._write_layout(layout)
+            return lectures, sessions
+
+    def _rewrite_stored_paths(self, lecture_name):
+        """Point the paths recorded in a lecture's info and in its sessions at where migrate_layout moved the files"""
+        lecture_info = self.read_lecture(lecture_name)
+        if lecture_info is not None and "directory_structure" in lecture_info:
+            lecture_info["directory_structure"] = {
+                "root": self.lecture_dir(lecture_name),
+                "sessions": self.sessions_dir(lecture_name),
+                "docs": self.docs_dir(lecture_name)
+            }
+            self.write_lecture(lecture_name, lecture_info)
+
+        for session_name, file_path, archived in list(self._scan_session_files(self.sessions_dir(lecture_name))):
+            try:
+                if archived:
+                    with gzip.open(file_path, 'rt', encoding='utf-8') as f:
+                        session_data = json.load(f)
+                else:
+                    with open(file_path, 'r', encoding='utf-8') as f:
+                        session_data = json.load(f)
+            except (json.JSONDecodeError, UnicodeDecodeError, EOFError, OSError):
+                # Unreadable sessions are moved as they are
+                continue
+
+            session_path = self.session_path(lecture_name, session_name)
+            if "file_path" not in session_data or session_data["file_path"] == session_path:
+                continue
+            session_data["file_path"] = session_path
+            if archived:
+                temp_path = temp_path_for(file_path)
+                with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+                    json.dump(session_data, f, separators=(',', ':'), ensure_ascii=False)
+                os.replace(temp_path, file_path)
+            else:
+                write_json_atomic(file_path, session_data, fsync=self.durability == "fsync",
+                                  compact=session_data.get("storage") == "compact")
+
+    def list_sessions(self, lecture_name):
+        return sorted(self.read_manifest(lecture_name)["sessions"])
+
+    def list_session_stats(self, lecture_name):
+        with self._lock:
+            stats = copy.deepcopy(self.read_manifest(lecture_name)["sessions"])
+            # Changes still waiting for a deferred flush aren't in the manifest yet
+            for (cached_lecture, session_name), entry in self.session_cache.items():
+                if cached_lecture == lecture_name and entry.dirty and session_name in stats:
+                    stats[session_name] = copy.deepcopy(session_manifest_entry(
+                        session_name, entry.data, entry.message_count,
+                        entry.char_count, datetime.now().isoformat()
+                    ))
+            return stats
+
+    def session_exists(self, lecture_name, session_name):
+        session_path = self.session_path(lecture_name, session_name)
+        return ((lecture_name, session_name) in self.session_cache
+                or os.path.exists(session_path)
+                or os.path.exists(self.session_archive_path(session_path)))
+
+    def session_location(self, lecture_name, session_name):
+        return self.session_path(lecture_name, session_name)
+
+    def create_session(self, lecture_name, session_name, session_data):
+        session_data = copy.deepcopy(session_data)
+        session_data.setdefault("messages", [])
+        self._set_format(session_data, self.session_format)
+
+        with self._lock:
+            key = (lecture_name, session_name)
+            os.makedirs(os.path.dirname(self.session_path(lecture_name, session_name)), exist_ok=True)
+            with self.session_lock(lecture_name, session_name):
+                entry = CachedSession(session_data)
+                entry.header_dirty = entry.messages_dirty = True
+                self._cache_put(key, entry)
+                # New sessions are always written through so they show up in listings
+                self._flush_entry(key, entry)
+
+    def read_session(self, lecture_name, session_name, include_messages=True):
+        """Get a copy of a session's data.
+
+        With include_messages=False the returned data has no "messages" key,
+        so writing it back keeps the stored messages untouched.
+        """
+        with self._lock, self.session_lock(lecture_name, session_name):
+            if not include_messages and self._fresh_cached(lecture_name, session_name) is None:
+                # A log session's header can be returned without reading its messages
+                session_data = self._read_session_file(lecture_name, session_name)
+                if session_data.get("storage") == "log":
+                    return session_data
+                entry = self._cached_session(lecture_name, session_name, session_data)
+            else:
+                entry = self._cached_session(lecture_name, session_name)
+            session_data = copy.deepcopy({k: v for k, v in entry.data.items() if k != "messages"})
+            if include_messages:
+                session_data["messages"] = [message.to_dict() for message in entry.data["messages"]]
+            return session_data
+
+    def peek_session(self, lecture_name, session_name):
+        """Get a session's data without its messages, reading an archived session in place instead of restoring it"""
+        with self._lock:
+            entry = self._fresh_cached(lecture_name, session_name)
+            if entry is not None:
+                return copy.deepcopy({k: v for k, v in entry.data.items() if k != "messages"})
+
+        session_path = self.session_path(lecture_name, session_name)
+        try:
+            with open(session_path, 'r', encoding='utf-8') as f:
+                session_data = json.load(f)
+        except FileNotFoundError:
+            try:
+                with gzip.open(self.session_archive_path(session_path), 'rt', encoding='utf-8') as f:
+                    session_data = json.load(f)
+            except FileNotFoundError:
+                raise SessionNotFoundError(f"Session not found: {session_name}")
+        session_data.pop("messages", None)
+        return session_data
+
+    def write_session(self, lecture_name, session_name, session_data):
+        with self._lock, self.session_lock(lecture_name, session_name):
+            try:
+                entry = self._cached_session(lecture_name, session_name)
+            except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError):
+                # Recreate a missing or corrupted session from the given data
+                self.create_session(lecture_name, session_name, session_data)
+                return
+
+            old_data = entry.data
+            entry.data = copy.deepcopy({k: v for k, v in session_data.items() if k != "messages"})
+            for format_key in ("storage", "schema_version"):
+                if format_key in old_data:
+                    entry.data.setdefault(format_key, old_data[format_key])
+
+            # History segments dropped from the data (e.g. by clearing the session) are deleted
+            session_path = self.session_path(lecture_name, session_name)
+            kept_segments = len(entry.data.get("history_segments", []))
+            for segment_path in self.history_segment_paths(session_path)[kept_segments:]:
+                os.remove(segment_path)
+
+            if "messages" in session_data:
+                entry.data["messages"] = [Message.from_dict(message) for message in session_data["messages"]]
+                entry.total_chars = message_chars(entry.data["messages"])
+                entry.messages_dirty = True
+                entry.pending_messages = []
+            else:
+                entry.data["messages"] = old_data["messages"]
+
+            entry.header_dirty = True
+            self._changed((lecture_name, session_name))
+
+    def append_messages(self, lecture_name, session_name, messages):
+        with self._lock, self.session_lock(lecture_name, session_name):
+            entry = self._cached_session(lecture_name, session_name)
+            session_data = entry.data
+
+            # Sessions written by an opt-in format are converted to it the first time they change
+            if self.session_format != "json" and session_data.get("storage", "json") != self.session_format:
+                self._convert_entry((lecture_name, session_name), entry, self.session_format)
+
+            for message in messages:
+                lecture_ref = message.get("lecture_ref")
+                if lecture_ref and lecture_ref not in session_data.get("lectures_referenced", []):
+                    session_data.setdefault("lectures_referenced", []).append(lecture_ref)
+                    entry.header_dirty = True
+
+            session_data["messages"].extend(Message.from_dict(message) for message in messages)
+            entry.total_chars += message_chars(messages)
+            if session_data.get("storage") != "log":
+                entry.messages_dirty = True
+            elif not entry.messages_dirty:
+                # Only the new messages are appended, the header is rewritten only if it changed
+                entry.pending_messages.extend(messages)
+
+            self._changed((lecture_name, session_name))
+
+    def read_messages(self, lecture_name, session_name, limit=None, offset=0):
+        """Get a slice of a session's messages, spanning its history segments and active messages.
+
+        Uncached log sessions are read through their offset index, so only
+        the requested messages are loaded from disk.
+        """
+        with self._lock, self.session_lock(lecture_name, session_name):
+            entry = self._fresh_cached(lecture_name, session_name)
+            session_data = entry.data if entry is not None else self._read_session_file(lecture_name, session_name)
+            session_path = self.session_path(lecture_name, session_name)
+
+            messages = []
+            history_count = session_data.get("history_count", 0)
+            if offset < history_count:
+                end = history_count if limit is None else min(history_count, offset + limit)
+                messages = self.read_history(session_path, session_data, offset, end)
+                if limit is not None:
+                    limit -= end - offset
+                offset = history_count
+            if limit is not None and limit <= 0:
+                return messages
+            offset -= history_count
+
+            if entry is None:
+                if session_data.get("storage") == "log":
+                    count = self.message_index_count(session_path)
+                    end = count if limit is None else min(count, offset + limit)
+                    return messages + self.read_indexed_messages(session_path, offset, end)
+                entry = self._cached_session(lecture_name, session_name, session_data)
+
+            active = entry.data["messages"]
+            end = len(active) if limit is None else offset + limit
+            return messages + [message.to_dict() for message in active[offset:end]]
+
+    def count_messages(self, lecture_name, session_name):
+        with self._lock, self.session_lock(lecture_name, session_name):
+            entry = self._fresh_cached(lecture_name, session_name)
+            if entry is None:
+                session_data = self._read_session_file(lecture_name, session_name)
+                if session_data.get("storage") == "log":
+                    session_path = self.session_path(lecture_name, session_name)
+                    return session_data.get("history_count", 0) + self.message_index_count(session_path)
+                entry = self._cached_session(lecture_name, session_name, session_data)
+            return entry.message_count
+
+    def read_history(self, session_path, session_data, start, end):
+        """Read messages start..end-1 from a session's history segments, decompressing only those that overlap"""
+        messages = []
+        position = 0
+        for number, segment in enumerate(session_data.get("history_segments", []), 1):
+            segment_start = position
+            position += segment["count"]
+            if position <= start or segment_start >= end:
+                continue
+
+            with gzip.open(self.history_segment_path(session_path, number), 'rt', encoding='utf-8') as f:
+                segment_messages = [json.loads(line) for line in f if line.strip()]
+            messages.extend(segment_messages[max(start, segment_start) - segment_start:min(end, position) - segment_start])
+        return messages
+
+    def compact_session(self, lecture_name, session_name, count, summary):
+        with self._lock, self.session_lock(lecture_name, session_name):
+            key = (lecture_name, session_name)
+            entry = self._cached_session(lecture_name, session_name)
+            session_data = entry.data
+            session_path = self.session_path(lecture_name, session_name)
+
+            # Write the read-only segment first; the session only points at it once it is complete
+            moved = session_data["messages"][:count]
+            segments = session_data.setdefault("history_segments", [])
+            segment_path = self.history_segment_path(session_path, len(segments) + 1)
+            temp_path = temp_path_for(segment_path)
+            with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+                for message in moved:
+                    f.write(json.dumps(message.to_dict(), ensure_ascii=False) + "\n")
+            os.replace(temp_path, segment_path)
+
+            moved_chars = message_chars(moved)
+            segments.append({"count": len(moved), "chars": moved_chars})
+            session_data["history_count"] = session_data.get("history_count", 0) + len(moved)
+            session_data["messages"] = session_data["messages"][count:]
+            session_data["history_summary"] = summary["summary"]
+            session_data.setdefault("summaries", []).append(summary)
+            entry.total_chars -= moved_chars
+            entry.header_dirty = entry.messages_dirty = True
+            entry.pending_messages = []
+            self._changed(key)
+
+    def get_session_stats(self, lecture_name, session_name):
+        with self._lock:
+            session_data = self.read_session(lecture_name, session_name, include_messages=False)
+            entry = self._fresh_cached(lecture_name, session_name)
+            if entry is None:
+                stats = self.read_manifest(lecture_name)["sessions"].get(session_name, {})
+                if "message_count" in stats:
+                    session_data["message_count"] = stats["message_count"]
+                    session_data["total_chars"] = stats["total_chars"]
+                    return session_data
+                entry = self._cached_session(lecture_name, session_name)
+
+            session_data["message_count"] = entry.message_count
+            session_data["total_chars"] = entry.char_count
+            return session_data
+
+    def delete_session(self, lecture_name, session_name):
+        with self._lock, self.session_lock(lecture_name, session_name):
+            self._drop_cached(lecture_name, session_name)
+            session_path = self.session_path(lecture_name, session_name)
+            for path in self.session_files(session_path) + self.history_segment_paths(session_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+            with self.lecture_lock(lecture_name):
+                manifest = self.read_manifest(lecture_name)
+                if manifest["sessions"].pop(session_name, None) is not None:
+                    self.write_manifest(lecture_name, manifest)
+            self.remove_lock_file(self.session_lock_path(session_path))
+
+    def rename_session(self, lecture_name, session_name, new_name):
+        old_path = self.session_path(lecture_name, session_name)
+        new_path = self.session_path(lecture_name, new_name)
+        os.makedirs(os.path.dirname(new_path), exist_ok=True)
+
+        with self._lock, ExitStack() as locks:
+            # Both sessions are locked in name order so two renames can't wait on each other
+            for name in sorted((session_name, new_name)):
+                locks.enter_context(self.session_lock(lecture_name, name))
+
+            entry = self.session_cache.get((lecture_name, session_name))
+            if entry is not None and entry.dirty:
+                self._flush_entry((lecture_name, session_name), entry)
+            self._drop_cached(lecture_name, session_name)
+
+            for number, segment_path in enumerate(self.history_segment_paths(old_path), 1):
+                os.rename(segment_path, self.history_segment_path(new_path, number))
+
+            old_files = self.session_files(old_path)
+            new_files = self.session_files(new_path)
+
+            # Rename the session file last so a half-done rename never lists a session without its log
+            for old_file, new_file in reversed(list(zip(old_files, new_files))):
+                if os.path.exists(old_file):
+                    os.rename(old_file, new_file)
+
+            with self.lecture_lock(lecture_name):
+                manifest = self.read_manifest(lecture_name)
+                stats = manifest["sessions"].pop(session_name, None)
+                if stats is not None:
+                    stats["name"] = new_name
+                    manifest["sessions"][new_name] = stats
+                    self.write_manifest(lecture_name, manifest)
+            self.remove_lock_file(self.session_lock_path(old_path))
+
+    def read_message_log(self, session_path):
+        """Read all messages from a session's message log in append order"""
+        messages = []
+        try:
+            with open(self.message_log_path(session_path), 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        messages.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # Skip a torn line left behind by an interrupted append
+                        continue
+        except FileNotFoundError:
+            pass
+        return messages
+
+    def write_message_log(self, session_path, messages, fsync=False):
+        """Rewrite a session's message log and its index with the given messages"""
+        log_path = self.message_log_path(session_path)
+        index_path = self.message_index_path(session_path)
+        temp_path = temp_path_for(log_path)
+
+        ends = []
+        position = 0
+        with open(temp_path, 'wb') as f:
+            for message in messages:
+                line = (json.dumps(message, ensure_ascii=False) + "\n").encode('utf-8')
+                f.write(line)
+                position += len(line)
+                ends.append(position)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+        # Drop the old index first so a crash in between can't leave it describing the new log
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        os.replace(temp_path, log_path)
+        self.write_message_index(session_path, position, ends, fsync=fsync)
+
+    def append_message_log(self, session_path, messages, fsync=False):
+        """Append messages to a session's message log with a single write and extend its index"""
+        if not messages:
+            return
+
+        lines = [(json.dumps(message, ensure_ascii=False) + "\n").encode('utf-8') for message in messages]
+        prefix = b""
+        with open(self.message_log_path(session_path), 'ab+') as f:
+            log_size = f.tell()
+            # Terminate a torn line from an interrupted append so it can't swallow this one
+            if log_size > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    prefix = b"\n"
+            f.write(prefix + b"".join(lines))
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+        ends = []
+        position = log_size + len(prefix)
+        for line in lines:
+            position += len(line)
+            ends.append(position)
+        self.append_message_index(session_path, log_size, ends, fsync=fsync)
+
+    def write_message_index(self, session_path, log_size, ends, fsync=False):
+        """Write a message index covering log_size bytes of the message log"""
+        index_path = self.message_index_path(session_path)
+        temp_path = temp_path_for(index_path)
+        with open(temp_path, 'wb') as f:
+            f.write(self.INDEX_ENTRY.pack(log_size))
+            f.write(b"".join(self.INDEX_ENTRY.pack(end) for end in ends))
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_path, index_path)
+
+    def append_message_index(self, session_path, old_log_size, ends, fsync=False):
+        """Add entries for appended messages, rebuilding the index if it didn't cover the old log"""
+        entry_size = self.INDEX_ENTRY.size
+        try:
+            with open(self.message_index_path(session_path), 'r+b') as f:
+                header = f.read(entry_size)
+                index_size = os.fstat(f.fileno()).st_size
+                if (len(header) == entry_size and index_size % entry_size == 0
+                        and self.INDEX_ENTRY.unpack(header)[0] == old_log_size):
+                    f.seek(0, os.SEEK_END)
+                    f.write(b"".join(self.INDEX_ENTRY.pack(end) for end in ends))
+                    # Update the covered size last; a crash before this just triggers a rebuild
+                    f.seek(0)
+                    f.write(self.INDEX_ENTRY.pack(ends[-1]))
+                    if fsync:
+                        f.flush()
+                        os.fsync(f.fileno())
+                    return
+        except FileNotFoundError:
+            pass
+        self.rebuild_message_index(session_path)
+
+    def rebuild_message_index(self, session_path):
+        """Scan a message log and rewrite its index; returns the number of messages"""
+        ends = []
+        position = 0
+        try:
+            with open(self.message_log_path(session_path), 'rb') as f:
+                for line in f:
+                    position += len(line)
+                    if not line.strip():
+                        continue
+                    try:
+                        json.loads(line)
+                    except ValueError:
+                        # Torn lines are left out; they end up inside the next message's byte range and are skipped
+                        continue
+                    ends.append(position)
+        except FileNotFoundError:
+            pass
+        self.write_message_index(session_path, position, ends)
+        return len(ends)
+
+    def message_index_count(self, session_path):
+        """Get the number of messages in a session's message log, rebuilding a stale index"""
+        entry_size = self.INDEX_ENTRY.size
+        try:
+            log_size = os.path.getsize(self.message_log_path(session_path))
+        except FileNotFoundError:
+            log_size = 0
+
+        try:
+            with open(self.message_index_path(session_path), 'rb') as f:
+                header = f.read(entry_size)
+                index_size = os.fstat(f.fileno()).st_size
+            if (len(header) == entry_size and index_size % entry_size == 0
+                    and self.INDEX_ENTRY.unpack(header)[0] == log_size):
+                return index_size // entry_size - 1
+        except FileNotFoundError:
+            pass
+        return self.rebuild_message_index(session_path)
+
+    def read_indexed_messages(self, session_path, start, end):
+        """Read messages start..end-1 from a message log, seeking straight to them via the index"""
+        if start >= end:
+            return []
+
+        entry_size = self.INDEX_ENTRY.size
+        # Slot i + 1 holds the end of message i, which is where message i + 1 starts
+        with open(self.message_index_path(session_path), 'rb') as f:
+            f.seek(start * entry_size)
+            offsets = [offset for (offset,) in self.INDEX_ENTRY.iter_unpack(f.read((end - start + 1) * entry_size))]
+        first = offsets[0] if start > 0 else 0
+
+        with open(self.message_log_path(session_path), 'rb') as f:
+            f.seek(first)
+            data = f.read(offsets[-1] - first)
+
+        messages = []
+        for line in data.splitlines():
+            if not line.strip():
+                continue
+            try:
+                messages.append(json.loads(line))
+            except ValueError:
+                continue
+        return messages
+
+
+class SQLiteStorageBackend(StorageBackend):
+    """Stores lectures, sessions, messages, summaries and document lists in SQLite (WAL mode)"""
+
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS lectures (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            created_at TEXT,
+            current_model TEXT,
+            model_params TEXT,
+            info TEXT NOT NULL DEFAULT '{}'
+        );
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY,
+            lecture_id INTEGER NOT NULL REFERENCES lectures(id) ON DELETE CASCADE,
+            name TEXT NOT NULL,
+            created_at TEXT,
+            model TEXT,
+            model_params TEXT,
+            lectures_referenced TEXT NOT NULL DEFAULT '[]',
+            message_count INTEGER NOT NULL DEFAULT 0,
+            total_chars INTEGER NOT NULL DEFAULT 0,
+            info TEXT NOT NULL DEFAULT '{}',
+            UNIQUE (lecture_id, name)
+        );
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY,
+            session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+            seq INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp TEXT,
+            data TEXT,
+            UNIQUE (session_id, seq)
+        );
+        CREATE TABLE IF NOT EXISTS summaries (
+            id INTEGER PRIMARY KEY,
+            session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+            summary TEXT,
+            start_index INTEGER,
+            end_index INTEGER,
+            timestamp TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_summaries_session ON summaries(session_id);
+        CREATE TABLE IF NOT EXISTS documents (
+            id INTEGER PRIMARY KEY,
+            lecture_id INTEGER NOT NULL REFERENCES lectures(id) ON DELETE CASCADE,
+            session_id INTEGER REFERENCES sessions(id) ON DELETE CASCADE,
+            name TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_documents_owner ON documents(lecture_id, session_id);
+    """
+
+    # Keys stored in dedicated columns/tables; everything else goes into the info JSON
+    LECTURE_COLUMNS = {"name", "created_at", "current_model", "model_params", "documents", "sessions"}
+    SESSION_COLUMNS = {"name", "lecture", "created_at", "model", "model_params", "lectures_referenced",
+                       "documents", "summaries", "messages", "message_count", "total_chars", "storage", "file_path"}
+    MESSAGE_COLUMNS = {"role", "content", "timestamp"}
+
+    def __init__(self, base_dir, db_path=None):
+        super().__init__(base_dir)
+        self.db_path = db_path or os.path.join(base_dir, "lant.db")
+        self._local = threading.local()  # One connection per thread
+        self._connect().executescript(self.SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _lecture_id(self, conn, lecture_name):
+        row = conn.execute("SELECT id FROM lectures WHERE name = ?", (lecture_name,)).fetchone()
+        if row is None:
+            raise SessionNotFoundError(f"Lecture not found: {lecture_name}")
+        return row["id"]
+
+    def _session_row(self, conn, lecture_name, session_name):
+        row = conn.execute(
+            "SELECT s.* FROM sessions s JOIN lectures l ON s.lecture_id = l.id "
+            "WHERE l.name = ? AND s.name = ?",
+            (lecture_name, session_name)
+        ).fetchone()
+        if row is None:
+            raise SessionNotFoundError(f"Session not found: {session_name}")
+        return row
+
+    def _document_names(self, conn, lecture_id, session_id=None):
+        if session_id is None:
+            rows = conn.execute(
+                "SELECT name FROM documents WHERE lecture_id = ? AND session_id IS NULL ORDER BY id",
+                (lecture_id,)
+            )
+        else:
+            rows = conn.execute(
+                "SELECT name FROM documents WHERE lecture_id = ? AND session_id = ? ORDER BY id",
+                (lecture_id, session_id)
+            )
+        return [row["name"] for row in rows]
+
+    def _replace_documents(self, conn, lecture_id, session_id, documents):
+        if session_id is None:
+            conn.execute("DELETE FROM documents WHERE lecture_id = ? AND session_id IS NULL", (lecture_id,))
+        else:
+            conn.execute("DELETE FROM documents WHERE session_id = ?", (session_id,))
+        conn.executemany(
+            "INSERT INTO documents (lecture_id, session_id, name) VALUES (?, ?, ?)",
+            [(lecture_id, session_id, name) for name in documents]
+        )
+
+    def _message_row(self, session_id, seq, message):
+        extra = {k: v for k, v in message.items() if k not in self.MESSAGE_COLUMNS}
+        return (
+            session_id, seq, message.get("role", ""), message.get("content", ""),
+            message.get("timestamp"), json.dumps(extra) if extra else None
+        )
+
+    def _row_message(self, row):
+        message = {"role": row["role"], "content": row["content"], "timestamp": row["timestamp"]}
+        if row["data"]:
+            message.update(json.loads(row["data"]))
+        return message
+
+    def _insert_messages(self, conn, session_id, start_seq, messages):
+        conn.executemany(
+            "INSERT INTO messages (session_id, seq, role, content, timestamp, data) VALUES (?, ?, ?, ?, ?, ?)",
+            [self._message_row(session_id, start_seq + i, message) for i, message in enumerate(messages)]
+        )
+        return sum(len(message.get("content", "")) for message in messages)
+
+    def list_lectures(self):
+        rows = self._connect().execute("SELECT name FROM lectures ORDER BY name")
+        return [row["name"] for row in rows]
+
+    def lecture_exists(self, lecture_name):
+        row = self._connect().execute("SELECT 1 FROM lectures WHERE name = ?", (lecture_name,)).fetchone()
+        return row is not None
+
+    def create_lecture(self, lecture_name, lecture_info):
+        os.makedirs(self.docs_dir(lecture_name), exist_ok=True)
+        conn = self._connect()
+        with conn:
+            conn.execute("INSERT INTO lectures (name) VALUES (?)", (lecture_name,))
+        self.write_lecture(lecture_name, lecture_info)
+
+    def read_lecture(self, lecture_name):
+        conn = self._connect()
+        row = conn.execute("SELECT * FROM lectures WHERE name = ?", (lecture_name,)).fetchone()
+        if row is None:
+            return None
+
+        lecture_info = {
+            "name": row["name"],
+            "created_at": row["created_at"],
+            "documents": self._document_names(conn, row["id"]),
+            "sessions": self.list_sessions(lecture_name),
+            "current_model": row["current_model"],
+            "model_params": json.loads(row["model_params"]) if row["model_params"] else {}
+        }
+        lecture_info.update(json.loads(row["info"]))
+        return lecture_info
+
+    def write_lecture(self, lecture_name, lecture_info):
+        conn = self._connect()
+        with conn:
+            lecture_id = self._lecture_id(conn, lecture_name)
+            info = {k: v for k, v in lecture_info.items() if k not in self.LECTURE_COLUMNS}
+            conn.execute(
+                "UPDATE lectures SET created_at = ?, current_model = ?, model_params = ?, info = ? WHERE id = ?",
+                (lecture_info.get("created_at"), lecture_info.get("current_model"),
+                 json.dumps(lecture_info.get("model_params", {})), json.dumps(info), lecture_id)
+            )
+            if "documents" in lecture_info:
+                self._replace_documents(conn, lecture_id, None, lecture_info["documents"])
+
+    def delete_lecture(self, lecture_name):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM lectures WHERE name = ?", (lecture_name,))
+        if os.path.exists(self.lecture_dir(lecture_name)):
+            shutil.rmtree(self.lecture_dir(lecture_name))
+
+    def rename_lecture(self, lecture_name, new_name):
+        conn = self._connect()
+        with conn:
+            conn.execute("UPDATE lectures SET name = ? WHERE name = ?", (new_name, lecture_name))
+        if os.path.exists(self.lecture_dir(lecture_name)):
+            shutil.move(self.lecture_dir(lecture_name), self.lecture_dir(new_name))
+
+    def list_sessions(self, lecture_name):
+        rows = self._connect().execute(
+            "SELECT s.name FROM sessions s JOIN lectures l ON s.lecture_id = l.id "
+            "WHERE l.name = ? ORDER BY s.name",
+            (lecture_name,)
+        )
+        return [row["name"] for row in rows]
+
+    def session_exists(self, lecture_name, session_name):
+        try:
+            self._session_row(self._connect(), lecture_name, session_name)
+            return True
+        except SessionNotFoundError:
+            return False
+
+    def session_location(self, lecture_name, session_name):
+        return f"{self.db_path}#{lecture_name}/{session_name}"
+
+    def read_session(self, lecture_name, session_name, include_messages=True):
+        conn = self._connect()
+        row = self._session_row(conn, lecture_name, session_name)
+
+        session_data = {
+            "name": row["name"],
+            "lecture": lecture_name,
+            "created_at": row["created_at"],
+            "model": row["model"],
+            "model_params": json.loads(row["model_params"]) if row["model_params"] else {},
+            "documents": self._document_names(conn, row["lecture_id"], row["id"]),
+            "lectures_referenced": json.loads(row["lectures_referenced"]),
+            "summaries": [
+                {
+                    "summary": summary["summary"],
+                    "start_index": summary["start_index"],
+                    "end_index": summary["end_index"],
+                    "timestamp": summary["timestamp"]
+                }
+                for summary in conn.execute(
+                    "SELECT * FROM summaries WHERE session_id = ? ORDER BY id", (row["id"],)
+                )
+            ]
+        }
+        session_data.update(json.loads(row["info"]))
+
+        if include_messages:
+            session_data["messages"] = self.read_messages(lecture_name, session_name)
+        return session_data
+
+    def write_session(self, lecture_name, session_name, session_data):
+        conn = self._connect()
+        with conn:
+            # Looking the session up and inserting it must not race another writer
+            conn.execute("BEGIN IMMEDIATE")
+            lecture_id = self._lecture_id(conn, lecture_name)
+            info = {k: v for k, v in session_data.items() if k not in self.SESSION_COLUMNS}
+            values = (
+                session_data.get("created_at"), session_data.get("model"),
+                json.dumps(session_data.get("model_params", {})),
+                json.dumps(session_data.get("lectures_referenced", [])), json.dumps(info)
+            )
+
+            try:
+                session_id = self._session_row(conn, lecture_name, session_name)["id"]
+                conn.execute(
+                    "UPDATE sessions SET created_at = ?, model = ?, model_params = ?, "
+                    "lectures_referenced = ?, info = ? WHERE id = ?",
+                    values + (session_id,)
+                )
+            except SessionNotFoundError:
+                session_id = conn.execute(
+                    "INSERT INTO sessions (lecture_id, name, created_at, model, model_params, "
+                    "lectures_referenced, info) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (lecture_id, session_name) + values
+                ).lastrowid
+
+            if "documents" in session_data:
+                self._replace_documents(conn, lecture_id, session_id, session_data["documents"])
+
+            if "summaries" in session_data:
+                conn.execute("DELETE FROM summaries WHERE session_id = ?", (session_id,))
+                conn.executemany(
+                    "INSERT INTO summaries (session_id, summary, start_index, end_index, timestamp) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(session_id, s.get("summary"), s.get("start_index"), s.get("end_index"), s.get("timestamp"))
+                     for s in session_data["summaries"]]
+                )
+
+            if "messages" in session_data:
+                conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                total_chars = self._insert_messages(conn, session_id, 0, session_data["messages"])
+                conn.execute(
+                    "UPDATE sessions SET message_count = ?, total_chars = ? WHERE id = ?",
+                    (len(session_data["messages"]), total_chars, session_id)
+                )
+
+    def append_messages(self, lecture_name, session_name, messages):
+        conn = self._connect()
+        with conn:
+            # Take the write lock before reading message_count, so concurrent appends cannot reuse a seq
+            conn.execute("BEGIN IMMEDIATE")
+            row = self._session_row(conn, lecture_name, session_name)
+            total_chars = self._insert_messages(conn, row["id"], row["message_count"], messages)
+
+            lectures_referenced = json.loads(row["lectures_referenced"])
+            for message in messages:
+                lecture_ref = message.get("lecture_ref")
+                if lecture_ref and lecture_ref not in lectures_referenced:
+                    lectures_referenced.append(lecture_ref)
+
+            conn.execute(
+                "UPDATE sessions SET message_count = message_count + ?, total_chars = total_chars + ?, "
+                "lectures_referenced = ? WHERE id = ?",
+                (len(messages), total_chars, json.dumps(lectures_referenced), row["id"])
+            )
+
+    def read_messages(self, lecture_name, session_name, limit=None, offset=0):
+        conn = self._connect()
+        row = self._session_row(conn, lecture_name, session_name)
+        rows = conn.execute(
+            "SELECT role, content, timestamp, data FROM messages "
+            "WHERE session_id = ? AND seq >= ? ORDER BY seq LIMIT ?",
+            (row["id"], offset, -1 if limit is None else limit)
+        )
+        return [self._row_message(message_row) for message_row in rows]
+
+    def count_messages(self, lecture_name, session_name):
+        conn = self._connect()
+        return self._session_row(conn, lecture_name, session_name)["message_count"]
+
+    def get_session_stats(self, lecture_name, session_name):
+        conn = self._connect()
+        row = self._session_row(conn, lecture_name, session_name)
+        session_data = self.read_session(lecture_name, session_name, include_messages=False)
+        session_data["message_count"] = row["message_count"]
+        session_data["total_chars"] = row["total_chars"]
+        return session_data
+
+    def delete_session(self, lecture_name, session_name):
+        conn = self._connect()
+        with conn:
+            row = self._session_row(conn, lecture_name, session_name)
+            conn.execute("DELETE FROM sessions WHERE id = ?", (row["id"],))
+
+    def rename_session(self, lecture_name, session_name, new_name):
+        conn = self._connect()
+        with conn:
+            row = self._session_row(conn, lecture_name, session_name)
+            conn.execute("UPDATE sessions SET name = ? WHERE id = ?", (new_name, row["id"]))
+
+
+STORAGE_BACKENDS = {
+    FileStorageBackend.name: FileStorageBackend,
+    SQLiteStorageBackend.name: SQLiteStorageBackend
+}
+
+
+def create_storage_backend(backend, base_dir, **file_options):
+    """Create a storage backend by name ("file" or "sqlite").
+
+    file_options (session_format, cache_size, durability, layout) only apply to the file backend.
+    """
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend: {backend}")
+    if backend == FileStorageBackend.name:
+        return FileStorageBackend(base_dir, **file_options)
+    return STORAGE_BACKENDS[backend](base_dir)
+
+
+def migrate_storage(source, target):
+    """Copy every lecture and session from one storage backend into another"""
+    migrated = {"lectures": 0, "sessions": 0, "messages": 0}
+
+    for lecture_name in source.list_lectures():
+        lecture_info = source.read_lecture(lecture_name)
+        if lecture_info is None:
+            continue
+
+        if target.lecture_exists(lecture_name):
+            target.write_lecture(lecture_name, lecture_info)
+        else:
+            target.create_lecture(lecture_name, lecture_info)
+        migrated["lectures"] += 1
+
+        for session_name in source.list_sessions(lecture_name):
+            try:
+                session_data = source.read_session(lecture_name, session_name, include_messages=False)
+                session_data["messages"] = source.read_messages(lecture_name, session_name)
+            except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError, PermissionError):
+                continue
+            # Compacted history is carried over as ordinary messages
+            session_data.pop("history_count", None)
+            session_data.pop("history_segments", None)
+            session_data.pop("history_summary", None)
+            target.write_session(lecture_name, session_name, session_data)
+            migrated["sessions"] += 1
+            migrated["messages"] += len(session_data.get("messages", []))
+
+    return migrated
+
+
+class StagedFile:
+    """A file being written into the blob store's staging area, hashed as it is written.
+
+    Writes must be sequential (as when an upload is spooled); other file
+    methods are those of the underlying file.
+    """
+
+    def __init__(self, fd, path):
+        self.path = path
+        self._file = os.fdopen(fd, 'w+b')
+        self._sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self._sha256.update(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._sha256.hexdigest()
+
+    def discard(self):
+        """Close and delete the file unless it was already moved into the store"""
+        self._file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class BlobStore:
+    """Content-addressed document store.
+
+    Each distinct file is kept once as blobs/<aa>/<sha256><ext> (the extension
+    tells the extractors the file type). blobs/index.json counts the lecture and
+    session references to each blob, and a blob is deleted with its last reference.
+    """
+
+    def __init__(self, blobs_dir):
+        self.blobs_dir = blobs_dir
+        self.index_path = os.path.join(blobs_dir, "index.json")
+        self._lock = threading.RLock()
+        os.makedirs(blobs_dir, exist_ok=True)
+
+    def blob_path(self, blob_id):
+        return os.path.join(self.blobs_dir, blob_id[:2], blob_id)
+
+    def hash_file(self, file_path):
+        """Get the SHA-256 of a file, reading it in blocks"""
+        return file_sha256(file_path)
+
+    def content_hash(self, path):
+        """Get the SHA-256 of a blob from its name, or None if path is not a blob"""
+        if os.path.dirname(os.path.dirname(os.path.abspath(path))) != os.path.abspath(self.blobs_dir):
+            return None
+        digest = os.path.splitext(os.path.basename(path))[0]
+        return digest if len(digest) == 64 else None
+
+    def read_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def write_index(self, index):
+        write_json_atomic(self.index_path, index)
+
+    def add(self, file_path):
+        """Store a file's content unless it is already known; returns its blob id"""
+        blob_id = self.hash_file(file_path) + os.path.splitext(file_path)[1].lower()
+        blob_path = self.blob_path(blob_id)
+        if not os.path.exists(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            temp_path = temp_path_for(blob_path)
+            shutil.copyfile(file_path, temp_path)
+            os.replace(temp_path, blob_path)
+        else:
+            # Re-referenced content counts as new, so "gc" cannot sweep it before the reference is saved
+            os.utime(blob_path)
+        return blob_id
+
+    def staging_file(self):
+        """Open a uniquely named StagedFile under blobs/staging/ (on the blobs' filesystem, so it can be renamed into place)"""
+        staging_dir = os.path.join(self.blobs_dir, "staging")
+        os.makedirs(staging_dir, exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix=".tmp", dir=staging_dir)
+        return StagedFile(fd, path)
+
+    def add_staged(self, staged, ext):
+        """Rename a completely written StagedFile into the store under its hash; returns its blob id"""
+        staged.close()
+        blob_id = staged.hexdigest() + ext.lower()
+        blob_path = self.blob_path(blob_id)
+        if os.path.exists(blob_path):
+            os.remove(staged.path)
+            # Re-referenced content counts as new, so "gc" cannot sweep it before the reference is saved
+            os.utime(blob_path)
+        else:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(staged.path, blob_path)
+        return blob_id
+
+    def add_stream(self, stream, ext):
+        """Store what can be read from a binary stream, writing it once and hashing it on the way; returns its blob id"""
+        staged = self.staging_file()
+        try:
+            for block in iter(lambda: stream.read(1024 * 1024), b""):
+                staged.write(block)
+            return self.add_staged(staged, ext)
+        finally:
+            staged.discard()
+
+    def add_ref(self, blob_id):
+        with self._lock, file_lock(f"{self.index_path}.lock"):
+            index = self.read_index()
+            entry = index.setdefault(blob_id, {"refs": 0, "size": os.path.getsize(self.blob_path(blob_id))})
+            entry["refs"] += 1
+            self.write_index(index)
+
+    def release(self, blob_id):
+        """Drop a reference to a blob, deleting the blob when nothing refers to it any more"""
+        with self._lock, file_lock(f"{self.index_path}.lock"):
+            index = self.read_index()
+            entry = index.get(blob_id)
+            if entry is None:
+                return
+
+            entry["refs"] -= 1
+            if entry["refs"] <= 0:
+                del index[blob_id]
+                blob_path = self.blob_path(blob_id)
+                if os.path.exists(blob_path):
+                    os.remove(blob_path)
+            self.write_index(index)
+
+    def sweep(self, live_ids, cutoff, dry_run=False):
+        """Find blobs not referenced by any lecture or session and older than cutoff, deleting them unless dry_run; returns (path, size) pairs"""
+        found = []
+        with self._lock, file_lock(f"{self.index_path}.lock"):
+            index = self.read_index()
+            for shard in os.scandir(self.blobs_dir):
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    if entry.name.endswith(".tmp") or entry.name in live_ids:
+                        continue
+                    # A blob the index still counts references to is live, even if no readable owner names it
+                    if index.get(entry.name, {}).get("refs", 0) > 0:
+                        continue
+                    stat = entry.stat()
+                    if stat.st_mtime >= cutoff:
+                        continue
+                    found.append((entry.path, stat.st_size))
+                    if not dry_run:
+                        os.remove(entry.path)
+                        index.pop(entry.name, None)
+
+            if not dry_run:
+                # Also forget index entries whose blob is already gone
+                for blob_id in [blob_id for blob_id in index if blob_id not in live_ids]:
+                    if not os.path.exists(self.blob_path(blob_id)):
+                        del index[blob_id]
+                self.write_index(index)
+        return found
+
+
+class ExtractionCache:
+    """Extracted document text kept in cache/ within a byte budget.
+
+    cache/index.json records each entry's size and last access, so stats come
+    from running totals instead of a directory scan. When a write takes the
+    cache over max_bytes, the least recently used entries are evicted. Entries
+    archived to <name>.gz keep their place and count at their compressed size.
+    Index changes (new and removed entries, access times) are held in memory
+    until flush(), which callers make once per extracted document; an index
+    written meanwhile by another process is merged in first.
+    """
+
+    def __init__(self, cache_dir, max_bytes=CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.entries = OrderedDict()  # file name -> {"size", "accessed"}, least recently used first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._index_mtime = None
+        self._lock = threading.RLock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+        atexit.register(self.flush)
+
+    def path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError):
+            return None
+
+    def _load(self):
+        index = self._read_index()
+        if index is None:
+            # No usable index (first run, or caches from before it existed): rebuild it from the files
+            index = {}
+            for entry in os.scandir(self.cache_dir):
+                if entry.is_file() and entry.name.endswith(('.txt', '.txt.gz')):
+                    stat = entry.stat()
+                    index[entry.name] = {"size": stat.st_size, "accessed": max(stat.st_atime, stat.st_mtime)}
+        for name, entry in sorted(index.items(), key=lambda item: item[1]["accessed"]):
+            self._add(name, entry["size"], entry["accessed"])
+        self._dirty = True
+        self._save()
+
+    def _add(self, name, size, accessed):
+        old = self.entries.pop(name, None)
+        if old is not None:
+            self.total_bytes -= old["size"]
+        self.entries[name] = {"size": size, "accessed": accessed}
+        self.total_bytes += size
+
+    def _drop(self, name):
+        entry = self.entries.pop(name, None)
+        if entry is not None:
+            self.total_bytes -= entry["size"]
+
+    def _merge(self, index):
+        """Take in entries another process added, and forget ones it removed"""
+        for name, entry in (index or {}).items():
+            if name not in self.entries and os.path.exists(self.path(name)):
+                self._add(name, entry["size"], entry["accessed"])
+                self.entries.move_to_end(name, last=False)
+        for name in [name for name in self.entries if name not in (index or {})]:
+            if not os.path.exists(self.path(name)):
+                self._drop(name)
+
+    def _save(self):
+        if not self._dirty:
+            return
+        with file_lock(f"{self.index_path}.lock"):
+            try:
+                mtime = os.stat(self.index_path).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            if mtime != self._index_mtime:
+                self._merge(self._read_index() if mtime is not None else {})
+            self._evict()
+            write_json_atomic(self.index_path, dict(self.entries), compact=True)
+            self._index_mtime = os.stat(self.index_path).st_mtime_ns
+        self._dirty = False
+
+    def _evict(self, keep=None):
+        while self.total_bytes > self.max_bytes and self.entries:
+            name = next(iter(self.entries))
+            if name == keep:
+                if len(self.entries) == 1:
+                    break
+                self.entries.move_to_end(name)
+                continue
+            self._drop(name)
+            try:
+                os.remove(self.path(name))
+            except FileNotFoundError:
+                pass
+
+    def _touch(self, name):
+        entry = self.entries.get(name)
+        if entry is not None:
+            entry["accessed"] = time.time()
+            self.entries.move_to_end(name)
+            self._dirty = True
+
+    def get(self, key):
+        """Get the text cached under a key (decompressing an archived entry), or None"""
+        name = f"{key}.txt"
+        try:
+            with open(self.path(name), 'r', encoding='utf-8') as f:
+                text = f.read()
+        except FileNotFoundError:
+            text = None
+        except (UnicodeDecodeError, PermissionError, OSError):
+            # Silently treat unreadable entries as missing - cache is optional
+            text = None
+
+        if text is None and os.path.exists(self.path(f"{name}.gz")):
+            try:
+                # Archived entry - decompress it and keep it uncompressed again now that it is in use
+                with gzip.open(self.path(f"{name}.gz"), 'rt', encoding='utf-8') as f:
+                    text = f.read()
+                if self.put(key, text):
+                    self.remove(f"{name}.gz")
+            except (UnicodeDecodeError, PermissionError, OSError):
+                text = None
+
+        with self._lock:
+            if text is None:
+                self.misses += 1
+                if name in self.entries:
+                    # Removed behind the index's back
+                    self._drop(name)
+                    self._dirty = True
+            else:
+                self.hits += 1
+                self._touch(name)
+        return text
+
+    def contains(self, key):
+        """Check the index for a key (no hit or miss is counted)"""
+        with self._lock:
+            return f"{key}.txt" in self.entries or f"{key}.txt.gz" in self.entries
+
+    def put(self, key, text):
+        """Cache text under a key, evicting least recently used entries beyond the budget; returns success"""
+        name = f"{key}.txt"
+        data = text.encode('utf-8')
+        if len(data) > self.max_bytes:
+            # It would be evicted again straight away
+            return False
+        try:
+            temp_path = temp_path_for(self.path(name))
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, self.path(name))
+        except (PermissionError, OSError):
+            # Silently return False for cache errors - cache is optional
+            return False
+
+        with self._lock:
+            self._add(name, len(data), time.time())
+            self._evict(keep=name)
+            self._dirty = True
+        return True
+
+    def remove(self, name):
+        """Delete a cache file (indexed or not)"""
+        with self._lock:
+            try:
+                os.remove(self.path(name))
+            except FileNotFoundError:
+                pass
+            if name in self.entries:
+                self._drop(name)
+                self._dirty = True
+
+    def archive(self, cutoff):
+        """Gzip entries not read or written since the cutoff timestamp; returns (files, bytes saved)"""
+        archived = 0
+        saved = 0
+        with self._lock:
+            stale = [name for name, entry in self.entries.items()
+                     if name.endswith('.txt') and entry["accessed"] < cutoff]
+            for name in stale:
+                cache_file = self.path(name)
+                if not os.path.isfile(cache_file):
+                    self._drop(name)
+                    continue
+                temp_path = temp_path_for(f"{cache_file}.gz")
+                with open(cache_file, 'rb') as src, gzip.open(temp_path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                os.replace(temp_path, f"{cache_file}.gz")
+                os.remove(cache_file)
+
+                entry = self.entries[name]
+                size = os.path.getsize(f"{cache_file}.gz")
+                self._drop(name)
+                self._add(f"{name}.gz", size, entry["accessed"])
+                # Archived entries are the least recently used
+                self.entries.move_to_end(f"{name}.gz", last=False)
+                archived += 1
+                saved += entry["size"] - size
+            self._dirty = self._dirty or bool(stale)
+            self._save()
+        return archived, saved
+
+    def clear(self):
+        with self._lock:
+            for entry in os.scandir(self.cache_dir):
+                if entry.is_file() and not entry.name.endswith('.lock'):
+                    os.remove(entry.path)
+            self.entries.clear()
+            self.total_bytes = 0
+            self._index_mtime = None
+            self._dirty = True
+            self._save()
+
+    def flush(self):
+        """Save the index changes held in memory"""
+        with self._lock:
+            self._save()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+class LectureRepository:
+    """Parsed lecture info and session metadata kept in memory.
+
+    Every cached copy is stored with the backend's signature for it (a stat of
+    the file it came from, for the file backend) and reused while the signature
+    still matches, so repeated lookups parse nothing. Saves write through to the
+    backend and refresh the cached copy. Backends without signatures are read
+    on every lookup.
+
+    The repository's own lock only guards its dictionaries and is never held
+    while calling the backend, so it cannot deadlock with the backend's locks.
+    """
+
+    def __init__(self, storage, cache_size=HEADER_CACHE_SIZE):
+        self.storage = storage
+        self.cache_size = cache_size
+        self.lectures = {}  # lecture -> (signature, lecture info)
+        self.sessions = OrderedDict()  # (lecture, session) -> (signature, session metadata)
+        self._lock = threading.RLock()
+
+    def _store(self, cache, key, signature, data):
+        if signature is None:
+            cache.pop(key, None)
+            return
+        cache[key] = (signature, copy.deepcopy(data))
+        if cache is self.sessions:
+            self.sessions.move_to_end(key)
+            while len(self.sessions) > self.cache_size:
+                self.sessions.popitem(last=False)
+
+    def list_lectures(self):
+        return self.storage.list_lectures()
+
+    def lecture_exists(self, lecture_name):
+        return self.storage.lecture_exists(lecture_name)
+
+    def get_lecture(self, lecture_name):
+        """Get a copy of a lecture's info, or None if the lecture doesn't exist"""
+        # Stat before reading: a write in between leaves a stale signature, never stale data
+        signature = self.storage.lecture_info_signature(lecture_name)
+        with self._lock:
+            cached = self.lectures.get(lecture_name)
+            if signature is not None and cached is not None and cached[0] == signature:
+                return copy.deepcopy(cached[1])
+
+        lecture_info = self.storage.read_lecture(lecture_name)
+        with self._lock:
+            self._store(self.lectures, lecture_name, signature if lecture_info is not None else None, lecture_info)
+        return lecture_info
+
+    def save_lecture(self, lecture_name, lecture_info):
+        with self.storage.lecture_lock(lecture_name):
+            self.storage.write_lecture(lecture_name, lecture_info)
+            signature = self.storage.lecture_info_signature(lecture_name)
+            with self._lock:
+                self._store(self.lectures, lecture_name, signature, lecture_info)
+
+    def list_sessions(self, lecture_name):
+        return self.storage.list_sessions(lecture_name)
+
+    def session_exists(self, lecture_name, session_name):
+        return self.storage.session_exists(lecture_name, session_name)
+
+    def get_session(self, lecture_name, session_name):
+        """Get a copy of a session's metadata (no "messages" key); raises SessionNotFoundError"""
+        key = (lecture_name, session_name)
+        signature = self.storage.session_header_signature(lecture_name, session_name)
+        with self._lock:
+            cached = self.sessions.get(key)
+            if signature is not None and cached is not None and cached[0] == signature:
+                self.sessions.move_to_end(key)
+                return copy.deepcopy(cached[1])
+
+        session_data = self.storage.read_session(lecture_name, session_name, include_messages=False)
+        with self._lock:
+            self._store(self.sessions, key, signature, session_data)
+        return session_data
+
+    def save_session(self, lecture_name, session_name, session_data):
+        with self.storage.session_lock(lecture_name, session_name):
+            self.storage.write_session(lecture_name, session_name, session_data)
+            # Read back what was stored: the backend adds its own format keys
+            signature = self.storage.session_header_signature(lecture_name, session_name)
+            stored = None
+            if signature is not None:
+                stored = self.storage.read_session(lecture_name, session_name, include_messages=False)
+            with self._lock:
+                self._store(self.sessions, (lecture_name, session_name), signature, stored)
+
+    def forget(self, lecture_name, session_name=None):
+        """Drop cached copies for a deleted or renamed lecture (or just one of its sessions)"""
+        with self._lock:
+            if session_name is None:
+                self.lectures.pop(lecture_name, None)
+            for key in list(self.sessions):
+                if key[0] == lecture_name and session_name in (None, key[1]):
+                    del self.sessions[key]
+
+    def invalidate(self, lecture_name=None, session_name=None):
+        """Drop cached copies whose signature no longer matches storage (of one lecture or session, or all)"""
+        with self._lock:
+            lectures = list(self.lectures.items()) if session_name is None else []
+            sessions = list(self.sessions.items())
+
+        stale_lectures = [(name, entry) for name, entry in lectures
+                          if lecture_name in (None, name) and entry[0] != self.storage.lecture_info_signature(name)]
+        stale_sessions = [(key, entry) for key, entry in sessions
+                          if lecture_name in (None, key[0]) and session_name in (None, key[1])
+                          and entry[0] != self.storage.session_header_signature(*key)]
+
+        with self._lock:
+            # Entries replaced meanwhile were stored from a fresh read and stay
+            for cache, stale in ((self.lectures, stale_lectures), (self.sessions, stale_sessions)):
+                for key, entry in stale:
+                    if cache.get(key) is entry:
+                        del cache[key]
+
+
+DocumentChunk = namedtuple("DocumentChunk", "document unit index text complete", defaults=(True,))
+DocumentChunk.__doc__ = """Part of a document's extracted text: unit is "page", "slide", "section", "table", "image" or "document", index counts from 1.
+
+complete is False when the OCR of one of the unit's images failed, so the text should not be cached.
+"""
+
+StorageEvent = namedtuple("StorageEvent", "kind lecture session name")
+StorageEvent.__doc__ = """A change under lectures/: kind is one of StorageWatcher.EVENT_KINDS, session and name (a document) may be None"""
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+INOTIFY_EVENT = struct.Struct("iIII")  # wd, mask, cookie, name length
+
+
+def load_inotify():
+    """Get libc with inotify bound through ctypes, or None where it isn't available"""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    except (OSError, AttributeError, TypeError):
+        return None
+    return libc
+
+
+class StorageWatcher:
+    """Turns changes under lectures/ (made by this or any other process) into StorageEvents.
+
+    Uses inotify on Linux, with a watch on every directory of the tree, and
+    otherwise compares stat snapshots of the tree every poll_interval seconds.
+    Listeners are called from the watcher thread. Documents are detected by
+    diffing the document lists in lecture_info.json and manifest.json, plus new
+    files in the legacy docs/ and session_docs/ folders.
+    """
+
+    EVENT_KINDS = ("lecture_added", "lecture_removed", "lecture_changed",
+                   "session_changed", "session_removed", "document_added", "overflow")
+    SESSION_SUFFIXES = (".json.gz", ".json", ".messages.jsonl", ".messages.idx")
+
+    def __init__(self, storage, poll_interval=WATCH_POLL_INTERVAL):
+        self.storage = storage
+        self.root = storage.lectures_dir
+        self.poll_interval = poll_interval
+        self.listeners = []
+        self.documents = {}  # lecture or (lecture, session) -> document names last seen
+        self.mode = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def start(self):
+        """Start watching in a daemon thread; returns the mode used ("inotify" or "polling")"""
+        if self._thread is not None:
+            return self.mode
+
+        for lecture_name in self.storage.list_lectures():
+            self._lecture_documents(lecture_name, emit=False)
+            self._session_documents(lecture_name, emit=False)
+
+        libc = load_inotify()
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC) if libc else -1
+        if fd >= 0:
+            self.mode = "inotify"
+            target = lambda: self._run_inotify(libc, fd)
+        else:
+            self.mode = "polling"
+            target = self._run_polling
+        self._thread = threading.Thread(target=target, name="lant-storage-watcher", daemon=True)
+        self._thread.start()
+        return self.mode
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _emit(self, events):
+        # One write usually produces several raw notifications; report each change once per batch
+        for event in list(dict.fromkeys(events)):
+            for listener in self.listeners:
+                try:
+                    listener(event)
+                except Exception as e:
+                    print(f"⚠️  Storage watcher listener failed: {e}")
+
+    def _read_json(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _diff_documents(self, lecture_name, owners, emit):
+        """Record the document lists of a lecture and/or its sessions; returns document_added events for new names"""
+        events = []
+        for owner, documents in owners.items():
+            known = self.documents.get(owner)
+            self.documents[owner] = set(documents)
+            if emit and known is not None:
+                session_name = owner[1] if isinstance(owner, tuple) else None
+                events.extend(StorageEvent("document_added", lecture_name, session_name, name)
+                              for name in documents if name not in known)
+        return events
+
+    def _lecture_documents(self, lecture_name, emit=True):
+        lecture_info = self._read_json(self.storage.lecture_info_path(lecture_name)) or {}
+        return self._diff_documents(lecture_name, {lecture_name: lecture_info.get("documents", [])}, emit)
+
+    def _session_documents(self, lecture_name, emit=True):
+        # Every session's document list is in the lecture manifest, so no session file is parsed
+        manifest = self._read_json(self.storage.manifest_path(lecture_name)) or {}
+        owners = {(lecture_name, name): entry.get("documents", []) for name, entry in manifest.get("sessions", {}).items()}
+        return self._diff_documents(lecture_name, owners, emit)
+
+    def _split(self, path):
+        """Get (lecture, path parts inside the lecture directory) for a path under the root"""
+        parts = os.path.relpath(path, self.root).split(os.sep)
+        if parts[0] in (".", "..") or any(part.startswith(".") for part in parts):
+            return None, []
+        if self.storage.layout == "sharded":
+            parts = parts[1:]
+        if not parts:
+            return None, []
+        return parts[0], parts[1:]
+
+    def _session_name(self, file_name):
+        for suffix in self.SESSION_SUFFIXES:
+            if file_name.endswith(suffix):
+                return file_name[:-len(suffix)]
+        base, dot, rest = file_name.partition(".history-")
+        return base if dot and rest.endswith(".jsonl.gz") else None
+
+    def path_events(self, path, is_dir, removed):
+        """Map one changed path to the StorageEvents it stands for"""
+        if path.endswith((".tmp", ".lock")):
+            return []
+        lecture_name, rest = self._split(path)
+        if lecture_name is None:
+            return []
+
+        if not rest:
+            if not is_dir:
+                return []
+            if removed:
+                self.documents = {owner: names for owner, names in self.documents.items()
+                                  if owner != lecture_name and not (isinstance(owner, tuple) and owner[0] == lecture_name)}
+                return [StorageEvent("lecture_removed", lecture_name, None, None)]
+            return [StorageEvent("lecture_added", lecture_name, None, None)]
+
+        if rest == ["lecture_info.json"] and not removed:
+            return [StorageEvent("lecture_changed", lecture_name, None, None)] + self._lecture_documents(lecture_name)
+        if rest == ["manifest.json"] and not removed:
+            return self._session_documents(lecture_name)
+
+        if rest[0] == "sessions" and len(rest) > 1 and not is_dir:
+            session_name = self._session_name(rest[-1])
+            if session_name is None:
+                return []
+            if removed and not self.storage.session_exists(lecture_name, session_name):
+                self.documents.pop((lecture_name, session_name), None)
+                return [StorageEvent("session_removed", lecture_name, session_name, None)]
+            return [StorageEvent("session_changed", lecture_name, session_name, None)]
+
+        if not removed and not is_dir:
+            if rest[0] == "docs" and len(rest) == 2:
+                return [StorageEvent("document_added", lecture_name, None, rest[1])]
+            if rest[0] == "session_docs" and len(rest) == 3:
+                return [StorageEvent("document_added", lecture_name, rest[1], rest[2])]
+        return []
+
+    def _run_inotify(self, libc, fd):
+        watches = {}  # wd -> directory
+
+        def watch_tree(top, events):
+            for directory, dirnames, filenames in os.walk(top):
+                wd = libc.inotify_add_watch(fd, os.fsencode(directory), INOTIFY_MASK)
+                if wd < 0:
+                    continue
+                watches[wd] = directory
+                if events is not None:
+                    # Files created before the watch was in place
+                    for name in filenames:
+                        events.extend(self.path_events(os.path.join(directory, name), False, False))
+
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            watch_tree(self.root, None)
+            while not self._stop.is_set():
+                if not select.select([fd], [], [], 1)[0]:
+                    continue
+                try:
+                    data = os.read(fd, 64 * 1024)
+                except BlockingIOError:
+                    continue
+
+                events = []
+                offset = 0
+                while offset < len(data):
+                    wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+                    name = data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b"\0")
+                    offset += INOTIFY_EVENT.size + length
+
+                    if mask & IN_Q_OVERFLOW:
+                        # Events were dropped, so listeners must forget everything
+                        events.append(StorageEvent("overflow", None, None, None))
+                        continue
+                    if mask & IN_IGNORED:
+                        watches.pop(wd, None)
+                        continue
+                    directory = watches.get(wd)
+                    if directory is None or not name:
+                        continue
+
+                    path = os.path.join(directory, os.fsdecode(name))
+                    is_dir = bool(mask & IN_ISDIR)
+                    removed = bool(mask & (IN_DELETE | IN_MOVED_FROM))
+                    if not is_dir and mask & IN_CREATE:
+                        # Wait for the write to finish (IN_CLOSE_WRITE)
+                        continue
+                    events.extend(self.path_events(path, is_dir, removed))
+                    if is_dir and not removed:
+                        watch_tree(path, events)
+                    elif is_dir and mask & IN_MOVED_FROM:
+                        # A moved-away directory keeps its watches, which would report under the old path
+                        for moved_wd, moved_dir in list(watches.items()):
+                            if moved_dir == path or moved_dir.startswith(path + os.sep):
+                                libc.inotify_rm_watch(fd, moved_wd)
+                                watches.pop(moved_wd, None)
+                self._emit(events)
+        finally:
+            os.close(fd)
+
+    def _snapshot(self):
+        snapshot = {}
+        for directory, dirnames, filenames in os.walk(self.root):
+            for name in dirnames + filenames:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                snapshot[path] = (name in dirnames, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def _run_polling(self):
+        previous = self._snapshot()
+        while not self._stop.wait(self.poll_interval):
+            current = self._snapshot()
+            events = []
+            for path, state in current.items():
+                old = previous.get(path)
+                # Directory mtimes change with their contents; only their appearance matters
+                if old is None or (not state[0] and old != state):
+                    events.extend(self.path_events(path, state[0], False))
+            for path, state in previous.items():
+                if path not in current:
+                    events.extend(self.path_events(path, state[0], True))
+            previous = current
+            self._emit(events)
+
+
+class IngestionQueue:
+    """Extracts newly added documents in the background, so the first question about them finds their text cached.
+
+    Jobs are keyed by document path (a blob path, so content added to several
+    lectures is extracted once) and go from queued to extracting to ready or
+    failed. Daemon worker threads start with the first job.
+    """
+
+    STATES = ("queued", "extracting", "ready", "failed")
+    ERROR_PREFIXES = ("Error", "File not found", "Unsupported document type")  # Extractors report failures as text
+
+    def __init__(self, extract, is_cached=None, workers=INGEST_WORKERS):
+        self.extract = extract  # path -> extracted text or an error message
+        self.is_cached = is_cached  # path -> whether its extracted text is still cached
+        self.workers = workers
+        self.jobs = {}  # path -> {"status", "error", "updated_at"}
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.RLock()
+
+    def enqueue(self, path):
+        """Queue a document for extraction unless it is queued, being extracted or ready with its text still cached"""
+        with self._lock:
+            job = self.jobs.get(path)
+            if job is not None and job["status"] in ("queued", "extracting"):
+                return
+            if job is not None and job["status"] == "ready" and (self.is_cached is None or self.is_cached(path)):
+                return
+            self._set(path, "queued")
+            self._queue.put(path)
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name=f"lant-ingest-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _set(self, path, status, error=None):
+        with self._lock:
+            self.jobs[path] = {"status": status, "error": error, "updated_at": datetime.now().isoformat()}
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            self._set(path, "extracting")
+            try:
+                text = self.extract(path)
+                error = text if text.startswith(self.ERROR_PREFIXES) else None
+            except Exception as e:
+                error = str(e)
+            self._set(path, "failed" if error else "ready", error)
+
+    def status(self, path):
+        """Get a copy of a document's job, or None if it was never queued"""
+        with self._lock:
+            job = self.jobs.get(path)
+            return dict(job) if job else None
+
 
 class SilentDirectoryAssistant:
-    def __init__(self, model="codellama:7b"):
+    def __init__(self, model="codellama:7b", session_format=SESSION_FORMAT, storage_backend=STORAGE_BACKEND,
+                 session_cache_size=SESSION_CACHE_SIZE, session_durability=SESSION_DURABILITY,
+                 storage_layout=STORAGE_LAYOUT):
         self.model = model
         self.base_dir = "learning_assistant"
         self.lectures_dir = os.path.join(self.base_dir, "lectures")
@@ -37,7 +2944,46 @@ class SilentDirectoryAssistant:
             "num_predict": 3072
         }
         self.max_context_messages = 12  # Maximum messages before summarization
+        self.pdf_workers = PDF_WORKERS
+        self.ocr_workers = OCR_WORKERS
+        self.ocr_pool = None  # Created on first use, then shared so concurrent requests stay within ocr_workers
+        self._ocr_lock = threading.Lock()
+        self.status_cache = {}  # lecture -> (storage signature, lecture status)
+        self.hash_memo = OrderedDict()  # absolute path -> (mtime_ns, size, sha256), least recently used first
+        self._hash_memo_lock = threading.Lock()
         self.ensure_directories_silent()
+        self.extraction_cache = ExtractionCache(self.cache_dir)
+        self.blobs = BlobStore(os.path.join(self.base_dir, "blobs"))
+        self.ingestion = IngestionQueue(self.extract_document_text, self.has_cached_text)
+        self.storage = create_storage_backend(
+            storage_backend, self.base_dir,
+            session_format=session_format,
+            cache_size=session_cache_size,
+            durability=session_durability,
+            layout=storage_layout
+        )
+        self.repository = LectureRepository(self.storage)
+        self.watcher = None
+
+    def start_watcher(self):
+        """Follow changes other processes make to the storage tree; returns the watch mode, or None for SQLite"""
+        if not isinstance(self.storage, FileStorageBackend):
+            return None
+        if self.watcher is None:
+            self.watcher = StorageWatcher(self.storage)
+            self.watcher.add_listener(self.handle_storage_event)
+        return self.watcher.start()
+
+    def handle_storage_event(self, event):
+        """Drop the cached state a StorageEvent made stale"""
+        lecture_name = event.lecture
+        session_name = event.session if event.kind in ("session_changed", "session_removed") else None
+        self.storage.invalidate(lecture_name, session_name)
+        self.repository.invalidate(lecture_name, session_name)
+
+        for name, (signature, _) in list(self.status_cache.items()):
+            if lecture_name in (None, name) and signature != self.storage.lecture_signature(name):
+                self.status_cache.pop(name, None)
     
     def ensure_directories_silent(self):
         """Create necessary directories silently if they don't exist"""
@@ -51,11 +2997,31 @@ class SilentDirectoryAssistant:
             if not os.path.exists(directory):
                 os.makedirs(directory)
     
+    def get_content_hash(self, file_path):
+        """Get the SHA-256 of a file's contents, rehashing only when its mtime or size changed"""
+        blob_hash = self.blobs.content_hash(file_path)
+        if blob_hash:
+            return blob_hash
+
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+        with self._hash_memo_lock:
+            memo = self.hash_memo.get(path)
+            if memo and memo[:2] == (stat.st_mtime_ns, stat.st_size):
+                self.hash_memo.move_to_end(path)
+                return memo[2]
+
+        digest = file_sha256(path)
+        with self._hash_memo_lock:
+            self.hash_memo[path] = (stat.st_mtime_ns, stat.st_size, digest)
+            self.hash_memo.move_to_end(path)
+            while len(self.hash_memo) > HASH_MEMO_SIZE:
+                self.hash_memo.popitem(last=False)
+        return digest
+
     def get_file_hash(self, file_path):
-        """Generate a hash for a file based on its path and modification time"""
-        stat = os.stat(file_path)
-        hash_input = f"{file_path}_{stat.st_mtime}_{stat.st_size}"
-        return hashlib.md5(hash_input.encode()).hexdigest()
+        """Get a document's extraction cache key: its content hash and the extractor version"""
+        return f"{self.get_content_hash(file_path)}_v{EXTRACTOR_VERSION}"
 
     def check_memory_usage(self):
         """Check current memory usage and warn if high"""
@@ -83,53 +3049,55 @@ class SilentDirectoryAssistant:
         """Get cached text for a document if available and valid"""
         if not os.path.exists(file_path):
             return None
-            
-        file_hash = self.get_file_hash(file_path)
-        cache_file = os.path.join(self.cache_dir, f"{file_hash}.txt")
-        
-        if os.path.exists(cache_file):
-            try:
-                with open(cache_file, 'r', encoding='utf-8') as f:
-                    return f.read()
-            except (FileNotFoundError, UnicodeDecodeError, PermissionError, OSError) as e:
-                # Silently return None for cache errors - cache is optional
+
+        keys = self.cached_text_keys(file_path)
+        if keys is None:
+            return None
+        texts = []
+        for key in keys:
+            text = self.extraction_cache.get(key)
+            if text is None:
                 return None
-        return None
+            texts.append(text)
+        return "".join(texts)
+
+    def cached_text_keys(self, file_path):
+        """Get the cache keys a document's text is kept under: one per page or slide of a PDF or PowerPoint file (None until their count is cached)"""
+        unit = UNIT_TYPES.get(os.path.splitext(file_path)[1].lower())
+        if unit is None:
+            return [self.get_file_hash(file_path)]
+
+        count = self.extraction_cache.get(f"{self.get_file_hash(file_path)}.units")
+        if count is None or not count.isdigit():
+            return None
+        return [self.unit_cache_key(file_path, unit, index) for index in range(1, int(count) + 1)]
+
+    def has_cached_text(self, file_path):
+        """Check whether all of a document's text is cached, without reading it"""
+        keys = self.cached_text_keys(file_path)
+        return keys is not None and all(self.extraction_cache.contains(key) for key in keys)
     
     def cache_text(self, file_path, text):
         """Cache extracted text for a document"""
-        file_hash = self.get_file_hash(file_path)
-        cache_file = os.path.join(self.cache_dir, f"{file_hash}.txt")
-        
         try:
-            with open(cache_file, 'w', encoding='utf-8') as f:
-                f.write(text)
-            return True
-        except (PermissionError, OSError, UnicodeEncodeError) as e:
+            cached = self.extraction_cache.put(self.get_file_hash(file_path), text)
+            self.extraction_cache.flush()
+            return cached
+        except UnicodeEncodeError:
             # Silently return False for cache errors - cache is optional
             return False
     
     def list_lectures(self):
         """List all lectures"""
-        lectures = []
-        if os.path.exists(self.lectures_dir):
-            for item in os.listdir(self.lectures_dir):
-                if os.path.isdir(os.path.join(self.lectures_dir, item)):
-                    lectures.append(item)
-        return sorted(lectures)
-    
+        return self.repository.list_lectures()
+
     def create_lecture(self, lecture_name):
         """Create a new lecture with proper directory structure"""
-        lecture_path = os.path.join(self.lectures_dir, lecture_name)
-        
-        if os.path.exists(lecture_path):
+        lecture_path = self.storage.lecture_dir(lecture_name)
+
+        if self.repository.lecture_exists(lecture_name):
             return f"Lecture '{lecture_name}' already exists"
-        
-        # Create lecture directory structure
-        os.makedirs(lecture_path)
-        os.makedirs(os.path.join(lecture_path, "sessions"))
-        os.makedirs(os.path.join(lecture_path, "docs"))
-        
+
         # Create lecture_info.json
         lecture_info = {
             "name": lecture_name,
@@ -144,89 +3112,99 @@ class SilentDirectoryAssistant:
                 "docs": os.path.join(lecture_path, "docs")
             }
         }
-        
-        with open(os.path.join(lecture_path, "lecture_info.json"), 'w') as f:
-            json.dump(lecture_info, f, indent=2)
-        
+
+        self.storage.create_lecture(lecture_name, lecture_info)
+
         return f"Created lecture: {lecture_name}"
-    
+
     def add_lecture(self, lecture_name):
         """Add a new lecture by name"""
         return self.create_lecture(lecture_name)
-    
+
     def load_lecture(self, lecture_name):
         """Load a lecture"""
-        lecture_path = os.path.join(self.lectures_dir, lecture_name)
-        
-        if not os.path.exists(lecture_path):
+        lecture_info = self.repository.get_lecture(lecture_name)
+
+        if lecture_info is None:
             return False
-        
+
         self.current_lecture = lecture_name
-        
-        # Load lecture info
-        with open(os.path.join(lecture_path, "lecture_info.json"), 'r') as f:
-            lecture_info = json.load(f)
-            self.model = lecture_info.get("current_model", self.model)
-            self.model_params = lecture_info.get("model_params", self.model_params.copy())
-        
+        self.model = lecture_info.get("current_model", self.model)
+        self.model_params = lecture_info.get("model_params", self.model_params.copy())
+
         return True
-    
+
     def get_lecture_info(self, lecture_name=None):
         """Get lecture information"""
         if not lecture_name:
             lecture_name = self.current_lecture
-        
+
         if not lecture_name:
             return None
-        
-        lecture_path = os.path.join(self.lectures_dir, lecture_name)
-        if not os.path.exists(lecture_path):
-            return None
-        
-        with open(os.path.join(lecture_path, "lecture_info.json"), 'r') as f:
-            return json.load(f)
-    
+
+        return self.repository.get_lecture(lecture_name)
+
+    def delete_lecture(self, lecture_name):
+        """Delete a lecture with all of its sessions and documents"""
+        self.release_documents(self.repository.get_lecture(lecture_name))
+        for session_name in self.repository.list_sessions(lecture_name):
+            try:
+                self.release_documents(self.repository.get_session(lecture_name, session_name))
+            except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError, PermissionError):
+                continue
+
+        self.storage.delete_lecture(lecture_name)
+        self.repository.forget(lecture_name)
+
+        # Clear current selection if this was the active lecture
+        if self.current_lecture == lecture_name:
+            self.current_lecture = None
+            self.current_session = None
+
+    def rename_lecture(self, lecture_name, new_name):
+        """Rename a lecture"""
+        self.storage.rename_lecture(lecture_name, new_name)
+        self.repository.forget(lecture_name)
+
+        # Update current selection if this was the active lecture
+        if self.current_lecture == lecture_name:
+            self.current_lecture = new_name
+
     def list_sessions(self, lecture_name=None):
         """List all sessions in a lecture"""
         if not lecture_name:
             lecture_name = self.current_lecture
-        
+
         if not lecture_name:
             return []
-        
-        lecture_path = os.path.join(self.lectures_dir, lecture_name)
-        sessions_path = os.path.join(lecture_path, "sessions")
-        
-        if not os.path.exists(sessions_path):
-            return []
-        
-        sessions = []
-        for file in os.listdir(sessions_path):
-            if file.endswith('.json'):
-                sessions.append(os.path.splitext(file)[0])
-        
-        return sorted(sessions)
-    
+
+        return self.repository.list_sessions(lecture_name)
+
+    def session_exists(self, session_name, lecture_name=None):
+        """Check whether a session exists in a lecture"""
+        if not lecture_name:
+            lecture_name = self.current_lecture
+
+        if not lecture_name:
+            return False
+
+        return self.repository.session_exists(lecture_name, session_name)
+
     def create_session(self, session_name=None, lecture_name=None):
         """Create a new session in a lecture"""
         if not lecture_name:
             lecture_name = self.current_lecture
-        
+
         if not lecture_name:
             return "No lecture selected"
-        
-        lecture_path = os.path.join(self.lectures_dir, lecture_name)
-        sessions_path = os.path.join(lecture_path, "sessions")
-        
+
         if not session_name:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             session_name = f"session_{timestamp}"
-        
-        session_path = os.path.join(sessions_path, f"{session_name}.json")
-        
-        if os.path.exists(session_path):
+
+        if self.repository.session_exists(lecture_name, session_name):
             return f"Session '{session_name}' already exists in lecture '{lecture_name}'"
-        
+
         # Create session file
         session_data = {
             "name": session_name,
@@ -238,109 +3216,142 @@ class SilentDirectoryAssistant:
             "documents": [],  # List of documents specific to this session
             "lectures_referenced": [],
             "summaries": [],  # List of conversation summaries
-            "file_path": session_path
+            "file_path": self.storage.session_location(lecture_name, session_name)
         }
-        
-        with open(session_path, 'w') as f:
-            json.dump(session_data, f, indent=2)
-        
+
+        self.storage.create_session(lecture_name, session_name, session_data)
+
         # Update lecture info
         self.update_lecture_sessions(lecture_name)
-        
+
         self.current_session = session_name
         return f"Created session '{session_name}' in lecture '{lecture_name}'"
-    
+
     def load_session(self, session_name, lecture_name=None):
         """Load a session"""
         if not lecture_name:
             lecture_name = self.current_lecture
-        
+
         if not lecture_name:
             return False
-        
-        lecture_path = os.path.join(self.lectures_dir, lecture_name)
-        sessions_path = os.path.join(lecture_path, "sessions")
-        session_path = os.path.join(sessions_path, f"{session_name}.json")
-        
-        if not os.path.exists(session_path):
+
+        try:
+            # Load session data (lazy loading - only metadata)
+            session_data = self.repository.get_session(lecture_name, session_name)
+        except SessionNotFoundError:
             return False
-        
+
         self.current_session = session_name
-        
-        # Load session data (lazy loading - only metadata)
-        with open(session_path, 'r') as f:
-            session_data = json.load(f)
-            self.model = session_data.get("model", self.model)
-            self.model_params = session_data.get("model_params", self.model_params.copy())
-        
+        self.model = session_data.get("model", self.model)
+        self.model_params = session_data.get("model_params", self.model_params.copy())
+
         return True
-    
+
     def get_session_history(self, limit=None, offset=0):
         """Get conversation history of current session with lazy loading"""
         if not self.current_lecture or not self.current_session:
             return []
-        
-        lecture_path = os.path.join(self.lectures_dir, self.current_lecture)
-        sessions_path = os.path.join(lecture_path, "sessions")
-        session_path = os.path.join(sessions_path, f"{self.current_session}.json")
-        
-        try:
-            with open(session_path, 'r', encoding='utf-8') as f:
-                session_data = json.load(f)
-                messages = session_data.get("messages", [])
 
-                # Apply lazy loading parameters
-                if limit is not None:
-                    end = offset + limit
-                    return messages[offset:end]
-                return messages
+        try:
+            return self.read_session_messages(self.current_lecture, self.current_session, limit, offset)
         except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError, PermissionError) as e:
             # Return empty list for session reading errors
             return []
-    
+
+    def read_session_messages(self, lecture_name, session_name, limit=None, offset=0):
+        """Read a slice of a session's messages; a forked session's first messages come from its parent"""
+        session_data = self.repository.get_session(lecture_name, session_name)
+        parent = session_data.get("parent")
+        if not parent:
+            return expand_messages(session_data, self.storage.read_messages(lecture_name, session_name, limit, offset))
+
+        # The inherited prefix is read from the parent chain only when it is asked for
+        messages = []
+        upto = parent["upto"]
+        if offset < upto:
+            end = upto if limit is None else min(upto, offset + limit)
+            messages = self.read_session_messages(lecture_name, parent["session"], end - offset, offset)
+            if limit is not None:
+                limit -= end - offset
+            offset = upto
+        if limit is not None and limit <= 0:
+            return messages
+        return messages + expand_messages(
+            session_data, self.storage.read_messages(lecture_name, session_name, limit, offset - upto)
+        )
+
+    def append_session_messages(self, lecture_name, session_name, messages):
+        """Append messages to a session, storing their model parameters in its param_sets table"""
+        with self.storage.session_lock(lecture_name, session_name):
+            session_data = self.repository.get_session(lecture_name, session_name)
+            known = len(session_data.get("param_sets", []))
+            messages = intern_messages(session_data, messages)
+            # The table is saved before the messages that refer to it
+            if len(session_data.get("param_sets", [])) != known:
+                self.repository.save_session(lecture_name, session_name, session_data)
+            self.storage.append_messages(lecture_name, session_name, messages)
+
+    def count_session_messages(self, lecture_name, session_name):
+        """Count a session's messages, including those a fork inherits from its parent"""
+        parent = self.repository.get_session(lecture_name, session_name).get("parent")
+        return (parent["upto"] if parent else 0) + self.storage.count_messages(lecture_name, session_name)
+
+    def get_message_page(self, limit=None, before=None):
+        """Get the newest messages of the current session older than the `before` cursor.
+
+        The cursor is a message index; next_cursor points at the oldest message
+        returned and is None once the start of the session is reached.
+        """
+        page = {"messages": [], "total": 0, "next_cursor": None, "has_more": False}
+        if not self.current_lecture or not self.current_session:
+            return page
+
+        try:
+            total = self.count_session_messages(self.current_lecture, self.current_session)
+            end = total if before is None else max(0, min(before, total))
+            start = 0 if limit is None else max(0, end - max(limit, 0))
+            page["messages"] = self.read_session_messages(self.current_lecture, self.current_session, end - start, start)
+        except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError, PermissionError):
+            return page
+
+        page["total"] = total
+        if start > 0:
+            page["next_cursor"] = start
+            page["has_more"] = True
+        return page
+
     def save_message(self, role, content, lecture_ref=None):
         """Save a message to the current session"""
         if not self.current_lecture or not self.current_session:
             return
-        
-        lecture_path = os.path.join(self.lectures_dir, self.current_lecture)
-        sessions_path = os.path.join(lecture_path, "sessions")
-        session_path = os.path.join(sessions_path, f"{self.current_session}.json")
-        
-        try:
-            with open(session_path, 'r', encoding='utf-8') as f:
-                session_data = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError, PermissionError):
-            # Create new session data if file doesn't exist or is corrupted
-            session_data = {
-                "name": self.current_session,
-                "messages": [],
-                "lectures_referenced": [],
-                "model": self.model,
-                "model_params": self.model_params.copy(),
-                "summaries": []
-            }
-        
+
         message = {
             "role": role,
             "content": content,
             "timestamp": datetime.now().isoformat()
         }
-        
+
         # Add model information for assistant messages
         if role == "assistant":
             message["model"] = self.model
             message["model_params"] = self.model_params.copy()
-        
+
         if lecture_ref:
             message["lecture_ref"] = lecture_ref
-            if lecture_ref not in session_data.get("lectures_referenced", []):
-                session_data["lectures_referenced"].append(lecture_ref)
-        
-        session_data["messages"].append(message)
-        
-        with open(session_path, 'w') as f:
-            json.dump(session_data, f, indent=2)
+
+        try:
+            self.append_session_messages(self.current_lecture, self.current_session, [message])
+        except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError, PermissionError):
+            # Create new session data if the session doesn't exist or is corrupted
+            session_data = {
+                "name": self.current_session,
+                "lectures_referenced": [lecture_ref] if lecture_ref else [],
+                "model": self.model,
+                "model_params": self.model_params.copy(),
+                "summaries": []
+            }
+            session_data["messages"] = intern_messages(session_data, [message])
+            self.storage.create_session(self.current_lecture, self.current_session, session_data)
 
     def get_conversation_history(self):
         """Get all messages for the current session"""
@@ -351,145 +3362,486 @@ class SilentDirectoryAssistant:
         if not self.current_lecture or not self.current_session:
             return False
 
-        lecture_path = os.path.join(self.lectures_dir, self.current_lecture)
-        sessions_path = os.path.join(lecture_path, "sessions")
-        session_path = os.path.join(sessions_path, f"{self.current_session}.json")
+        # Forks still need the messages they inherit, and a cleared fork no longer inherits any
+        self.detach_forks(self.current_session, self.current_lecture)
+        self.unlink_fork(self.current_session, self.current_lecture)
+
+        with self.storage.session_lock(self.current_lecture, self.current_session):
+            try:
+                session_data = self.repository.get_session(self.current_lecture, self.current_session)
+            except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError, PermissionError):
+                # Create new session data if file doesn't exist or is corrupted
+                session_data = {
+                    "name": self.current_session,
+                    "messages": [],
+                    "lectures_referenced": [],
+                    "model": self.model,
+                    "model_params": self.model_params.copy(),
+                    "summaries": []
+                }
+
+            # Clear messages but keep other data
+            session_data["messages"] = []
+            session_data["summaries"] = []  # Also clear summaries
+            session_data["history_count"] = 0
+            session_data["history_segments"] = []
+            session_data.pop("history_summary", None)
+            session_data.pop("param_sets", None)
+
+            self.repository.save_session(self.current_lecture, self.current_session, session_data)
+
+        return True
+
+    def compact_session(self, keep=None):
+        """Fold all but the last `keep` active messages of the current session into its consolidated summary"""
+        if not self.current_lecture or not self.current_session:
+            return "No session selected"
+
+        if keep is None:
+            keep = self.max_context_messages
+
+        # History segments only hold a session's own messages
+        self.materialize_fork(self.current_session, self.current_lecture)
+
+        session_data = self.repository.get_session(self.current_lecture, self.current_session)
+        history_count = session_data.get("history_count", 0)
+        active_count = self.storage.count_messages(self.current_lecture, self.current_session) - history_count
+        count = active_count - keep
+        if count <= 0:
+            return f"Nothing to compact: session has {active_count} active messages"
+
+        # The new summary replaces the previous consolidated one, so fold that in as well
+        messages = self.get_session_history(limit=count, offset=history_count)
+        if session_data.get("history_summary"):
+            messages = [{"role": "system", "content": f"Earlier in this conversation: {session_data['history_summary']}"}] + messages
+
+        summary = self.summarize_conversation(messages)
+        if summary.startswith("Error generating summary"):
+            return summary
+
+        self.storage.compact_session(self.current_lecture, self.current_session, count, {
+            "summary": summary,
+            "start_index": 0,
+            "end_index": history_count + count - 1,
+            "timestamp": datetime.now().isoformat()
+        })
+        return f"Compacted {count} messages; {keep} remain active"
+
+    def delete_session(self, session_name, lecture_name=None):
+        """Delete a session"""
+        if not lecture_name:
+            lecture_name = self.current_lecture
 
         try:
-            with open(session_path, 'r', encoding='utf-8') as f:
-                session_data = json.load(f)
+            self.detach_forks(session_name, lecture_name)
+            self.unlink_fork(session_name, lecture_name)
+            self.release_documents(self.repository.get_session(lecture_name, session_name))
         except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError, PermissionError):
-            # Create new session data if file doesn't exist or is corrupted
-            session_data = {
-                "name": self.current_session,
-                "messages": [],
-                "lectures_referenced": [],
-                "model": self.model,
-                "model_params": self.model_params.copy(),
-                "summaries": []
-            }
+            pass
+
+        self.storage.delete_session(lecture_name, session_name)
+        self.repository.forget(lecture_name, session_name)
+        session_docs_dir = self.storage.session_docs_dir(lecture_name, session_name)
+        if os.path.isdir(session_docs_dir):
+            shutil.rmtree(session_docs_dir)
+        self.update_lecture_sessions(lecture_name)
 
-        # Clear messages but keep other data
-        session_data["messages"] = []
-        session_data["summaries"] = []  # Also clear summaries
+        # Clear current selection if this was the active session
+        if self.current_lecture == lecture_name and self.current_session == session_name:
+            self.current_session = None
 
-        with open(session_path, 'w') as f:
-            json.dump(session_data, f, indent=2)
+    def rename_session(self, session_name, new_name, lecture_name=None):
+        """Rename a session"""
+        if not lecture_name:
+            lecture_name = self.current_lecture
 
-        return True
+        self.storage.rename_session(lecture_name, session_name, new_name)
+        self.repository.forget(lecture_name, session_name)
+        session_docs_dir = self.storage.session_docs_dir(lecture_name, session_name)
+        if os.path.isdir(session_docs_dir):
+            shutil.move(session_docs_dir, self.storage.session_docs_dir(lecture_name, new_name))
+
+        # Keep the links between a fork and its parent pointing at the new name
+        session_data = self.repository.get_session(lecture_name, new_name)
+        for fork_name in session_data.get("forks", []):
+            with self.storage.session_lock(lecture_name, fork_name):
+                try:
+                    fork_data = self.repository.get_session(lecture_name, fork_name)
+                except SessionNotFoundError:
+                    continue
+                fork_data["parent"]["session"] = new_name
+                self.repository.save_session(lecture_name, fork_name, fork_data)
+        if session_data.get("parent"):
+            self._update_forks(lecture_name, session_data["parent"]["session"],
+                               lambda forks: [new_name if name == session_name else name for name in forks])
+
+        self.update_lecture_sessions(lecture_name)
+
+        # Update current selection if this was the active session
+        if self.current_lecture == lecture_name and self.current_session == session_name:
+            self.current_session = new_name
+
+    def fork_session(self, new_name, at_index=None):
+        """Start a session that continues from the first `at_index` messages of the current one without copying them"""
+        if not self.current_lecture or not self.current_session:
+            return "No session selected"
+
+        lecture_name = self.current_lecture
+        parent_name = self.current_session
+        if self.repository.session_exists(lecture_name, new_name):
+            return f"Session '{new_name}' already exists in lecture '{lecture_name}'"
+
+        total = self.count_session_messages(lecture_name, parent_name)
+        upto = total if at_index is None else max(0, min(at_index, total))
+
+        # The parent lists its forks so they can be given their own copy before it is cleared or deleted
+        self._update_forks(lecture_name, parent_name, lambda forks: forks + [new_name])
+        parent_data = self.repository.get_session(lecture_name, parent_name)
+
+        # Forks share the parent's stored documents through the blob store
+        document_refs = dict(parent_data.get("document_refs", {}))
+        for blob_id in document_refs.values():
+            self.blobs.add_ref(blob_id)
+
+        session_data = {
+            "name": new_name,
+            "lecture": lecture_name,
+            "created_at": datetime.now().isoformat(),
+            "model": parent_data.get("model", self.model),
+            "model_params": parent_data.get("model_params", self.model_params.copy()),
+            "messages": [],
+            "documents": [doc for doc in parent_data.get("documents", []) if doc in document_refs],
+            "document_refs": document_refs,
+            "lectures_referenced": list(parent_data.get("lectures_referenced", [])),
+            "summaries": [],
+            "parent": {"session": parent_name, "upto": upto},
+            "file_path": self.storage.session_location(lecture_name, new_name)
+        }
+        self.storage.create_session(lecture_name, new_name, session_data)
+        self.update_lecture_sessions(lecture_name)
+
+        self.current_session = new_name
+        return f"Forked '{parent_name}' after {upto} messages into session '{new_name}'"
+
+    def _update_forks(self, lecture_name, session_name, update):
+        """Replace the list of forks recorded on a session with update(forks)"""
+        with self.storage.session_lock(lecture_name, session_name):
+            try:
+                session_data = self.repository.get_session(lecture_name, session_name)
+            except SessionNotFoundError:
+                return
+            session_data["forks"] = update(session_data.get("forks", []))
+            self.repository.save_session(lecture_name, session_name, session_data)
+
+    def materialize_fork(self, session_name, lecture_name=None):
+        """Copy the messages a fork inherits into the fork itself, so it no longer depends on its parent"""
+        if not lecture_name:
+            lecture_name = self.current_lecture
+
+        with self.storage.session_lock(lecture_name, session_name):
+            session_data = self.repository.get_session(lecture_name, session_name)
+            parent = session_data.pop("parent", None)
+            if not parent:
+                return
+            # Inherited messages refer to the parent's param_sets, so they are interned into the fork's own table
+            session_data["messages"] = intern_messages(session_data, self.read_session_messages(lecture_name, session_name))
+            self.repository.save_session(lecture_name, session_name, session_data)
+        self._update_forks(lecture_name, parent["session"], lambda forks: [name for name in forks if name != session_name])
+
+    def detach_forks(self, session_name, lecture_name=None):
+        """Materialize every fork of a session before its messages go away"""
+        if not lecture_name:
+            lecture_name = self.current_lecture
+
+        session_data = self.repository.get_session(lecture_name, session_name)
+        for fork_name in session_data.get("forks", []):
+            try:
+                self.materialize_fork(fork_name, lecture_name)
+            except SessionNotFoundError:
+                continue
+
+    def unlink_fork(self, session_name, lecture_name=None):
+        """Stop a fork from inheriting any messages (before it is cleared or deleted)"""
+        if not lecture_name:
+            lecture_name = self.current_lecture
+
+        with self.storage.session_lock(lecture_name, session_name):
+            session_data = self.repository.get_session(lecture_name, session_name)
+            parent = session_data.pop("parent", None)
+            if not parent:
+                return
+            self.repository.save_session(lecture_name, session_name, session_data)
+        self._update_forks(lecture_name, parent["session"], lambda forks: [name for name in forks if name != session_name])
 
     def update_lecture_sessions(self, lecture_name):
         """Update lecture's session list"""
-        lecture_path = os.path.join(self.lectures_dir, lecture_name)
-        if not os.path.exists(lecture_path):
-            return
-        
-        sessions = self.list_sessions(lecture_name)
-        
-        with open(os.path.join(lecture_path, "lecture_info.json"), 'r+') as f:
-            lecture_info = json.load(f)
-            lecture_info["sessions"] = sessions
-            f.seek(0)
-            json.dump(lecture_info, f, indent=2)
-            f.truncate()
-    
-    def get_status(self):
-        """Get status of all lectures and sessions"""
-        status = {
-            "directory_structure": {
+        with self.storage.lecture_lock(lecture_name):
+            lecture_info = self.repository.get_lecture(lecture_name)
+            if lecture_info is None:
+                return
+
+            lecture_info["sessions"] = self.list_sessions(lecture_name)
+            self.repository.save_lecture(lecture_name, lecture_info)
+
+    def flush(self):
+        """Write any pending session changes to storage"""
+        self.storage.flush()
+        self.extraction_cache.flush()
+
+    def convert_sessions(self, session_format, lecture_name=None):
+        """Convert every session (of one lecture, or of all lectures) to another storage format"""
+        if not isinstance(self.storage, FileStorageBackend):
+            return f"Session formats only apply to file storage (using {self.storage.name})"
+
+        converted = 0
+        total = 0
+        lecture_names = [lecture_name] if lecture_name else self.list_lectures()
+        for name in lecture_names:
+            for session_name in self.repository.list_sessions(name):
+                total += 1
+                try:
+                    if self.storage.convert_session(name, session_name, session_format):
+                        converted += 1
+                except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError, PermissionError):
+                    continue
+
+        # Keep writing new sessions in the chosen format
+        self.storage.session_format = session_format
+        return f"Converted {converted} of {total} sessions to {session_format} format"
+
+    def migrate_layout(self, layout):
+        """Move all lectures and sessions of the file backend into another directory layout"""
+        if not isinstance(self.storage, FileStorageBackend):
+            return f"Directory layouts only apply to file storage (using {self.storage.name})"
+        if layout == self.storage.layout:
+            return f"Already using the {layout} layout"
+
+        lectures, sessions = self.storage.migrate_layout(layout)
+        self.status_cache.clear()
+        return f"Moved {lectures} lectures and {sessions} sessions to the {layout} layout"
+
+    def migrate_storage(self, backend):
+        """Copy all lectures and sessions from the current storage backend into another one"""
+        target = create_storage_backend(backend, self.base_dir)
+        migrated = migrate_storage(self.storage, target)
+        return (
+            f"Migrated {migrated['lectures']} lectures, {migrated['sessions']} sessions and "
+            f"{migrated['messages']} messages from {self.storage.name} to {target.name} storage"
+        )
+
+    def get_status(self, lecture_name=None, fields=None):
+        """Get status of all lectures and sessions.
+
+        lecture_name limits the lectures reported, fields limits the top-level keys
+        returned (lectures, cache stats etc. are only gathered when asked for).
+        """
+        def wanted(field):
+            return fields is None or field in fields
+
+        status = {}
+        if wanted("directory_structure"):
+            status["directory_structure"] = {
                 "base": self.base_dir,
                 "lectures": self.lectures_dir,
                 "cache": self.cache_dir
-            },
-            "lectures": {},
-            "total_sessions": 0,
-            "total_estimated_tokens": 0,
-            "cache_stats": self.get_cache_stats()
-        }
-        
-        if os.path.exists(self.lectures_dir):
-            for lecture_name in self.list_lectures():
-                lecture_path = os.path.join(self.lectures_dir, lecture_name)
-                lecture_info = self.get_lecture_info(lecture_name)
-                
-                if lecture_info:
-                    lecture_status = {
-                        "name": lecture_name,
-                        "created_at": lecture_info.get("created_at", "Unknown"),
-                        "documents": lecture_info.get("documents", []),
-                        "directory": lecture_path,
-                        "sessions": {},
-                        "session_count": 0,
-                        "estimated_tokens": 0
-                    }
-                    
-                    # Process each session
-                    for session_name in self.list_sessions(lecture_name):
-                        session_path = os.path.join(lecture_path, "sessions", f"{session_name}.json")
-                        try:
-                            with open(session_path, 'r') as f:
-                                session_data = json.load(f)
-                                
-                                # Calculate estimated tokens
-                                messages = session_data.get("messages", [])
-                                total_chars = sum(len(msg.get('content', '')) for msg in messages)
-                                estimated_tokens = total_chars // 4
-                                
-                                session_status = {
-                                    "name": session_name,
-                                    "created_at": session_data.get("created_at", "Unknown"),
-                                    "model": session_data.get("model", "Unknown"),
-                                    "message_count": len(messages),
-                                    "estimated_tokens": estimated_tokens,
-                                    "documents": session_data.get("documents", []),
-                                    "lectures_referenced": session_data.get("lectures_referenced", []),
-                                    "file_path": session_path,
-                                    "summaries": session_data.get("summaries", [])
-                                }
-                                
-                                lecture_status["sessions"][session_name] = session_status
-                                lecture_status["session_count"] += 1
-                                lecture_status["estimated_tokens"] += estimated_tokens
-                                
-                        except Exception as e:
-                            lecture_status["sessions"][session_name] = {"error": str(e)}
-                    
-                    status["lectures"][lecture_name] = lecture_status
-                    status["total_sessions"] += lecture_status["session_count"]
-                    status["total_estimated_tokens"] += lecture_status["estimated_tokens"]
-        
+            }
+        if wanted("storage_backend"):
+            status["storage_backend"] = self.storage.name
+
+        if wanted("lectures") or wanted("total_sessions") or wanted("total_estimated_tokens"):
+            lectures = {}
+            lecture_names = [lecture_name] if lecture_name else self.list_lectures()
+            for name in lecture_names:
+                lecture_status = self.get_lecture_status(name)
+                if lecture_status:
+                    lectures[name] = lecture_status
+
+            if not lecture_name:
+                # Forget lectures that were deleted or renamed
+                for name in set(self.status_cache) - set(lecture_names):
+                    del self.status_cache[name]
+
+            if wanted("lectures"):
+                status["lectures"] = lectures
+            if wanted("total_sessions"):
+                status["total_sessions"] = sum(lecture["session_count"] for lecture in lectures.values())
+            if wanted("total_estimated_tokens"):
+                status["total_estimated_tokens"] = sum(lecture["estimated_tokens"] for lecture in lectures.values())
+
+        if wanted("cache_stats"):
+            status["cache_stats"] = self.get_cache_stats()
+
         return status
+
+    def get_lecture_status(self, lecture_name):
+        """Get status of a lecture and its sessions, reused while the storage signature is unchanged"""
+        signature = self.storage.lecture_signature(lecture_name)
+        cached = self.status_cache.get(lecture_name)
+        if signature is not None and cached is not None and cached[0] == signature:
+            return cached[1]
+
+        lecture_info = self.get_lecture_info(lecture_name)
+        if not lecture_info:
+            self.status_cache.pop(lecture_name, None)
+            return None
+
+        lecture_status = {
+            "name": lecture_name,
+            "created_at": lecture_info.get("created_at", "Unknown"),
+            "documents": lecture_info.get("documents", []),
+            "directory": self.storage.lecture_dir(lecture_name),
+            "sessions": {},
+            "session_count": 0,
+            "estimated_tokens": 0
+        }
+
+        # Process each session from the lecture's manifest
+        for session_name, session_data in self.storage.list_session_stats(lecture_name).items():
+            if "error" in session_data:
+                lecture_status["sessions"][session_name] = {"error": session_data["error"]}
+                continue
+
+            session_status = {
+                "name": session_name,
+                "created_at": session_data.get("created_at") or "Unknown",
+                "updated_at": session_data.get("updated_at") or "Unknown",
+                "model": session_data.get("model") or "Unknown",
+                "message_count": session_data["message_count"] + (session_data.get("parent") or {}).get("upto", 0),
+                "estimated_tokens": session_data["estimated_tokens"],
+                "documents": session_data.get("documents", []),
+                "lectures_referenced": session_data.get("lectures_referenced", []),
+                "file_path": self.storage.session_location(lecture_name, session_name),
+                "summary_count": session_data.get("summary_count", 0),
+                "archived": session_data.get("archived", False),
+                "forked_from": (session_data.get("parent") or {}).get("session")
+            }
+
+            lecture_status["sessions"][session_name] = session_status
+            lecture_status["session_count"] += 1
+            lecture_status["estimated_tokens"] += session_data["estimated_tokens"]
+
+        # Sign after reading: a manifest rebuilt while reading would otherwise never match
+        self.status_cache[lecture_name] = (self.storage.lecture_signature(lecture_name), lecture_status)
+        return lecture_status
     
     def get_cache_stats(self):
-        """Get statistics about the cache"""
-        stats = {
+        """Get statistics about the cache from its index (no directory scan)"""
+        stats = self.extraction_cache.stats()
+        lookups = stats["hits"] + stats["misses"]
+        return {
             "cache_dir": self.cache_dir,
-            "cache_files": 0,
-            "cache_size_mb": 0
+            "cache_files": stats["entries"],
+            "cache_size_mb": round(stats["bytes"] / (1024 * 1024), 2),
+            "cache_limit_mb": round(stats["max_bytes"] / (1024 * 1024), 2),
+            "hits": stats["hits"],
+            "misses": stats["misses"],
+            "hit_rate": round(stats["hits"] / lookups, 3) if lookups else None
         }
-        
-        if os.path.exists(self.cache_dir):
-            cache_files = os.listdir(self.cache_dir)
-            stats["cache_files"] = len(cache_files)
-            
-            total_size = 0
-            for file in cache_files:
-                file_path = os.path.join(self.cache_dir, file)
-                if os.path.isfile(file_path):
-                    total_size += os.path.getsize(file_path)
-            
-            stats["cache_size_mb"] = round(total_size / (1024 * 1024), 2)
-        
-        return stats
     
+    def archive_cache(self, cutoff):
+        """Gzip cached extractions not read or written since the cutoff timestamp; returns (files, bytes saved)"""
+        return self.extraction_cache.archive(cutoff)
+
+    def archive_inactive(self, days=ARCHIVE_AFTER_DAYS):
+        """Compress sessions and cached extractions untouched for the given number of days"""
+        cutoff = time.time() - days * 86400
+        self.storage.flush()
+        sessions, session_bytes = self.storage.archive_inactive_sessions(cutoff)
+        cache_files, cache_bytes = self.archive_cache(cutoff)
+        return {
+            "days": days,
+            "sessions": sessions,
+            "cache_files": cache_files,
+            "bytes_saved": session_bytes + cache_bytes
+        }
+
     def clear_cache(self):
         """Clear the document cache"""
-        if os.path.exists(self.cache_dir):
-            for file in os.listdir(self.cache_dir):
-                file_path = os.path.join(self.cache_dir, file)
-                if os.path.isfile(file_path):
-                    os.remove(file_path)
+        self.extraction_cache.clear()
         return "Cache cleared"
+
+    def collect_garbage(self, dry_run=False):
+        """Find session_docs folders, legacy documents, cached extractions, blobs and temp files nothing refers to and remove them unless dry_run"""
+        self.storage.flush()
+        cutoff = time.time() - GC_GRACE_SECONDS
+        garbage = {"session_docs": [], "docs": [], "cache": [], "temp": []}
+        live_blobs = set()
+        live_paths = []
+        unreadable = []
+
+        for lecture_name in self.list_lectures():
+            lecture_info = self.repository.get_lecture(lecture_name)
+            if lecture_info is None:
+                continue
+            owners = [(lecture_info, self.storage.docs_dir(lecture_name))]
+            sessions = set(self.list_sessions(lecture_name))
+            for session_name in sessions:
+                try:
+                    # Peeking keeps archived sessions archived, so gc changes nothing but what it deletes
+                    session_data = self.storage.peek_session(lecture_name, session_name)
+                except (OSError, EOFError, json.JSONDecodeError, UnicodeDecodeError):
+                    # An unreadable session may refer to any blob or cache entry, so those are left alone below
+                    unreadable.append(f"{lecture_name}/{session_name}")
+                    continue
+                owners.append((session_data, self.storage.session_docs_dir(lecture_name, session_name)))
+
+            session_docs_root = os.path.join(self.storage.lecture_dir(lecture_name), "session_docs")
+            if os.path.isdir(session_docs_root):
+                for entry in os.scandir(session_docs_root):
+                    if entry.is_dir() and entry.name not in sessions:
+                        garbage["session_docs"].append(entry.path)
+
+            for owner_data, legacy_dir in owners:
+                documents = owner_data.get("documents", [])
+                document_refs = owner_data.get("document_refs", {})
+                live_blobs.update(document_refs.values())
+                for doc_name in documents:
+                    doc_path = self.resolve_document_path(doc_name, document_refs, legacy_dir)
+                    if doc_path:
+                        live_paths.append(doc_path)
+
+                if not os.path.isdir(legacy_dir):
+                    continue
+                for entry in os.scandir(legacy_dir):
+                    if not entry.is_file():
+                        continue
+                    # A copy is dead once its document is removed or shadowed by a blob
+                    if (entry.name not in documents
+                            or self.resolve_document_path(entry.name, document_refs, legacy_dir) != entry.path):
+                        garbage["docs"].append(entry.path)
+
+        # Cache entries are keyed by content hash and extractor version, so only the current documents' keys are reachable
+        live_keys = {self.get_file_hash(path) for path in live_paths}
+        if os.path.exists(self.cache_dir) and not unreadable:
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(('.txt', '.txt.gz')) and entry.name.split('.', 1)[0] not in live_keys:
+                    garbage["cache"].append(entry.path)
+
+        for root, _, files in os.walk(self.base_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                if name.endswith('.tmp') and os.path.getmtime(path) < cutoff:
+                    garbage["temp"].append(path)
+
+        report = {"dry_run": dry_run, "bytes": 0, "unreadable_sessions": unreadable}
+        for category, paths in garbage.items():
+            sizes = [path_size(path) for path in paths]
+            if not dry_run:
+                for path in paths:
+                    if os.path.isdir(path):
+                        shutil.rmtree(path)
+                    elif category == "cache":
+                        self.extraction_cache.remove(os.path.basename(path))
+                    else:
+                        os.remove(path)
+            report[category] = {"paths": paths, "bytes": sum(sizes)}
+        self.extraction_cache.flush()
+
+        blobs = self.blobs.sweep(live_blobs, cutoff, dry_run) if not unreadable else []
+        report["blobs"] = {"paths": [path for path, _ in blobs], "bytes": sum(size for _, size in blobs)}
+
+        report["bytes"] = sum(report[category]["bytes"] for category in ("session_docs", "docs", "cache", "temp", "blobs"))
+        return report
     
     def set_model_parameter(self, param, value):
         """Set a model parameter for the current session/lecture"""
@@ -513,18 +3865,11 @@ class SilentDirectoryAssistant:
             
             # Update session data if a session is active
             if self.current_lecture and self.current_session:
-                lecture_path = os.path.join(self.lectures_dir, self.current_lecture)
-                sessions_path = os.path.join(lecture_path, "sessions")
-                session_path = os.path.join(sessions_path, f"{self.current_session}.json")
-                
                 try:
-                    with open(session_path, 'r') as f:
-                        session_data = json.load(f)
-                    
-                    session_data["model_params"] = self.model_params.copy()
-                    
-                    with open(session_path, 'w') as f:
-                        json.dump(session_data, f, indent=2)
+                    with self.storage.session_lock(self.current_lecture, self.current_session):
+                        session_data = self.repository.get_session(self.current_lecture, self.current_session)
+                        session_data["model_params"] = self.model_params.copy()
+                        self.repository.save_session(self.current_lecture, self.current_session, session_data)
                 except (PermissionError, OSError):
                     pass
             
@@ -578,11 +3923,24 @@ SUMMARY:
         if not self.current_lecture or not self.current_session:
             return []
         
-        # Get all messages
-        messages = self.get_session_history()
+        try:
+            session_data = self.repository.get_session(self.current_lecture, self.current_session)
+        except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError, PermissionError):
+            session_data = {}
+        
+        # Compacted messages are only represented by their consolidated summary
+        history_count = session_data.get("history_count", 0)
+        messages = self.get_session_history(offset=history_count)
+        history_summary = session_data.get("history_summary")
+        if history_summary:
+            messages = [{
+                "role": "system",
+                "content": f"Earlier in this conversation: {history_summary}",
+                "timestamp": datetime.now().isoformat()
+            }] + messages
         
         # If we have few messages, return them directly
-        if len(messages) <= self.max_context_messages:
+        if len(messages) <= self.max_context_messages + bool(history_summary):
             return messages
         
         # For long conversations, use the most recent messages and a summary of earlier ones
@@ -600,7 +3958,7 @@ SUMMARY:
         }
         
         # Save the summary to the session
-        self.save_summary(summary, 0, len(earlier_messages) - 1)
+        self.save_summary(summary, 0, history_count + len(earlier_messages) - bool(history_summary) - 1)
         
         # Return the context message followed by recent messages
         return [context_message] + recent_messages
@@ -610,172 +3968,184 @@ SUMMARY:
         if not self.current_lecture or not self.current_session:
             return
         
-        lecture_path = os.path.join(self.lectures_dir, self.current_lecture)
-        sessions_path = os.path.join(lecture_path, "sessions")
-        session_path = os.path.join(sessions_path, f"{self.current_session}.json")
-        
-        try:
-            with open(session_path, 'r', encoding='utf-8') as f:
-                session_data = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError, PermissionError):
-            session_data = {"name": self.current_session, "summaries": []}
+        with self.storage.session_lock(self.current_lecture, self.current_session):
+            try:
+                session_data = self.repository.get_session(self.current_lecture, self.current_session)
+            except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError, PermissionError):
+                session_data = {"name": self.current_session, "summaries": []}
         
-        summary_data = {
-            "summary": summary,
-            "start_index": start_index,
-            "end_index": end_index,
-            "timestamp": datetime.now().isoformat()
-        }
+            summary_data = {
+                "summary": summary,
+                "start_index": start_index,
+                "end_index": end_index,
+                "timestamp": datetime.now().isoformat()
+            }
         
-        if "summaries" not in session_data:
-            session_data["summaries"] = []
+            if "summaries" not in session_data:
+                session_data["summaries"] = []
         
-        session_data["summaries"].append(summary_data)
+            session_data["summaries"].append(summary_data)
         
-        with open(session_path, 'w') as f:
-            json.dump(session_data, f, indent=2)
+            self.repository.save_session(self.current_lecture, self.current_session, session_data)
     
     def list_summaries(self):
         """List conversation summaries for the current session"""
         if not self.current_lecture or not self.current_session:
             return []
         
-        lecture_path = os.path.join(self.lectures_dir, self.current_lecture)
-        sessions_path = os.path.join(lecture_path, "sessions")
-        session_path = os.path.join(sessions_path, f"{self.current_session}.json")
-        
         try:
-            with open(session_path, 'r') as f:
-                session_data = json.load(f)
-                return session_data.get("summaries", [])
+            session_data = self.repository.get_session(self.current_lecture, self.current_session)
+            return session_data.get("summaries", [])
         except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError, PermissionError):
             return []
     
+    def ocr_unit_chunks(self, document, unit, units):
+        """Yield a DocumentChunk per (index, text, image bytes list) unit, followed by the OCR of its images.
+
+        The images of all the units are OCR'd in one batch.
+        """
+        failed = []
+        ocr = self.ocr_images([((index, n), data) for index, _, images in units for n, data in enumerate(images)], failed)
+        failed_units = {index for index, _ in failed}
+        for index, text, _ in units:
+            for (image_index, _), img_text in ocr.items():
+                if image_index == index:
+                    text += f"\n--- OCR from {unit.capitalize()} {index} Image ---\n{img_text}\n"
+            yield DocumentChunk(document, unit, index, text, index not in failed_units)
+
+    def pdf_range_chunks(self, pdf_path, start, pages, images):
+        """Turn an extract_pdf_pages result into page chunks"""
+        units = [(start + offset + 1, page_text, []) for offset, page_text in enumerate(pages)]
+        for (page, _), data in images:
+            units[page - start - 1][2].append(data)
+        return self.ocr_unit_chunks(pdf_path, "page", units)
+
     def extract_pdf_text(self, pdf_path):
         """Extract text from PDF file with enhanced formatting"""
         # Check file size first
         self.check_file_size(pdf_path)
         self.check_memory_usage()
 
-        # Check cache first
-        cached_text = self.get_cached_text(pdf_path)
-        if cached_text is not None:
-            return cached_text
-
-        text = ""
         try:
-            with open(pdf_path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                
-                # Extract text with page numbers for better context
-                text_parts = []
-                for i, page in enumerate(reader.pages):
-                    page_text = page.extract_text()
-                    if page_text.strip():  # Only add if there's actual text
-                        text_parts.append(f"\n--- Page {i+1} ---\n")
-                        text_parts.append(page_text)
-                        text_parts.append("\n")
-
-                # Join all parts efficiently
-                text += "".join(text_parts)
-                
-                # Try to extract images from PDF and run OCR
-                try:
-                    for i, page in enumerate(reader.pages):
-                        if '/Resources' in page and '/XObject' in page['/Resources']:
-                            xObject = page['/Resources']['/XObject'].get_object()
-                            for obj in xObject:
-                                if xObject[obj]['/Subtype'] == '/Image':
-                                    try:
-                                        # Extract image data
-                                        data = xObject[obj]._data
-                                        # Create a temporary image file
-                                        temp_img = f"temp_img_{i}_{obj[1:]}.png"
-                                        with open(temp_img, "wb") as img_file:
-                                            img_file.write(data)
-                                        
-                                        # Run OCR on the image
-                                        img_text = self.extract_image_text(temp_img)
-                                        if img_text and not img_text.startswith("Error"):
-                                            text += f"\n--- OCR from Page {i+1} Image ---\n"
-                                            text += img_text + "\n"
-                                        
-                                        # Clean up temp file
-                                        os.remove(temp_img)
-                                    except (OSError, PermissionError, Exception):
-                                        # Continue if OCR image processing fails
-                                        continue
-                except Exception:
-                    # Continue if PDF image extraction fails
-                    pass
-                
-            # Cache the extracted text
-            self.cache_text(pdf_path, text)
-            return text
+            # Pages are read from the cache or extracted in CHUNK_SIZE ranges (in worker processes for large files),
+            # and cached one by one; there is no separate copy of the whole text
+            return "".join(chunk.text for chunk in self.iter_unit_chunks(pdf_path))
         except Exception as e:
             return f"Error extracting PDF text: {str(e)}"
+
+    def iter_ppt_chunks(self, ppt_path, slides=None, prs=None):
+        """Yield a PowerPoint file's slides (or only the given slide numbers) as DocumentChunks, OCR'ing the pictures of CHUNK_SIZE slides at a time"""
+        if prs is None:
+            prs = Presentation(ppt_path)
+
+        units = []
+        for i, slide in enumerate(prs.slides):
+            if slides is not None and i + 1 not in slides:
+                continue
+            # Extract text with slide numbers and titles
+            text_parts = [f"\n--- Slide {i+1} ---\n"]
+            images = []
+
+            # Try to get slide title
+            if slide.shapes.title:
+                text_parts.append(f"Title: {slide.shapes.title.text}\n")
+
+            # Extract text from all shapes, collecting pictures for OCR
+            for shape in slide.shapes:
+                if hasattr(shape, "text"):
+                    shape_text = shape.text.strip()
+                    if shape_text:
+                        text_parts.append(shape_text)
+                        text_parts.append("\n")
+                if shape.shape_type == 13:  # Shape type for pictures
+                    try:
+                        images.append(shape.image.blob)
+                    except Exception:
+                        continue
+
+            units.append((i + 1, "".join(text_parts), images))
+            if len(units) == CHUNK_SIZE:
+                yield from self.ocr_unit_chunks(ppt_path, "slide", units)
+                units = []
+        yield from self.ocr_unit_chunks(ppt_path, "slide", units)
     
     def extract_ppt_text(self, ppt_path):
         """Extract text from PowerPoint file with enhanced formatting"""
-        # Check cache first
-        cached_text = self.get_cached_text(ppt_path)
-        if cached_text is not None:
-            return cached_text
-            
-        text = ""
         try:
-            prs = Presentation(ppt_path)
-            
-            # Extract text with slide numbers and titles
-            text_parts = []
-            for i, slide in enumerate(prs.slides):
-                text_parts.append(f"\n--- Slide {i+1} ---\n")
-
-                # Try to get slide title
-                if slide.shapes.title:
-                    text_parts.append(f"Title: {slide.shapes.title.text}\n")
-
-                # Extract text from all shapes
-                for shape in slide.shapes:
-                    if hasattr(shape, "text"):
-                        shape_text = shape.text.strip()
-                        if shape_text:
-                            text_parts.append(shape_text)
-                            text_parts.append("\n")
-
-            # Join all parts efficiently
-            text = "".join(text_parts)
-
-            # Try to extract images from slides and run OCR
-            try:
-                for shape in slide.shapes:
-                    if shape.shape_type == 13:  # Shape type for pictures
-                        try:
-                            # Get image data
-                            image = shape.image
-                            # Create a temporary image file
-                            temp_img = f"temp_img_{i}_{shape.shape_id}.png"
-                            with open(temp_img, "wb") as img_file:
-                                img_file.write(image.blob)
-
-                            # Run OCR on the image
-                            img_text = self.extract_image_text(temp_img)
-                            if img_text and not img_text.startswith("Error"):
-                                text += f"\n--- OCR from Slide {i+1} Image ---\n"
-                                text += img_text + "\n"
-
-                            # Clean up temp file
-                            os.remove(temp_img)
-                        except (OSError, PermissionError, Exception):
-                            continue
-            except Exception:
-                pass
-                
-            # Cache the extracted text
-            self.cache_text(ppt_path, text)
-            return text
+            # Slides are read from the cache or extracted, and cached one by one
+            return "".join(chunk.text for chunk in self.iter_unit_chunks(ppt_path))
         except Exception as e:
             return f"Error extracting PowerPoint text: {str(e)}"
+
+    def iter_docx_chunks(self, docx_path):
+        """Yield a Word document as DocumentChunks: sections (split at headings), tables, then OCR'd images"""
+        doc = Document(docx_path)
+
+        # Extract document properties
+        text = ""
+        core_props = doc.core_properties
+        if core_props.title:
+            text += f"Title: {core_props.title}\n"
+        if core_props.author:
+            text += f"Author: {core_props.author}\n"
+        if core_props.subject:
+            text += f"Subject: {core_props.subject}\n"
+        text += "\n"
+
+        # Extract paragraphs with style information
+        section = 1
+        has_paragraphs = False
+        for para in doc.paragraphs:
+            if para.text.strip():
+                style_name = para.style.name.lower()
+
+                # Headings and titles start a new section
+                if ("heading" in style_name or "title" in style_name) and has_paragraphs:
+                    yield DocumentChunk(docx_path, "section", section, text)
+                    section += 1
+                    text = ""
+                has_paragraphs = True
+
+                # Add formatting based on style
+                if "heading" in style_name:
+                    # Extract heading level
+                    level = re.search(r'heading (\d+)', style_name)
+                    if level:
+                        heading_level = int(level.group(1))
+                        text += f"\n{'#' * heading_level} {para.text}\n\n"
+                    else:
+                        text += f"\n{para.text}\n\n"
+                elif "title" in style_name:
+                    text += f"\n# {para.text}\n\n"
+                else:
+                    text += para.text + "\n\n"
+        yield DocumentChunk(docx_path, "section", section, text)
+
+        # Extract tables
+        for i, table in enumerate(doc.tables):
+            text = f"\n--- Table {i+1} ---\n"
+            for row in table.rows:
+                row_text = []
+                for cell in row.cells:
+                    row_text.append(cell.text.strip())
+                text += " | ".join(row_text) + "\n"
+            text += "\n"
+            yield DocumentChunk(docx_path, "table", i + 1, text)
+
+        # Try to extract images and run OCR
+        images = []
+        try:
+            rels = doc.part.rels
+            for rel in rels:
+                if "image" in rels[rel].target_ref:
+                    try:
+                        images.append(((len(images) + 1, rel), rels[rel].target_part.blob))
+                    except Exception:
+                        continue
+        except Exception:
+            pass
+        for (image_index, _), img_text in self.ocr_images(images).items():
+            yield DocumentChunk(docx_path, "image", image_index, f"\n--- OCR from Document Image ---\n{img_text}\n")
     
     def extract_docx_text(self, docx_path):
         """Extract text from Word document with enhanced formatting"""
@@ -784,80 +4154,31 @@ SUMMARY:
         if cached_text is not None:
             return cached_text
             
-        text = ""
         try:
-            doc = Document(docx_path)
-            
-            # Extract document properties
-            core_props = doc.core_properties
-            if core_props.title:
-                text += f"Title: {core_props.title}\n"
-            if core_props.author:
-                text += f"Author: {core_props.author}\n"
-            if core_props.subject:
-                text += f"Subject: {core_props.subject}\n"
-            text += "\n"
-            
-            # Extract paragraphs with style information
-            for para in doc.paragraphs:
-                if para.text.strip():
-                    style_name = para.style.name.lower()
-                    
-                    # Add formatting based on style
-                    if "heading" in style_name:
-                        # Extract heading level
-                        level = re.search(r'heading (\d+)', style_name)
-                        if level:
-                            heading_level = int(level.group(1))
-                            text += f"\n{'#' * heading_level} {para.text}\n\n"
-                        else:
-                            text += f"\n{para.text}\n\n"
-                    elif "title" in style_name:
-                        text += f"\n# {para.text}\n\n"
-                    else:
-                        text += para.text + "\n\n"
-            
-            # Extract tables
-            for i, table in enumerate(doc.tables):
-                text += f"\n--- Table {i+1} ---\n"
-                for row in table.rows:
-                    row_text = []
-                    for cell in row.cells:
-                        row_text.append(cell.text.strip())
-                    text += " | ".join(row_text) + "\n"
-                text += "\n"
-            
-            # Try to extract images and run OCR
-            try:
-                rels = doc.part.rels
-                for rel in rels:
-                    if "image" in rels[rel].target_ref:
-                        try:
-                            # Get image data
-                            image_part = rels[rel].target_part
-                            # Create a temporary image file
-                            temp_img = f"temp_img_{rel}.png"
-                            with open(temp_img, "wb") as img_file:
-                                img_file.write(image_part.blob)
-                            
-                            # Run OCR on the image
-                            img_text = self.extract_image_text(temp_img)
-                            if img_text and not img_text.startswith("Error"):
-                                text += f"\n--- OCR from Document Image ---\n"
-                                text += img_text + "\n"
-                            
-                            # Clean up temp file
-                            os.remove(temp_img)
-                        except (OSError, PermissionError, Exception):
-                            continue
-            except Exception:
-                pass
+            text = "".join(chunk.text for chunk in self.iter_docx_chunks(docx_path))
             
             # Cache the extracted text
             self.cache_text(docx_path, text)
             return text
         except Exception as e:
             return f"Error extracting Word document text: {str(e)}"
+
+    def iter_txt_chunks(self, txt_path):
+        """Yield a plain text file as DocumentChunks of whole lines, about TEXT_SECTION_CHARS characters each"""
+        section = 1
+        lines = []
+        size = 0
+        with open(txt_path, 'r', encoding='utf-8') as file:
+            for line in file:
+                lines.append(line)
+                size += len(line)
+                if size >= TEXT_SECTION_CHARS:
+                    yield DocumentChunk(txt_path, "section", section, "".join(lines))
+                    section += 1
+                    lines = []
+                    size = 0
+        if lines or section == 1:
+            yield DocumentChunk(txt_path, "section", section, "".join(lines))
     
     def extract_txt_text(self, txt_path):
         """Extract text from a plain text file"""
@@ -867,13 +4188,46 @@ SUMMARY:
             return cached_text
             
         try:
-            with open(txt_path, 'r', encoding='utf-8') as file:
-                text = file.read()
-                # Cache the extracted text
-                self.cache_text(txt_path, text)
-                return text
+            text = "".join(chunk.text for chunk in self.iter_txt_chunks(txt_path))
+            # Cache the extracted text
+            self.cache_text(txt_path, text)
+            return text
         except Exception as e:
             return f"Error reading text file: {str(e)}"
+
+    def iter_md_chunks(self, md_path):
+        """Yield a Markdown file as DocumentChunks, one section per header"""
+        section = 1
+        structured_text = ""
+        with open(md_path, 'r', encoding='utf-8') as file:
+            for line in file.read().split('\n'):
+                # Headers start a new section
+                if line.startswith(('# ', '## ', '### ')) and structured_text.strip():
+                    yield DocumentChunk(md_path, "section", section, structured_text)
+                    section += 1
+                    structured_text = ""
+
+                # Add markdown structure indicators
+                # Headers
+                if line.startswith('# '):
+                    structured_text += f"\n# {line[2:]}\n\n"
+                elif line.startswith('## '):
+                    structured_text += f"\n## {line[3:]}\n\n"
+                elif line.startswith('### '):
+                    structured_text += f"\n### {line[4:]}\n\n"
+                # Lists
+                elif line.startswith('- ') or line.startswith('* '):
+                    structured_text += f"- {line[2:]}\n"
+                # Code blocks
+                elif line.startswith('```'):
+                    structured_text += "\n--- Code Block ---\n"
+                # Regular text
+                elif line.strip():
+                    structured_text += line + "\n"
+                # Empty lines
+                else:
+                    structured_text += "\n"
+        yield DocumentChunk(md_path, "section", section, structured_text)
     
     def extract_md_text(self, md_path):
         """Extract text from a Markdown file with enhanced formatting"""
@@ -883,46 +4237,44 @@ SUMMARY:
             return cached_text
             
         try:
-            with open(md_path, 'r', encoding='utf-8') as file:
-                md_content = file.read()
+            structured_text = "".join(chunk.text for chunk in self.iter_md_chunks(md_path))
                 
-                # Convert markdown to plain text while preserving structure
-                html = markdown.markdown(md_content)
-                
-                # Simple HTML to text conversion
-                text = re.sub(r'<[^>]+>', '', html)  # Remove HTML tags
-                
-                # Add markdown structure indicators
-                lines = md_content.split('\n')
-                structured_text = ""
-                
-                for line in lines:
-                    # Headers
-                    if line.startswith('# '):
-                        structured_text += f"\n# {line[2:]}\n\n"
-                    elif line.startswith('## '):
-                        structured_text += f"\n## {line[3:]}\n\n"
-                    elif line.startswith('### '):
-                        structured_text += f"\n### {line[4:]}\n\n"
-                    # Lists
-                    elif line.startswith('- ') or line.startswith('* '):
-                        structured_text += f"- {line[2:]}\n"
-                    # Code blocks
-                    elif line.startswith('```'):
-                        structured_text += "\n--- Code Block ---\n"
-                    # Regular text
-                    elif line.strip():
-                        structured_text += line + "\n"
-                    # Empty lines
-                    else:
-                        structured_text += "\n"
-                
-                # Cache the extracted text
-                self.cache_text(md_path, structured_text)
-                return structured_text
+            # Cache the extracted text
+            self.cache_text(md_path, structured_text)
+            return structured_text
         except Exception as e:
             return f"Error reading Markdown file: {str(e)}"
     
+    def ocr_images(self, images, failed=None):
+        """OCR (position, image bytes) pairs in memory; returns {position: text} in input order for images that have text.
+
+        Positions whose OCR failed are appended to the failed list, if one is given.
+        """
+        if not images:
+            return {}
+
+        data = [image for _, image in images]
+        texts = None
+        if len(images) > 1 and self.ocr_workers > 1:
+            with self._ocr_lock:
+                if self.ocr_pool is None:
+                    self.ocr_pool = ProcessPoolExecutor(max_workers=self.ocr_workers)
+                pool = self.ocr_pool
+            try:
+                texts = list(pool.map(image_bytes_text, data))
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); start a fresh pool next time and finish here
+                with self._ocr_lock:
+                    if self.ocr_pool is pool:
+                        self.ocr_pool = None
+        if texts is None:
+            texts = [image_bytes_text(image) for image in data]
+
+        if failed is not None:
+            failed.extend(position for (position, _), text in zip(images, texts) if text.startswith("Error"))
+        return {position: text for (position, _), text in zip(images, texts)
+                if text and not text.startswith("Error")}
+
     def extract_image_text(self, image_path):
         """Extract text from an image using OCR"""
         # Check cache first
@@ -930,23 +4282,176 @@ SUMMARY:
         if cached_text is not None:
             return cached_text
             
-        try:
-            # Open the image
-            img = Image.open(image_path)
-            
-            # Preprocess the image for better OCR
-            # Convert to grayscale
-            img = img.convert('L')
-            
-            # Use pytesseract to extract text
-            text = pytesseract.image_to_string(img)
-            
+        text = image_file_text(image_path)
+        if not text.startswith("Error extracting text from image"):
             # Cache the extracted text
             self.cache_text(image_path, text)
-            return text
-        except Exception as e:
-            return f"Error extracting text from image: {str(e)}"
+        return text
     
+    def unit_cache_key(self, file_path, unit, index):
+        """Get the cache key of one page or slide: content hash, extractor version, unit and index"""
+        return f"{self.get_file_hash(file_path)}.{unit}{index}"
+
+    def cache_units(self, file_path, chunks, count=None):
+        """Cache the complete chunks of a document one by one (and its page or slide count)"""
+        for chunk in chunks:
+            if chunk.complete:
+                self.extraction_cache.put(self.unit_cache_key(file_path, chunk.unit, chunk.index), chunk.text)
+        if count is not None:
+            self.extraction_cache.put(f"{self.get_file_hash(file_path)}.units", str(count))
+
+    def open_units_document(self, file_path, files):
+        """Parse a PDF (its file is kept open on the files ExitStack) or a PowerPoint file for unit_count and extract_units"""
+        if file_path.lower().endswith('.pdf'):
+            return PyPDF2.PdfReader(files.enter_context(open(file_path, 'rb')))
+        return Presentation(file_path)
+
+    def unit_count(self, file_path, document=None):
+        """Get the number of pages of a PDF or slides of a PowerPoint file (cached with its units)"""
+        cached = self.extraction_cache.get(f"{self.get_file_hash(file_path)}.units")
+        if cached is not None and cached.isdigit():
+            return int(cached)
+
+        with ExitStack() as files:
+            if document is None:
+                document = self.open_units_document(file_path, files)
+            count = len(document.pages if file_path.lower().endswith('.pdf') else document.slides)
+        self.cache_units(file_path, [], count)
+        return count
+
+    def extract_units(self, file_path, unit, indexes, document):
+        """Extract the given pages or slides (ascending, from 1) of an open_units_document as DocumentChunks"""
+        if unit == "slide":
+            yield from self.iter_ppt_chunks(file_path, set(indexes), document)
+            return
+
+        # Runs of consecutive pages are parsed together
+        for run_start, run_end in self.page_runs(indexes):
+            yield from self.pdf_range_chunks(
+                file_path, run_start - 1, *pdf_reader_pages(document, run_start - 1, run_end)
+            )
+
+    def page_runs(self, indexes):
+        """Group ascending page numbers into (first, last) runs of consecutive pages"""
+        runs = []
+        for index in indexes:
+            if runs and runs[-1][1] == index - 1:
+                runs[-1] = (runs[-1][0], index)
+            else:
+                runs.append((index, index))
+        return runs
+
+    def iter_unit_chunks(self, file_path, start=1, end=None):
+        """Yield pages start..end (from 1, inclusive) of a PDF, or those slides of a PowerPoint file, as DocumentChunks.
+
+        Each page or slide is cached on its own under its content hash, unit,
+        index and EXTRACTOR_VERSION; only the ones missing from the cache are
+        extracted, CHUNK_SIZE at a time (in worker processes when many pages of
+        a PDF are missing). Raises ValueError for other types.
+        """
+        unit = UNIT_TYPES.get(os.path.splitext(file_path)[1].lower())
+        if unit is None:
+            raise ValueError("Page ranges are only available for PDF and PowerPoint files")
+
+        files = ExitStack()
+        pool = None
+        try:
+            # The file is parsed at most once, on the first page or slide missing from the cache
+            document = None
+            if not self.extraction_cache.contains(f"{self.get_file_hash(file_path)}.units"):
+                document = self.open_units_document(file_path, files)
+            count = self.unit_count(file_path, document)
+            end = count if end is None else min(end, count)
+            windows = [list(range(window_start, min(window_start + CHUNK_SIZE, end + 1)))
+                       for window_start in range(max(start, 1), end + 1, CHUNK_SIZE)]
+
+            # Many uncached PDF pages are extracted by worker processes, a window per worker ahead of the reader
+            workers = min(self.pdf_workers, len(windows))
+            if unit == "page" and workers > 1:
+                uncached = [index for indexes in windows for index in indexes
+                            if not self.extraction_cache.contains(self.unit_cache_key(file_path, unit, index))]
+                if len(uncached) >= PDF_PARALLEL_MIN_PAGES:
+                    pool = ProcessPoolExecutor(max_workers=workers)
+            prefetched = {}
+
+            for position, indexes in enumerate(windows):
+                if pool is not None:
+                    for ahead in windows[position:position + workers]:
+                        if ahead[0] not in prefetched:
+                            missing = [index for index in ahead
+                                       if not self.extraction_cache.contains(self.unit_cache_key(file_path, unit, index))]
+                            prefetched[ahead[0]] = [
+                                (run_start, pool.submit(extract_pdf_pages, file_path, run_start - 1, run_end))
+                                for run_start, run_end in self.page_runs(missing)
+                            ]
+
+                chunks = {}
+                for index in indexes:
+                    text = self.extraction_cache.get(self.unit_cache_key(file_path, unit, index))
+                    if text is not None:
+                        chunks[index] = DocumentChunk(file_path, unit, index, text)
+
+                runs = prefetched.pop(indexes[0], [])
+                missing = [index for index in indexes if index not in chunks]
+                if missing:
+                    extracted = [
+                        chunk
+                        for run_start, future in runs
+                        for chunk in self.pdf_range_chunks(file_path, run_start - 1, *future.result())
+                        if chunk.index in missing
+                    ]
+                    # Pages dropped from the cache after they were checked are extracted here
+                    done = {chunk.index for chunk in extracted}
+                    left = [index for index in missing if index not in done]
+                    if left:
+                        if document is None:
+                            document = self.open_units_document(file_path, files)
+                        extracted.extend(self.extract_units(file_path, unit, left, document))
+                    self.cache_units(file_path, extracted)
+                    chunks.update((chunk.index, chunk) for chunk in extracted)
+
+                for index in indexes:
+                    yield chunks[index]
+        finally:
+            files.close()
+            if pool is not None:
+                # A reader that stops early does not wait for pages it will never read
+                pool.shutdown(wait=False, cancel_futures=True)
+            # The index is written once per read rather than once per page
+            self.extraction_cache.flush()
+
+    def iter_document_chunks(self, file_path):
+        """Yield a document's extracted text as DocumentChunks, so readers can stop early.
+
+        PDF and PowerPoint files come back page by page or slide by slide, read
+        from the cache where possible; text already cached for another whole
+        document comes back as a single "document" chunk. Raises ValueError for
+        unsupported types, and whatever the extractor raises for unreadable files.
+        """
+        file_ext = os.path.splitext(file_path)[1].lower()
+        if file_ext in UNIT_TYPES:
+            yield from self.iter_unit_chunks(file_path)
+            return
+
+        cached_text = self.get_cached_text(file_path)
+        if cached_text is not None:
+            yield DocumentChunk(file_path, "document", 1, cached_text)
+            return
+
+        if file_ext == '.docx':
+            yield from self.iter_docx_chunks(file_path)
+        elif file_ext == '.txt':
+            yield from self.iter_txt_chunks(file_path)
+        elif file_ext == '.md':
+            yield from self.iter_md_chunks(file_path)
+        elif file_ext in ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.gif']:
+            text = self.extract_image_text(file_path)
+            if text.startswith("Error"):
+                raise ValueError(text)
+            yield DocumentChunk(file_path, "image", 1, text)
+        else:
+            raise ValueError(f"Unsupported document type: {file_ext}")
+
     def extract_document_text(self, file_path):
         """Extract text from various document types with enhanced formatting"""
         if not os.path.exists(file_path):
@@ -969,6 +4474,85 @@ SUMMARY:
         else:
             return f"Unsupported document type: {file_ext}"
     
+    def attach_document(self, owner_data, doc_name, blob_id):
+        """Reference a stored blob as a document of lecture or session data"""
+        document_refs = owner_data.setdefault("document_refs", {})
+        old_blob_id = document_refs.get(doc_name)
+        if old_blob_id != blob_id:
+            self.blobs.add_ref(blob_id)
+            document_refs[doc_name] = blob_id
+            # Re-uploading a document under the same name replaces its content
+            if old_blob_id:
+                self.blobs.release(old_blob_id)
+
+        if doc_name not in owner_data.get("documents", []):
+            owner_data.setdefault("documents", []).append(doc_name)
+
+    def release_documents(self, owner_data):
+        """Drop the blob references held by lecture or session data that is being deleted"""
+        if not owner_data:
+            return
+        for blob_id in owner_data.get("document_refs", {}).values():
+            self.blobs.release(blob_id)
+
+    def resolve_document_path(self, doc_name, document_refs, legacy_dir):
+        """Get the path of a document: its blob, or a copy in legacy_dir from before the blob store"""
+        blob_id = document_refs.get(doc_name)
+        if blob_id:
+            blob_path = self.blobs.blob_path(blob_id)
+            if os.path.exists(blob_path):
+                return blob_path
+
+        legacy_path = os.path.join(legacy_dir, doc_name)
+        if os.path.exists(legacy_path):
+            return legacy_path
+        return None
+
+    def ingest_document(self, doc_name, owner_data):
+        """Start extracting an attached document in the background"""
+        self.ingestion.enqueue(self.blobs.blob_path(owner_data["document_refs"][doc_name]))
+
+    def find_document(self, lecture_name, doc_name, session_name=None):
+        """Get the path of a lecture's (or a session's) document, or None"""
+        if session_name:
+            owner_data = self.repository.get_session(lecture_name, session_name)
+            legacy_dir = self.storage.session_docs_dir(lecture_name, session_name)
+        else:
+            owner_data = self.repository.get_lecture(lecture_name) or {}
+            legacy_dir = self.storage.docs_dir(lecture_name)
+
+        if doc_name not in owner_data.get("documents", []):
+            return None
+        return self.resolve_document_path(doc_name, owner_data.get("document_refs", {}), legacy_dir)
+
+    def get_document_units(self, lecture_name, doc_name, start=1, end=None, session_name=None):
+        """Get pages start..end of a PDF document (or slides of a slide deck) as DocumentChunks, or None if there is no such document"""
+        doc_path = self.find_document(lecture_name, doc_name, session_name)
+        if doc_path is None:
+            return None
+        return list(self.iter_unit_chunks(doc_path, start, end))
+
+    def document_status(self, lecture_name, session_name=None):
+        """Get the ingestion status of a lecture's (or a session's) documents: {name: {"status", "error", "updated_at"}}"""
+        if session_name:
+            owner_data = self.repository.get_session(lecture_name, session_name)
+            legacy_dir = self.storage.session_docs_dir(lecture_name, session_name)
+        else:
+            owner_data = self.repository.get_lecture(lecture_name) or {}
+            legacy_dir = self.storage.docs_dir(lecture_name)
+
+        statuses = {}
+        for doc_name in owner_data.get("documents", []):
+            doc_path = self.resolve_document_path(doc_name, owner_data.get("document_refs", {}), legacy_dir)
+            job = self.ingestion.status(doc_path) if doc_path else None
+            if job is None:
+                # Not queued by this process: ready if an earlier extraction is cached
+                cached = doc_path is not None and self.has_cached_text(doc_path)
+                job = {"status": "ready" if cached else "missing" if doc_path is None else "not_extracted",
+                       "error": None, "updated_at": None}
+            statuses[doc_name] = job
+        return statuses
+
     def add_document_to_lecture(self, file_path):
         """Add a document to the current lecture (available to all sessions)"""
         if not self.current_lecture:
@@ -977,25 +4561,16 @@ SUMMARY:
         if not os.path.exists(file_path):
             return f"File not found: {file_path}"
         
-        lecture_path = os.path.join(self.lectures_dir, self.current_lecture)
-        docs_path = os.path.join(lecture_path, "docs")
-        
-        # Copy file to docs directory
-        dest_path = os.path.join(docs_path, os.path.basename(file_path))
-        shutil.copy2(file_path, dest_path)
-        
-        # Update lecture info
-        lecture_info_path = os.path.join(lecture_path, "lecture_info.json")
-        with open(lecture_info_path, 'r') as f:
-            lecture_info = json.load(f)
-        
-        # Add document to the list if not already there
-        doc_name = os.path.basename(file_path)
-        if doc_name not in lecture_info.get("documents", []):
-            lecture_info["documents"].append(doc_name)
-        
-        with open(lecture_info_path, 'w') as f:
-            json.dump(lecture_info, f, indent=2)
+        # Store the content once and reference it from the lecture info
+        return self.attach_to_lecture(os.path.basename(file_path), self.blobs.add(file_path))
+
+    def attach_to_lecture(self, doc_name, blob_id):
+        """Add a stored blob to the current lecture as a document"""
+        with self.storage.lecture_lock(self.current_lecture):
+            lecture_info = self.repository.get_lecture(self.current_lecture)
+            self.attach_document(lecture_info, doc_name, blob_id)
+            self.repository.save_lecture(self.current_lecture, lecture_info)
+        self.ingest_document(doc_name, lecture_info)
         
         return f"Added document '{doc_name}' to lecture '{self.current_lecture}' (available to all sessions)"
     
@@ -1007,40 +4582,44 @@ SUMMARY:
         if not os.path.exists(file_path):
             return f"File not found: {file_path}"
         
-        lecture_path = os.path.join(self.lectures_dir, self.current_lecture)
-        sessions_path = os.path.join(lecture_path, "sessions")
-        session_path = os.path.join(sessions_path, f"{self.current_session}.json")
-        
-        # Create session-specific docs directory if it doesn't exist
-        session_docs_dir = os.path.join(lecture_path, "session_docs", self.current_session)
-        if not os.path.exists(session_docs_dir):
-            os.makedirs(session_docs_dir)
-        
-        # Copy file to session-specific docs directory
-        dest_path = os.path.join(session_docs_dir, os.path.basename(file_path))
-        shutil.copy2(file_path, dest_path)
-        
-        # Update session info
-        with open(session_path, 'r') as f:
-            session_data = json.load(f)
-        
-        # Add document to the list if not already there
-        doc_name = os.path.basename(file_path)
-        if doc_name not in session_data.get("documents", []):
-            session_data["documents"].append(doc_name)
-        
-        with open(session_path, 'w') as f:
-            json.dump(session_data, f, indent=2)
+        # Store the content once and reference it from the session
+        return self.attach_to_session(os.path.basename(file_path), self.blobs.add(file_path))
+
+    def attach_to_session(self, doc_name, blob_id):
+        """Add a stored blob to the current session as a document"""
+        with self.storage.session_lock(self.current_lecture, self.current_session):
+            session_data = self.repository.get_session(self.current_lecture, self.current_session)
+            self.attach_document(session_data, doc_name, blob_id)
+            self.repository.save_session(self.current_lecture, self.current_session, session_data)
+        self.ingest_document(doc_name, session_data)
         
         return f"Added document '{doc_name}' to session '{self.current_session}' (available only to this session)"
+
+    def add_uploaded_document(self, stream, filename):
+        """Add an upload to the current session (or lecture, if no session is selected) without an intermediate copy.
+
+        stream is a StagedFile the upload was spooled into, or any binary
+        stream, which is then written into the blob store once.
+        """
+        if not self.current_lecture:
+            return "No lecture selected"
+
+        ext = os.path.splitext(filename)[1]
+        if isinstance(stream, StagedFile):
+            blob_id = self.blobs.add_staged(stream, ext)
+        else:
+            blob_id = self.blobs.add_stream(stream, ext)
+
+        if self.current_session:
+            return self.attach_to_session(filename, blob_id)
+        return self.attach_to_lecture(filename, blob_id)
     
     def analyze_lecture(self, lecture_name, question):
         """Analyze a specific lecture document"""
         if not self.current_lecture:
             return "No lecture selected"
         
-        lecture_path = os.path.join(self.lectures_dir, lecture_name)
-        if not os.path.exists(lecture_path):
+        if not self.repository.lecture_exists(lecture_name):
             return f"Lecture not found: {lecture_name}"
         
         # Get lecture info
@@ -1053,27 +4632,25 @@ SUMMARY:
         
         # If we're in a session, include session-specific documents
         if self.current_session:
-            session_path = os.path.join(lecture_path, "sessions", f"{self.current_session}.json")
-            if os.path.exists(session_path):
-                with open(session_path, 'r') as f:
-                    session_data = json.load(f)
-                    session_docs = session_data.get("documents", [])
-                    
-                    # Add session-specific documents
-                    for doc in session_docs:
-                        session_docs_dir = os.path.join(lecture_path, "session_docs", self.current_session)
-                        doc_path = os.path.join(session_docs_dir, doc)
-                        if os.path.exists(doc_path):
-                            docs_to_analyze.append(doc_path)
+            if self.repository.session_exists(lecture_name, self.current_session):
+                session_data = self.repository.get_session(lecture_name, self.current_session)
+                session_docs = session_data.get("documents", [])
+                session_docs_dir = self.storage.session_docs_dir(lecture_name, self.current_session)
+                
+                # Add session-specific documents
+                for doc in session_docs:
+                    doc_path = self.resolve_document_path(doc, session_data.get("document_refs", {}), session_docs_dir)
+                    if doc_path:
+                        docs_to_analyze.append((doc, doc_path))
         
         # Add lecture-level documents (available to all sessions)
         lecture_docs = lecture_info.get("documents", [])
-        docs_path = os.path.join(lecture_path, "docs")
+        docs_path = self.storage.docs_dir(lecture_name)
         
         for doc in lecture_docs:
-            doc_path = os.path.join(docs_path, doc)
-            if os.path.exists(doc_path):
-                docs_to_analyze.append(doc_path)
+            doc_path = self.resolve_document_path(doc, lecture_info.get("document_refs", {}), docs_path)
+            if doc_path:
+                docs_to_analyze.append((doc, doc_path))
         
         if not docs_to_analyze:
             return "No documents found for analysis"
@@ -1082,24 +4659,33 @@ SUMMARY:
         self.check_memory_usage()
 
         # Check file sizes for all documents
-        for doc_path in docs_to_analyze:
+        for doc_name, doc_path in docs_to_analyze:
             self.check_file_size(doc_path)
 
-        # Extract text from all documents
+        # Extract text from the documents until the context is full; later pages and documents are never parsed
         text_parts = []
-        for doc_path in docs_to_analyze:
-            doc_name = os.path.basename(doc_path)
-            extracted_text = self.extract_document_text(doc_path)
-
-            # Only add if extraction was successful
-            if not extracted_text.startswith("Error"):
-                text_parts.append(f"\n--- Document: {doc_name} ---\n")
-                text_parts.append(extracted_text)
-                text_parts.append("\n")
-            else:
-                text_parts.append(f"\n--- Error processing document: {doc_name} ---\n")
-                text_parts.append(extracted_text)
-                text_parts.append("\n")
+        length = 0
+        for doc_name, doc_path in docs_to_analyze:
+            if length >= MAX_CONTEXT_LENGTH:
+                break
+            # Not waiting on ingestion: units the worker has cached are read back, and missing ones extracted here
+            doc_parts = [f"\n--- Document: {doc_name} ---\n"]
+            doc_length = len(doc_parts[0])
+            chunks = self.iter_document_chunks(doc_path)
+            try:
+                for chunk in chunks:
+                    doc_parts.append(chunk.text)
+                    doc_length += len(chunk.text)
+                    if length + doc_length >= MAX_CONTEXT_LENGTH:
+                        break
+            except Exception as e:
+                doc_parts = [f"\n--- Error processing document: {doc_name} ---\n", f"Error extracting text: {str(e)}"]
+                doc_length = sum(len(part) for part in doc_parts)
+            finally:
+                chunks.close()
+            text_parts.extend(doc_parts)
+            text_parts.append("\n")
+            length += doc_length + 1
 
         # Join all parts efficiently
         all_text = "".join(text_parts)
@@ -1133,9 +4719,10 @@ Be thorough and detailed in your response.
                 options=self.model_params
             )
             
-            # Save to session
-            self.save_message("user", f"Analyzed lecture: {lecture_name}\nQuestion: {question}", lecture_name)
-            self.save_message("assistant", response['message']['content'], lecture_name)
+            # Save both turns of the exchange in one write
+            with self.storage.batch():
+                self.save_message("user", f"Analyzed lecture: {lecture_name}\nQuestion: {question}", lecture_name)
+                self.save_message("assistant", response['message']['content'], lecture_name)
             
             return response['message']['content']
             
@@ -1162,13 +4749,10 @@ Be thorough and detailed in your response.
         # Check estimated size
         total_estimated_size = 0
         for session_name in sessions:
-            session_path = os.path.join(self.lectures_dir, lecture_name, "sessions", f"{session_name}.json")
             try:
-                with open(session_path, 'r') as f:
-                    session_data = json.load(f)
-                    messages = session_data.get("messages", [])
-                    # Rough estimate: 1KB per message
-                    total_estimated_size += len(messages) * 1024
+                session_stats = self.storage.get_session_stats(lecture_name, session_name)
+                # Rough estimate: 1KB per message
+                total_estimated_size += session_stats["message_count"] * 1024
             except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError, PermissionError):
                 continue
         
@@ -1181,16 +4765,15 @@ Be thorough and detailed in your response.
         
         # Create merged session
         merged_session_name = f"MergedSess-{lecture_name}"
-        sessions_path = os.path.join(self.lectures_dir, lecture_name, "sessions")
-        merged_session_path = os.path.join(sessions_path, f"{merged_session_name}.json")
+        merged_session_path = self.storage.session_location(lecture_name, merged_session_name)
         
         # Check if already exists
-        if os.path.exists(merged_session_path):
+        if self.repository.session_exists(lecture_name, merged_session_name):
             # Remove existing merged session if user confirms
             confirm = input(f"Merged session '{merged_session_name}' already exists. Overwrite? (y/n): ")
             if confirm.lower() != 'y':
                 return "Merge cancelled"
-            os.remove(merged_session_path)
+            self.storage.delete_session(lecture_name, merged_session_name)
         
         # Initialize merged session data
         merged_session_data = {
@@ -1222,40 +4805,37 @@ Be thorough and detailed in your response.
             print(f"Processing batch {i//batch_size + 1}/{(len(sessions) + batch_size - 1)//batch_size}...")
             
             for session_name in batch_sessions:
-                session_path = os.path.join(self.lectures_dir, lecture_name, "sessions", f"{session_name}.json")
                 try:
-                    with open(session_path, 'r') as f:
-                        session_data = json.load(f)
-                        messages = session_data.get("messages", [])
+                    messages = self.read_session_messages(lecture_name, session_name)
+                    
+                    if messages:
+                        # Add session header
+                        merged_session_data["messages"].append({
+                            "role": "system",
+                            "content": f"=== Session: {session_name} ===",
+                            "timestamp": datetime.now().isoformat()
+                        })
+                        
+                        # Add all messages from this session
+                        merged_session_data["messages"].extend(messages)
+                        total_messages += len(messages)
+                        
+                        # Add session footer
+                        merged_session_data["messages"].append({
+                            "role": "system",
+                            "content": f"=== End of Session: {session_name} ===",
+                            "timestamp": datetime.now().isoformat()
+                        })
+                        
+                        # Collect lecture references
+                        for msg in messages:
+                            if msg.get("role") in ["user", "assistant"]:
+                                ref = msg.get("lecture_ref")
+                                if ref:
+                                    lecture_refs.add(ref)
+                        
+                        print(f"  - Processed session '{session_name}' ({len(messages)} messages)")
                         
-                        if messages:
-                            # Add session header
-                            merged_session_data["messages"].append({
-                                "role": "system",
-                                "content": f"=== Session: {session_name} ===",
-                                "timestamp": datetime.now().isoformat()
-                            })
-                            
-                            # Add all messages from this session
-                            merged_session_data["messages"].extend(messages)
-                            total_messages += len(messages)
-                            
-                            # Add session footer
-                            merged_session_data["messages"].append({
-                                "role": "system",
-                                "content": f"=== End of Session: {session_name} ===",
-                                "timestamp": datetime.now().isoformat()
-                            })
-                            
-                            # Collect lecture references
-                            for msg in messages:
-                                if msg.get("role") in ["user", "assistant"]:
-                                    ref = msg.get("lecture_ref")
-                                    if ref:
-                                        lecture_refs.add(ref)
-                            
-                            print(f"  - Processed session '{session_name}' ({len(messages)} messages)")
-                            
                 except Exception as e:
                     print(f"  - Error processing session '{session_name}': {e}")
                     continue
@@ -1264,13 +4844,18 @@ Be thorough and detailed in your response.
             merged_session_data["merge_info"]["total_messages"] = total_messages
             merged_session_data["lectures_referenced"] = list(lecture_refs)
             
-            with open(merged_session_path, 'w') as f:
-                json.dump(merged_session_data, f, indent=2)
+            # Each distinct model setting is stored once in the merged session's param_sets
+            messages = intern_messages(merged_session_data, merged_session_data.pop("messages"))
+            if i == 0:
+                merged_session_data["messages"] = messages
+                self.storage.create_session(lecture_name, merged_session_name, merged_session_data)
+            else:
+                # Later batches are appended so earlier batches are kept
+                self.repository.save_session(lecture_name, merged_session_name, merged_session_data)
+                self.storage.append_messages(lecture_name, merged_session_name, messages)
             
             # Free memory by clearing messages for the next batch
-            if i + batch_size < len(sessions):
-                merged_session_data["messages"] = []
-                lecture_refs = set()
+            merged_session_data["messages"] = []
         
         # Update lecture's session list
         self.update_lecture_sessions(lecture_name)
@@ -1288,18 +4873,15 @@ Be thorough and detailed in your response.
             
             # First, merge all sessions if not already merged
             merged_session_name = f"MergedSess-{self.current_lecture}"
-            sessions_path = os.path.join(self.lectures_dir, self.current_lecture, "sessions")
-            merged_path = os.path.join(sessions_path, f"{merged_session_name}.json")
             
-            if not os.path.exists(merged_path):
+            if not self.repository.session_exists(self.current_lecture, merged_session_name):
                 merge_result = self.merge_all_sessions()
                 print(merge_result)
             
             # Load merged session
-            if os.path.exists(merged_path):
-                with open(merged_path, 'r') as f:
-                    merged_data = json.load(f)
-                    context = "\n".join([msg.get("content", "") for msg in merged_data.get("messages", [])])
+            if self.repository.session_exists(self.current_lecture, merged_session_name):
+                merged_messages = self.storage.read_messages(self.current_lecture, merged_session_name)
+                context = "\n".join([msg.get("content", "") for msg in merged_messages])
             else:
                 return "Failed to create merged session"
             
@@ -1340,16 +4922,11 @@ Format each question clearly and provide a brief explanation of what the questio
                     return "Invalid input"
             
             # Load specific session
-            lecture_path = os.path.join(self.lectures_dir, self.current_lecture)
-            sessions_path = os.path.join(lecture_path, "sessions")
-            session_path = os.path.join(sessions_path, f"{session_name}.json")
-            
-            if not os.path.exists(session_path):
+            if not self.repository.session_exists(self.current_lecture, session_name):
                 return f"Session not found: {session_name}"
             
-            with open(session_path, 'r') as f:
-                session_data = json.load(f)
-                context = "\n".join([msg.get("content", "") for msg in session_data.get("messages", [])])
+            session_messages = self.read_session_messages(self.current_lecture, session_name)
+            context = "\n".join([msg.get("content", "") for msg in session_messages])
             
             prompt = f"""
 Based on the following session content, generate 3-5 focused questions that would help a student review and test their understanding of the specific topics discussed in this session.
@@ -1375,9 +4952,10 @@ Format each question clearly and provide a brief explanation of what the questio
                 options=self.model_params
             )
             
-            # Save to session
-            self.save_message("user", f"Generated questions from {scope} scope", self.current_lecture)
-            self.save_message("assistant", response['message']['content'], self.current_lecture)
+            # Save both turns of the exchange in one write
+            with self.storage.batch():
+                self.save_message("user", f"Generated questions from {scope} scope", self.current_lecture)
+                self.save_message("assistant", response['message']['content'], self.current_lecture)
             
             return response['message']['content']
             
@@ -1418,9 +4996,10 @@ Format each question clearly and provide a brief explanation of what the questio
                 options=self.model_params
             )
             
-            # Save to session
-            self.save_message("user", message)
-            self.save_message("assistant", response['message']['content'])
+            # Save both turns of the exchange in one write
+            with self.storage.batch():
+                self.save_message("user", message)
+                self.save_message("assistant", response['message']['content'])
             
             return response['message']['content']
             
@@ -1446,7 +5025,8 @@ def print_status(status):
     # Print cache statistics
     cache_stats = status.get("cache_stats", {})
     print(f"Cache Files: {cache_stats.get('cache_files', 0)}")
-    print(f"Cache Size: {cache_stats.get('cache_size_mb', 0)} MB")
+    print(f"Cache Size: {cache_stats.get('cache_size_mb', 0)} MB of {cache_stats.get('cache_limit_mb', 0)} MB")
+    print(f"Cache Hits/Misses: {cache_stats.get('hits', 0)}/{cache_stats.get('misses', 0)}")
     print()
     
     for lecture_name, lecture_data in status['lectures'].items():
@@ -1467,8 +5047,8 @@ def print_status(status):
                 print(f"      Tokens: {session_data['estimated_tokens']}")
                 print(f"      Documents: {', '.join(session_data['documents']) if session_data['documents'] else 'None'}")
                 print(f"      File: {session_data['file_path']}")
-                if session_data['summaries']:
-                    print(f"      Summaries: {len(session_data['summaries'])}")
+                if session_data['summary_count']:
+                    print(f"      Summaries: {session_data['summary_count']}")
                 if session_data['lectures_referenced']:
                     print(f"      References: {', '.join(session_data['lectures_referenced'])}")
         
@@ -1513,10 +5093,18 @@ class CommandHandler:
             'list-sessions': self._handle_list_sessions,
             'use-session': self._handle_use_session,
             'merge-sessions': self._handle_merge_sessions,
+            'fork-session': self._handle_fork_session,
             'generate-questions': self._handle_generate_questions,
             'analyze': self._handle_analyze,
             'status': self._handle_status,
             'clear-cache': self._handle_clear_cache,
+            'migrate-storage': self._handle_migrate_storage,
+            'migrate-layout': self._handle_migrate_layout,
+            'convert-sessions': self._handle_convert_sessions,
+            'archive': self._handle_archive,
+            'gc': self._handle_gc,
+            'ingest-status': self._handle_ingest_status,
+            'compact-session': self._handle_compact_session,
             'set-param': self._handle_set_param,
             'list-params': self._handle_list_params,
             'list-summaries': self._handle_list_summaries,
@@ -1627,6 +5215,21 @@ class CommandHandler:
             return "No lecture selected"
         return self.assistant.merge_all_sessions()
 
+    def _handle_fork_session(self, args):
+        """Handle fork-session command"""
+        if not self.assistant.current_session:
+            return "No session selected. Use 'use-session <name>' first."
+
+        parts = args.split()
+        if not parts or len(parts) > 2:
+            return "Usage: fork-session <name> [at-index]"
+        try:
+            at_index = int(parts[1]) if len(parts) > 1 else None
+        except ValueError:
+            return "Usage: fork-session <name> [at-index]"
+
+        return self.assistant.fork_session(parts[0], at_index)
+
     def _handle_generate_questions(self, args):
         """Handle generate-questions command"""
         if not self.assistant.current_lecture:
@@ -1669,6 +5272,99 @@ class CommandHandler:
         """Handle clear-cache command"""
         return self.assistant.clear_cache()
 
+    def _handle_migrate_storage(self, args):
+        """Handle migrate-storage command"""
+        backend = args.strip() or SQLiteStorageBackend.name
+        if backend not in STORAGE_BACKENDS:
+            return f"Unknown storage backend. Available: {', '.join(STORAGE_BACKENDS)}"
+        if backend == self.assistant.storage.name:
+            return f"Already using {backend} storage"
+
+        print(f"Migrating {self.assistant.storage.name} storage to {backend}...")
+        return self.assistant.migrate_storage(backend)
+
+    def _handle_migrate_layout(self, args):
+        """Handle migrate-layout command"""
+        layout = args.strip()
+        if layout not in STORAGE_LAYOUTS:
+            return f"Usage: migrate-layout <{'|'.join(STORAGE_LAYOUTS)}>"
+
+        print(f"Moving lectures and sessions to the {layout} layout...")
+        return self.assistant.migrate_layout(layout)
+
+    def _handle_convert_sessions(self, args):
+        """Handle convert-sessions command"""
+        parts = args.split()
+        if not parts or parts[0] not in SESSION_FORMATS:
+            return f"Usage: convert-sessions <{'|'.join(SESSION_FORMATS)}> [lecture]"
+
+        lecture_name = parts[1] if len(parts) > 1 else None
+        if lecture_name and not self.assistant.repository.lecture_exists(lecture_name):
+            return f"Lecture '{lecture_name}' not found"
+
+        return self.assistant.convert_sessions(parts[0], lecture_name)
+
+    def _handle_archive(self, args):
+        """Handle archive command"""
+        try:
+            days = float(args) if args.strip() else ARCHIVE_AFTER_DAYS
+        except ValueError:
+            return "Usage: archive [days]"
+
+        result = self.assistant.archive_inactive(days)
+        return (
+            f"Archived {result['sessions']} sessions and {result['cache_files']} cached extractions "
+            f"untouched for {days:g} days, saving {round(result['bytes_saved'] / (1024 * 1024), 2)} MB"
+        )
+
+    def _handle_gc(self, args):
+        """Handle gc command"""
+        if args.strip() not in ('', '--dry-run'):
+            return "Usage: gc [--dry-run]"
+
+        dry_run = args.strip() == '--dry-run'
+        report = self.assistant.collect_garbage(dry_run)
+        lines = [f"{'Would reclaim' if dry_run else 'Reclaimed'} {round(report['bytes'] / (1024 * 1024), 2)} MB:"]
+        for category in ("session_docs", "docs", "cache", "blobs", "temp"):
+            lines.append(f"  {category}: {len(report[category]['paths'])} items, "
+                         f"{round(report[category]['bytes'] / (1024 * 1024), 2)} MB")
+        if report["unreadable_sessions"]:
+            lines.append(f"  Kept all blobs and cached extractions: could not read "
+                         f"{', '.join(report['unreadable_sessions'])}")
+        return "\n".join(lines)
+
+    def _handle_ingest_status(self, args):
+        """Handle ingest-status command"""
+        if not self.assistant.current_lecture:
+            return "No lecture selected. Use 'use-lecture <name>' first."
+
+        lines = []
+        owners = [(f"Lecture '{self.assistant.current_lecture}'", None)]
+        if self.assistant.current_session:
+            owners.append((f"Session '{self.assistant.current_session}'", self.assistant.current_session))
+        for label, session_name in owners:
+            statuses = self.assistant.document_status(self.assistant.current_lecture, session_name)
+            lines.append(f"{label}: {len(statuses)} documents")
+            for doc_name, job in statuses.items():
+                error = f" ({job['error'][:80]})" if job["error"] else ""
+                lines.append(f"  {doc_name}: {job['status']}{error}")
+        return "\n".join(lines)
+
+    def _handle_compact_session(self, args):
+        """Handle compact-session command"""
+        if not self.assistant.current_session:
+            return "No session selected. Use 'use-session <name>' first."
+
+        try:
+            keep = int(args) if args.strip() else None
+        except ValueError:
+            return "Usage: compact-session [keep]"
+        if keep is not None and keep < 0:
+            return "Usage: compact-session [keep]"
+
+        print("Compacting session...")
+        return self.assistant.compact_session(keep)
+
     def _handle_set_param(self, args):
         """Handle set-param command"""
         parts = args.split(' ', 1)
@@ -1723,16 +5419,14 @@ class CommandHandler:
 
             # Update session data if active
             if self.assistant.current_lecture and self.assistant.current_session:
-                lecture_path = os.path.join(self.assistant.lectures_dir, self.assistant.current_lecture)
-                sessions_path = os.path.join(lecture_path, "sessions")
-                session_path = os.path.join(sessions_path, f"{self.assistant.current_session}.json")
+                lecture_name = self.assistant.current_lecture
+                session_name = self.assistant.current_session
 
                 try:
-                    with open(session_path, 'r') as f:
-                        session_data = json.load(f)
-                    session_data["model"] = model_name
-                    with open(session_path, 'w') as f:
-                        json.dump(session_data, f, indent=2)
+                    with self.assistant.storage.session_lock(lecture_name, session_name):
+                        session_data = self.assistant.repository.get_session(lecture_name, session_name)
+                        session_data["model"] = model_name
+                        self.assistant.repository.save_session(lecture_name, session_name, session_data)
                 except (FileNotFoundError, json.JSONDecodeError, PermissionError, OSError):
                     # Silently ignore if session update fails
                     pass
@@ -1753,10 +5447,18 @@ Commands:
   list-sessions          - List sessions in current lecture
   use-session <name>     - Select a session
   merge-sessions         - Merge all sessions in current lecture
+  fork-session <name> [at-index] - Branch the current session into <name>, keeping its first N messages (default: all)
   generate-questions     - Generate study questions
   analyze <question>     - Analyze current lecture
   status                 - Show detailed status
   clear-cache            - Clear document cache
+  migrate-storage [backend] - Copy all lectures/sessions into another storage backend (default: sqlite)
+  migrate-layout <layout> - Move lectures/sessions into the flat or sharded (hashed subdirectories) layout
+  convert-sessions <format> [lecture] - Rewrite sessions as json, log or compact (minified JSON)
+  archive [days]         - Gzip sessions and cached extractions untouched for N days (default: 30)
+  gc [--dry-run]         - Remove documents, session_docs folders, cached extractions and temp files nothing refers to
+  ingest-status          - Show background extraction status of the current lecture's and session's documents
+  compact-session [keep] - Summarize older messages into compressed history, keeping the last N active (default: 12)
   set-param <param> <value> - Set model parameter
   list-params            - List current model parameters
   list-summaries         - List conversation summaries
@@ -3,6 +3,9 @@ import { FontAwesomeIcon } from '@fortawesome/react-fontawesome';
 import { faBars, faBrain, faPaperPlane, faChevronDown, faTerminal, faTimes } from '@fortawesome/free-solid-svg-icons';
 import './MainContent.css';
 
+// Number of messages fetched when a session is opened and per "load older" click
+const MESSAGE_PAGE_SIZE = 50;
+
 const MainContent = ({
   isSidebarOpen,
   currentLecture,
@@ -14,6 +17,9 @@ const MainContent = ({
   onUpdateModel
 }) => {
   const [messages, setMessages] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [hasOlderMessages, setHasOlderMessages] = useState(false);
+  const [isLoadingOlder, setIsLoadingOlder] = useState(false);
   const [inputValue, setInputValue] = useState('');
   const [isLoading, setIsLoading] = useState(false);
   const [sessions, setSessions] = useState([]);
@@ -22,6 +28,7 @@ const MainContent = ({
   const [filteredCommands, setFilteredCommands] = useState([]);
   const [selectedCommandIndex, setSelectedCommandIndex] = useState(0);
   const messagesEndRef = useRef(null);
+  const skipScrollRef = useRef(false);
 
   // Available commands from lant.py
   const commands = [
@@ -53,6 +60,11 @@ const MainContent = ({
   };
 
   useEffect(() => {
+    // Keep the reading position when older messages are prepended
+    if (skipScrollRef.current) {
+      skipScrollRef.current = false;
+      return;
+    }
     scrollToBottom();
   }, [messages, isLoading]);
 
@@ -322,6 +334,7 @@ const MainContent = ({
       loadMessages();
     } else {
       setMessages([]);
+      setHasOlderMessages(false);
     }
   }, [currentLecture, currentSession]);
 
@@ -337,16 +350,46 @@ const MainContent = ({
     }
   };
 
+  const fetchMessagePage = async (before = null) => {
+    let url = `/api/sessions/${encodeURIComponent(currentLecture)}/${encodeURIComponent(currentSession)}/messages?limit=${MESSAGE_PAGE_SIZE}`;
+    if (before !== null) {
+      url += `&before=${before}`;
+    }
+    const response = await fetch(url);
+    return response.json();
+  };
+
   const loadMessages = async () => {
     try {
-      const response = await fetch(`/api/sessions/${encodeURIComponent(currentLecture)}/${encodeURIComponent(currentSession)}/messages`);
-      const result = await response.json();
+      const result = await fetchMessagePage();
       if (result.success) {
         setMessages(result.data.messages || []);
+        setNextCursor(result.data.next_cursor);
+        setHasOlderMessages(result.data.has_more);
       }
     } catch (error) {
       console.error('Failed to load messages:', error);
       setMessages([]);
+      setHasOlderMessages(false);
+    }
+  };
+
+  const loadOlderMessages = async () => {
+    if (!hasOlderMessages || isLoadingOlder) return;
+
+    setIsLoadingOlder(true);
+    try {
+      const result = await fetchMessagePage(nextCursor);
+      if (result.success) {
+        skipScrollRef.current = true;
+        setMessages(prev => [...(result.data.messages || []), ...prev]);
+        setNextCursor(result.data.next_cursor);
+        setHasOlderMessages(result.data.has_more);
+      }
+    } catch (error) {
+      console.error('Failed to load older messages:', error);
+    } finally {
+      setIsLoadingOlder(false);
     }
   };
 
@@ -379,6 +422,15 @@ const MainContent = ({
         {currentLecture && currentSession ? (
           <div className="chat-container">
             <div className="chat-messages">
+              {hasOlderMessages && (
+                <button
+                  className="load-older-btn"
+                  onClick={loadOlderMessages}
+                  disabled={isLoadingOlder}
+                >
+                  {isLoadingOlder ? 'Loading...' : 'Load older messages'}
+                </button>
+              )}
               {messages.length === 0 ? (
                 <div className="message assistant">
                   <div className="message-content">
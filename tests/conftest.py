@@ -0,0 +1,60 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lant  # noqa: E402
+
+
+BACKENDS = [
+    ("file", {"session_format": "json"}),
+    ("file", {"session_format": "log"}),
+    ("file", {"session_format": "compact"}),
+    ("sqlite", {}),
+]
+
+
+@pytest.fixture(params=BACKENDS, ids=["json", "log", "compact", "sqlite"])
+def backend_options(request):
+    """(backend name, file options) for every storage backend and session format"""
+    return request.param
+
+
+@pytest.fixture
+def storage(tmp_path, backend_options):
+    """A storage backend with lecture "L" and an empty session "s" """
+    backend, options = backend_options
+    storage = lant.create_storage_backend(backend, str(tmp_path), **options)
+    storage.create_lecture("L", {"name": "L", "documents": [], "sessions": []})
+    storage.create_session("L", "s", {"name": "s", "lecture": "L", "messages": [], "documents": []})
+    storage.flush()
+    return storage
+
+
+@pytest.fixture
+def assistant(tmp_path, monkeypatch):
+    """An assistant working in a fresh directory, with lecture "L" and session "s" selected"""
+    monkeypatch.chdir(tmp_path)
+    assistant = lant.SilentDirectoryAssistant()
+    assistant.create_lecture("L")
+    assistant.load_lecture("L")
+    assistant.create_session("s")
+    assistant.load_session("s")
+    yield assistant
+    assistant.storage.flush()
+
+
+@pytest.fixture
+def any_assistant(tmp_path, monkeypatch, backend_options):
+    """Like assistant, once for every storage backend and session format"""
+    backend, options = backend_options
+    monkeypatch.chdir(tmp_path)
+    assistant = lant.SilentDirectoryAssistant(storage_backend=backend, **options)
+    assistant.create_lecture("L")
+    assistant.load_lecture("L")
+    assistant.create_session("s")
+    assistant.load_session("s")
+    yield assistant
+    assistant.storage.flush()
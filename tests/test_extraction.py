@@ -0,0 +1,160 @@
+import os
+import time
+
+import pytest
+
+import lant
+
+
+reportlab = pytest.importorskip("reportlab")
+
+
+def make_pdf(path, pages):
+    from reportlab.pdfgen import canvas
+    pdf = canvas.Canvas(str(path))
+    for page in range(1, pages + 1):
+        pdf.drawString(100, 700, f"Page body number {page}")
+        pdf.showPage()
+    pdf.save()
+    return str(path)
+
+
+def test_cache_index_written_once_per_document(assistant, tmp_path, monkeypatch):
+    pdf_path = make_pdf(tmp_path / "big.pdf", 25)
+    writes = []
+    write_json_atomic = lant.write_json_atomic
+    monkeypatch.setattr(lant, "write_json_atomic", lambda path, *args, **kwargs: (
+        writes.append(path), write_json_atomic(path, *args, **kwargs)))
+
+    assistant.extract_pdf_text(pdf_path)
+    assert writes.count(assistant.extraction_cache.index_path) <= 2
+
+
+def test_cache_refuses_entries_over_budget(tmp_path):
+    cache = lant.ExtractionCache(str(tmp_path / "cache"), max_bytes=10)
+    assert not cache.put("big", "x" * 50)
+    assert cache.put("small", "y" * 5)
+    assert cache.get("small") == "y" * 5
+
+
+def make_pptx(path, slides):
+    from pptx import Presentation
+    presentation = Presentation()
+    for slide in range(1, slides + 1):
+        presentation.slides.add_slide(presentation.slide_layouts[5]).shapes.title.text = f"Slide title {slide}"
+    presentation.save(str(path))
+    return str(path)
+
+
+@pytest.mark.parametrize("kind", ["pdf", "pptx"])
+def test_uncached_document_parsed_once(assistant, tmp_path, monkeypatch, kind):
+    parses = []
+    if kind == "pdf":
+        path = make_pdf(tmp_path / "big.pdf", 25)
+        monkeypatch.setattr(lant.PyPDF2, "PdfReader", counting(lant.PyPDF2.PdfReader, parses))
+    else:
+        path = make_pptx(tmp_path / "deck.pptx", 25)
+        monkeypatch.setattr(lant, "Presentation", counting(lant.Presentation, parses))
+    assistant.pdf_workers = 1
+
+    chunks = list(assistant.iter_unit_chunks(path))
+    assert [chunk.index for chunk in chunks] == list(range(1, 26))
+    assert len(parses) == 1
+
+    # Everything is cached now, so the file is not parsed again
+    list(assistant.iter_unit_chunks(path))
+    assert len(parses) == 1
+
+
+def counting(function, calls):
+    def wrapper(*args, **kwargs):
+        calls.append(args)
+        return function(*args, **kwargs)
+    return wrapper
+
+
+def test_pdf_text_cached_once_per_page(assistant, tmp_path):
+    pdf_path = make_pdf(tmp_path / "big.pdf", 12)
+    text = assistant.extract_pdf_text(pdf_path)
+    assistant.flush()
+
+    key = assistant.get_file_hash(pdf_path)
+    names = sorted(name for name in os.listdir(assistant.cache_dir) if name.endswith(".txt"))
+    assert names == sorted([f"{key}.units.txt"] + [f"{key}.page{page}.txt" for page in range(1, 13)])
+    assert assistant.get_cached_text(pdf_path) == text
+    assert assistant.has_cached_text(pdf_path)
+    assert "".join(chunk.text for chunk in assistant.iter_document_chunks(pdf_path)) == text
+
+
+def wait_for_job(ingestion, path):
+    deadline = time.monotonic() + 10
+    while ingestion.status(path)["status"] in ("queued", "extracting") and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return ingestion.status(path)["status"]
+
+
+def test_ingestion_requeues_ready_document_after_eviction():
+    cached, extracted = set(), []
+
+    def extract(path):
+        extracted.append(path)
+        cached.add(path)
+        return "text"
+
+    ingestion = lant.IngestionQueue(extract, lambda path: path in cached, workers=1)
+    ingestion.enqueue("doc")
+    assert wait_for_job(ingestion, "doc") == "ready"
+    ingestion.enqueue("doc")
+    assert wait_for_job(ingestion, "doc") == "ready"
+    assert extracted == ["doc"]
+
+    cached.clear()
+    ingestion.enqueue("doc")
+    assert wait_for_job(ingestion, "doc") == "ready"
+    assert extracted == ["doc", "doc"]
+
+
+def test_unit_cache_keys(assistant, tmp_path, monkeypatch):
+    deck_path = make_pptx(tmp_path / "deck.pptx", 3)
+    content_hash = assistant.get_content_hash(deck_path)
+    assert assistant.unit_cache_key(deck_path, "slide", 2) == f"{content_hash}_v{lant.EXTRACTOR_VERSION}.slide2"
+    assert assistant.cached_text_keys(deck_path) is None
+
+    text = assistant.extract_ppt_text(deck_path)
+    assert "Slide title 3" in text
+    assert assistant.cached_text_keys(deck_path) == [
+        f"{content_hash}_v{lant.EXTRACTOR_VERSION}.slide{slide}" for slide in range(1, 4)
+    ]
+    assert assistant.has_cached_text(deck_path)
+
+    # A new extractor version stops matching the old entries
+    monkeypatch.setattr(lant, "EXTRACTOR_VERSION", lant.EXTRACTOR_VERSION + 1)
+    assert not assistant.has_cached_text(deck_path)
+
+
+def test_unit_cache_follows_document_content(assistant, tmp_path):
+    pdf_path = make_pdf(tmp_path / "doc.pdf", 4)
+    assert "Page body number 4" in assistant.extract_pdf_text(pdf_path)
+    old_keys = assistant.cached_text_keys(pdf_path)
+
+    make_pdf(tmp_path / "doc.pdf", 2)
+    os.utime(pdf_path, ns=(0, os.stat(pdf_path).st_mtime_ns + 10 ** 9))
+    assert assistant.cached_text_keys(pdf_path) is None
+    text = assistant.extract_pdf_text(pdf_path)
+    assert "Page body number 2" in text and "Page body number 4" not in text
+    assert len(assistant.cached_text_keys(pdf_path)) == 2
+    assert set(assistant.cached_text_keys(pdf_path)).isdisjoint(old_keys)
+
+
+def test_evicted_page_extracted_again(assistant, tmp_path, monkeypatch):
+    pdf_path = make_pdf(tmp_path / "doc.pdf", 5)
+    text = assistant.extract_pdf_text(pdf_path)
+    assistant.extraction_cache.remove(assistant.unit_cache_key(pdf_path, "page", 3) + ".txt")
+    assert not assistant.has_cached_text(pdf_path)
+
+    pages = []
+    monkeypatch.setattr(lant, "pdf_reader_pages", counting(lant.pdf_reader_pages, pages))
+    assistant.pdf_workers = 1
+    assert assistant.extract_pdf_text(pdf_path) == text
+    assert [(start, end) for _, start, end in pages] == [(2, 3)]
+    assert assistant.has_cached_text(pdf_path)
@@ -0,0 +1,140 @@
+import os
+
+import lant
+
+
+def contents(messages):
+    return [message["content"] for message in messages]
+
+
+def save_messages(assistant, count, prefix="m"):
+    for i in range(count):
+        assistant.save_message("user", f"{prefix}{i}")
+
+
+def test_fork_reads_parent_prefix(any_assistant):
+    save_messages(any_assistant, 5)
+    any_assistant.fork_session("f", at_index=3)
+    save_messages(any_assistant, 2, prefix="f")
+
+    assert any_assistant.current_session == "f"
+    assert any_assistant.count_session_messages("L", "f") == 5
+    assert contents(any_assistant.read_session_messages("L", "f")) == ["m0", "m1", "m2", "f0", "f1"]
+    assert contents(any_assistant.read_session_messages("L", "f", 2, 2)) == ["m2", "f0"]
+    # The fork stores only its own messages
+    assert contents(any_assistant.storage.read_messages("L", "f")) == ["f0", "f1"]
+    assert any_assistant.repository.get_session("L", "s")["forks"] == ["f"]
+
+
+def test_deleting_parent_materializes_fork(any_assistant):
+    save_messages(any_assistant, 4)
+    any_assistant.fork_session("f", at_index=2)
+    any_assistant.fork_session("g")
+    any_assistant.delete_session("s")
+
+    assert "parent" not in any_assistant.repository.get_session("L", "f")
+    assert contents(any_assistant.read_session_messages("L", "f")) == ["m0", "m1"]
+    assert any_assistant.repository.get_session("L", "g")["parent"]["session"] == "f"
+    assert contents(any_assistant.read_session_messages("L", "g")) == ["m0", "m1"]
+
+
+def test_compact_session(any_assistant, monkeypatch):
+    monkeypatch.setattr(any_assistant, "summarize_conversation", lambda messages: f"summary of {len(messages)}")
+    save_messages(any_assistant, 10)
+
+    assert any_assistant.compact_session(keep=4) == "Compacted 6 messages; 4 remain active"
+    session_data = any_assistant.repository.get_session("L", "s")
+    assert session_data["history_count"] == 6
+    assert session_data["history_summary"] == "summary of 6"
+    assert contents(any_assistant.get_session_history()) == [f"m{i}" for i in range(10)]
+
+    save_messages(any_assistant, 2, prefix="n")
+    # The previous summary is folded into the next one
+    assert any_assistant.compact_session(keep=4) == "Compacted 2 messages; 4 remain active"
+    assert any_assistant.repository.get_session("L", "s")["history_summary"] == "summary of 3"
+    assert any_assistant.compact_session(keep=4) == "Nothing to compact: session has 4 active messages"
+
+
+def test_compacting_fork_materializes_it(any_assistant, monkeypatch):
+    monkeypatch.setattr(any_assistant, "summarize_conversation", lambda messages: "summary")
+    save_messages(any_assistant, 4)
+    any_assistant.fork_session("f")
+    save_messages(any_assistant, 4, prefix="f")
+
+    any_assistant.compact_session(keep=2)
+    assert "parent" not in any_assistant.repository.get_session("L", "f")
+    assert any_assistant.repository.get_session("L", "s").get("forks") == []
+    assert contents(any_assistant.read_session_messages("L", "f")) == ["m0", "m1", "m2", "m3", "f0", "f1", "f2", "f3"]
+
+
+def add_document(assistant, tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text)
+    assistant.add_document_to_session(str(path))
+    return assistant.repository.get_session(assistant.current_lecture, assistant.current_session)["document_refs"][name]
+
+
+def test_blob_refcounts_follow_sessions(assistant, tmp_path):
+    blob_id = add_document(assistant, tmp_path, "notes.txt", "shared notes")
+    blob_path = assistant.blobs.blob_path(blob_id)
+    assistant.fork_session("f")
+    assistant.create_session("other")
+    assistant.load_session("other")
+    assert add_document(assistant, tmp_path, "notes.txt", "shared notes") == blob_id
+    assert assistant.blobs.read_index()[blob_id]["refs"] == 3
+
+    assistant.delete_session("f")
+    assistant.delete_session("s")
+    assert assistant.blobs.read_index()[blob_id]["refs"] == 1
+    assert os.path.exists(blob_path)
+
+    assistant.delete_session("other")
+    assert blob_id not in assistant.blobs.read_index()
+    assert not os.path.exists(blob_path)
+
+
+def test_gc_sweeps_only_unreferenced_blobs(assistant, tmp_path, monkeypatch):
+    monkeypatch.setattr(lant, "GC_GRACE_SECONDS", -60)
+    live_id = add_document(assistant, tmp_path, "live.txt", "live")
+    orphan = tmp_path / "orphan.txt"
+    orphan.write_text("orphan")
+    orphan_path = assistant.blobs.blob_path(assistant.blobs.add(str(orphan)))
+
+    report = assistant.collect_garbage(dry_run=True)
+    assert report["blobs"]["paths"] == [orphan_path]
+    assert os.path.exists(orphan_path)
+
+    report = assistant.collect_garbage()
+    assert report["blobs"]["paths"] == [orphan_path]
+    assert not os.path.exists(orphan_path)
+    assert os.path.exists(assistant.blobs.blob_path(live_id))
+
+
+def test_gc_keeps_archived_sessions_documents(assistant, tmp_path, monkeypatch):
+    monkeypatch.setattr(lant, "GC_GRACE_SECONDS", -60)
+    blob_id = add_document(assistant, tmp_path, "old.txt", "old notes")
+    # Drop the index's count so only the archived session refers to the blob
+    assistant.blobs.write_index({})
+    assistant.storage.flush()
+    assistant.storage.archive_session("L", "s")
+
+    report = assistant.collect_garbage()
+    assert report["blobs"]["paths"] == []
+    assert os.path.exists(assistant.blobs.blob_path(blob_id))
+    assert os.path.exists(assistant.storage.session_path("L", "s") + ".gz")
+
+
+def test_gc_leaves_everything_when_a_session_is_unreadable(assistant, tmp_path, monkeypatch):
+    monkeypatch.setattr(lant, "GC_GRACE_SECONDS", -60)
+    blob_id = add_document(assistant, tmp_path, "notes.txt", "notes")
+    assistant.blobs.write_index({})
+    assistant.storage.flush()
+    with open(assistant.storage.session_path("L", "s"), 'w') as f:
+        f.write("{not json")
+    assistant.repository.forget("L", "s")
+    assistant.storage.session_cache.clear()
+
+    report = assistant.collect_garbage()
+    assert report["unreadable_sessions"] == ["L/s"]
+    assert report["blobs"]["paths"] == [] and report["cache"]["paths"] == []
+    assert os.path.exists(assistant.blobs.blob_path(blob_id))
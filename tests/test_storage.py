@@ -0,0 +1,162 @@
+import multiprocessing
+import os
+
+import lant
+
+
+def append_worker(base_dir, backend, options, worker, count):
+    storage = lant.create_storage_backend(backend, base_dir, **options)
+    for i in range(count):
+        storage.append_messages("L", "s", [{"role": "user", "content": f"w{worker}-{i}", "timestamp": "t"}])
+    storage.flush()
+
+
+def test_append_messages_from_many_processes(tmp_path, storage, backend_options):
+    backend, options = backend_options
+    workers = [
+        multiprocessing.Process(target=append_worker, args=(str(tmp_path), backend, options, worker, 100))
+        for worker in range(4)
+    ]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+    assert all(process.exitcode == 0 for process in workers)
+
+    reader = lant.create_storage_backend(backend, str(tmp_path), **options)
+    contents = [message["content"] for message in reader.read_messages("L", "s")]
+    assert len(contents) == 400
+    assert set(contents) == {f"w{worker}-{i}" for worker in range(4) for i in range(100)}
+    assert reader.count_messages("L", "s") == 400
+
+
+def test_log_appends_do_not_rewrite_the_manifest(tmp_path, monkeypatch):
+    storage = lant.create_storage_backend("file", str(tmp_path), session_format="log")
+    storage.create_lecture("L", {"name": "L", "documents": [], "sessions": []})
+    for name in ("a", "s"):
+        storage.create_session("L", name, {"name": name, "lecture": "L", "messages": [], "documents": []})
+
+    writes = []
+    write_json_atomic = lant.write_json_atomic
+    monkeypatch.setattr(lant, "write_json_atomic", lambda path, *args, **kwargs: (
+        writes.append(path), write_json_atomic(path, *args, **kwargs)))
+    for i in range(10):
+        storage.append_messages("L", "s", [{"role": "user", "content": f"m{i}", "timestamp": "t"}])
+    assert storage.manifest_path("L") not in writes
+
+    reader = lant.create_storage_backend("file", str(tmp_path))
+    assert reader.read_manifest("L")["sessions"]["s"]["message_count"] == 10
+    assert reader.list_session_stats("L")["s"]["total_chars"] == 20
+
+    # A metadata change folds the pending counters into manifest.json
+    monkeypatch.undo()
+    reader.rename_session("L", "s", "t")
+    assert not os.path.exists(storage.manifest_updates_path("L"))
+    assert storage.read_manifest("L")["sessions"]["t"]["message_count"] == 10
+
+
+def test_delete_and_rename_remove_session_lock_files(tmp_path):
+    storage = lant.create_storage_backend("file", str(tmp_path), session_format="log")
+    storage.create_lecture("L", {"name": "L", "documents": [], "sessions": []})
+    for name in ("a", "b"):
+        storage.create_session("L", name, {"name": name, "lecture": "L", "messages": [], "documents": []})
+        storage.append_messages("L", name, [{"role": "user", "content": "hi", "timestamp": "t"}])
+
+    storage.rename_session("L", "a", "c")
+    storage.delete_session("L", "b")
+
+    sessions_dir = os.path.dirname(storage.session_path("L", "c"))
+    assert sorted(name for name in os.listdir(sessions_dir) if name.endswith(".lock")) == ["c.lock"]
+    assert storage.read_messages("L", "c")[0]["content"] == "hi"
+
+
+def test_migrate_layout_rewrites_stored_paths(assistant):
+    assistant.create_session("old")
+    assistant.storage.archive_session("L", "old")
+    assistant.migrate_layout("sharded")
+
+    storage = assistant.storage
+    lecture_info = storage.read_lecture("L")
+    assert lecture_info["directory_structure"] == {
+        "root": storage.lecture_dir("L"),
+        "sessions": storage.sessions_dir("L"),
+        "docs": storage.docs_dir("L"),
+    }
+    assert storage.read_session("L", "s")["file_path"] == storage.session_path("L", "s")
+    assert storage.read_session("L", "old")["file_path"] == storage.session_path("L", "old")
+
+
+def message(i):
+    return {"role": "user", "content": f"m{i}", "timestamp": "t"}
+
+
+def contents(messages):
+    return [message["content"] for message in messages]
+
+
+def test_read_messages_slices(tmp_path, storage, backend_options):
+    storage.append_messages("L", "s", [message(i) for i in range(10)])
+    storage.flush()
+
+    backend, options = backend_options
+    reader = lant.create_storage_backend(backend, str(tmp_path), **options)
+    assert reader.count_messages("L", "s") == 10
+    assert contents(reader.read_messages("L", "s", 3, 4)) == ["m4", "m5", "m6"]
+    assert contents(reader.read_messages("L", "s", None, 8)) == ["m8", "m9"]
+    assert contents(reader.read_messages("L", "s", 5, 9)) == ["m9"]
+    assert reader.read_messages("L", "s", 5, 10) == []
+
+
+def test_message_index_skips_torn_lines(tmp_path):
+    storage = lant.create_storage_backend("file", str(tmp_path), session_format="log")
+    storage.create_lecture("L", {"name": "L", "documents": [], "sessions": []})
+    storage.create_session("L", "s", {"name": "s", "lecture": "L", "messages": [], "documents": []})
+    storage.append_messages("L", "s", [message(i) for i in range(3)])
+    storage.flush()
+    session_path = storage.session_path("L", "s")
+
+    # An append interrupted halfway through its line
+    with open(storage.message_log_path(session_path), 'ab') as f:
+        f.write(b'{"role": "user", "cont')
+
+    writer = lant.create_storage_backend("file", str(tmp_path), session_format="log")
+    assert writer.count_messages("L", "s") == 3
+    writer.append_messages("L", "s", [message(3)])
+    writer.flush()
+
+    reader = lant.create_storage_backend("file", str(tmp_path), session_format="log")
+    assert reader.count_messages("L", "s") == 4
+    assert contents(reader.read_messages("L", "s", 2, 2)) == ["m2", "m3"]
+    assert contents(reader.read_messages("L", "s")) == ["m0", "m1", "m2", "m3"]
+
+
+def test_message_index_rebuilt_when_missing(tmp_path):
+    storage = lant.create_storage_backend("file", str(tmp_path), session_format="log")
+    storage.create_lecture("L", {"name": "L", "documents": [], "sessions": []})
+    storage.create_session("L", "s", {"name": "s", "lecture": "L", "messages": [], "documents": []})
+    storage.append_messages("L", "s", [message(i) for i in range(5)])
+    storage.flush()
+    os.remove(storage.message_index_path(storage.session_path("L", "s")))
+
+    reader = lant.create_storage_backend("file", str(tmp_path), session_format="log")
+    assert reader.count_messages("L", "s") == 5
+    assert contents(reader.read_messages("L", "s", 2, 3)) == ["m3", "m4"]
+
+
+def test_compacted_messages_stay_readable(tmp_path, storage, backend_options):
+    storage.append_messages("L", "s", [message(i) for i in range(10)])
+    storage.compact_session("L", "s", 4, {"summary": "first", "start_index": 0, "end_index": 3, "timestamp": "t"})
+    storage.append_messages("L", "s", [message(10)])
+    storage.compact_session("L", "s", 3, {"summary": "second", "start_index": 0, "end_index": 6, "timestamp": "t"})
+    storage.flush()
+
+    backend, options = backend_options
+    reader = lant.create_storage_backend(backend, str(tmp_path), **options)
+    session_data = reader.read_session("L", "s", include_messages=False)
+    assert session_data["history_count"] == 7
+    assert session_data["history_summary"] == "second"
+    assert reader.count_messages("L", "s") == 11
+    assert contents(reader.read_messages("L", "s")) == [f"m{i}" for i in range(11)]
+    # Slices across the two history segments and the active messages
+    assert contents(reader.read_messages("L", "s", 4, 2)) == ["m2", "m3", "m4", "m5"]
+    assert contents(reader.read_messages("L", "s", 3, 6)) == ["m6", "m7", "m8"]